@@ -1,11 +1,21 @@
+from django.utils.decorators import method_decorator
 from django.views.generic.base import TemplateView
 
+from core.decorators import versioned_condition
+
+
+def about_versions(request):
+    # Страницы статичны, от данных зависит только шапка.
+    return ['site']
+
 
 # Описать класс AboutAuthorView для страницы about/author
+@method_decorator(versioned_condition(about_versions), name='dispatch')
 class AboutAuthorView(TemplateView):
     template_name = 'about/author.html'
 
 
 # Описать класс AboutTechView для страницы about/tech
+@method_decorator(versioned_condition(about_versions), name='dispatch')
 class AboutTechView(TemplateView):
     template_name = 'about/tech.html'
@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+from core.pubsub import Event
+from posts import changelog
+from posts.models import Change, Comment, Post
+from posts.views import COMMENT_FIELDS as COMMENT_COLUMNS
+from .serializers import COMMENT_FIELDS, POST_FIELDS, dumps, serialize
+
+
+def author_channel(author_id):
+    """Новые посты автора — для ленты подписок."""
+    return f'author:{author_id}'
+
+
+def comments_channel(post_id):
+    """Новые комментарии к посту."""
+    return f'comments:{post_id}'
+
+
+class ChangeLogBackend:
+    """События из журнала изменений в общей базе.
+
+    Журнал и так пишется при сохранении постов и комментариев, поэтому
+    отдельной публикации не нужно: процессы сайта пишут в базу, а
+    SSE-сервер раз в EVENTS_POLL_INTERVAL забирает новые записи одним
+    запросом сразу для всех своих клиентов.
+
+    Курсор, как и в changelog.changes_since, не заходит за записи моложе
+    CHANGELOG_SAFETY_LAG: запись с меньшим id может закоммититься позже.
+    Свежие записи поэтому читаются повторно, повторы отбрасывает хаб.
+    """
+
+    def latest(self):
+        close_old_connections()
+        return changelog.latest_cursor()
+
+    def read(self, after, limit):
+        close_old_connections()
+        rows = list(Change.objects.filter(
+            pk__gt=after, action=Change.CREATED
+        ).order_by('pk')[:limit])
+        if not rows:
+            return [], after
+
+        def ids(kind):
+            return [row.object_id for row in rows if row.kind == kind]
+
+        posts = Post.objects.feed().in_bulk(ids(Change.POST))
+        comments = Comment.objects.select_related('author').only(
+            *COMMENT_COLUMNS
+        ).in_bulk(ids(Change.COMMENT))
+        events = []
+        for row in rows:
+            if row.kind == Change.POST:
+                post = posts.get(row.object_id)
+                if post is None:
+                    continue
+                data = serialize(post, POST_FIELDS, POST_FIELDS)
+                channel = author_channel(row.author_id)
+            else:
+                comment = comments.get(row.object_id)
+                if comment is None:
+                    continue
+                data = serialize(comment, COMMENT_FIELDS, COMMENT_FIELDS)
+                data['post'] = row.post_id
+                channel = comments_channel(row.post_id)
+            events.append(Event(row.pk, channel, row.kind, dumps(data)))
+        return events, changelog.settled_cursor(rows, after)
+
+
+def get_backend():
+    return import_string(settings.EVENTS_BACKEND)()
@@ -0,0 +1,72 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.events import get_backend
+from api.sse import EventStreamServer
+from core.pubsub import Hub, relay
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Потоки для запросов к базе при подключении клиентов и чтения событий.
+DB_THREADS = 4
+
+
+def raise_open_files_limit():
+    """Поднимает мягкий предел открытых файлов до жёсткого:
+    каждое соединение — дескриптор."""
+    if resource is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+class Command(BaseCommand):
+    help = (
+        'Запускает сервер server-sent events: новые посты из подписок '
+        'и новые комментарии к посту. Ставится за фронтендом по адресу '
+        'EVENTS_URL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument(
+            '--poll', type=float, default=settings.EVENTS_POLL_INTERVAL,
+            help='Как часто забирать новые события, секунд.',
+        )
+
+    def handle(self, *args, **options):
+        limit = raise_open_files_limit()
+        if limit is not None:
+            self.stdout.write(f'Предел открытых соединений: {limit}')
+        try:
+            asyncio.run(self.serve(options))
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self, options):
+        hub = Hub(
+            backlog=settings.EVENTS_BACKLOG,
+            queue_size=settings.EVENTS_QUEUE_SIZE,
+        )
+        executor = ThreadPoolExecutor(DB_THREADS)
+        server = EventStreamServer(hub, executor)
+        listener = await asyncio.start_server(
+            server.handle, options['host'], options['port'],
+            backlog=1024,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'События на http://{options["host"]}:{options["port"]}/events/'
+        ))
+        async with listener:
+            await relay(
+                hub, get_backend(), options['poll'], executor=executor
+            )
@@ -0,0 +1,116 @@
+import json
+
+from posts.thumbnails import FALLBACK_FORMAT, geometry
+from posts.uploads import CONTENT_TYPES
+
+# Поля ответа: имя -> функция, достающая значение из объекта.
+# Клиент может попросить только часть полей (?fields=id,text), тогда
+# остальные не вычисляются, а у постов ненужные колонки и связи не
+# загружаются (post_queryset).
+
+
+def _thumbnails(post):
+    """Основная миниатюра каждого размера (JPEG) и все её варианты."""
+    result = {}
+    for thumbnail in post.thumbnails.all():
+        entry = result.setdefault(thumbnail.alias, {'variants': []})
+        fields = {
+            'url': thumbnail.url,
+            'width': thumbnail.width,
+            'height': thumbnail.height,
+        }
+        entry['variants'].append(dict(
+            fields, type=CONTENT_TYPES[thumbnail.format]
+        ))
+        if (
+            thumbnail.format == FALLBACK_FORMAT
+            and thumbnail.width == geometry(thumbnail.alias)[0]
+        ):
+            entry.update(fields)
+    return result
+
+
+POST_FIELDS = {
+    'id': lambda post: post.pk,
+    'text': lambda post: post.text,
+    'pub_date': lambda post: post.pub_date.isoformat(),
+    'author': lambda post: post.author.username,
+    'author_name': lambda post: post.author.get_full_name(),
+    'group': lambda post: post.group.slug if post.group_id else None,
+    'image': lambda post: post.image.url if post.image else None,
+    'thumbnails': _thumbnails,
+    'image_placeholder': lambda post: post.image_placeholder or None,
+    'image_color': lambda post: post.image_color or None,
+}
+
+# Колонки поста для only(), которые читает каждое поле; связи
+# выводятся из них же. pub_date нужна ключу сортировки всегда.
+POST_COLUMNS = {
+    'id': (),
+    'text': ('text',),
+    'pub_date': (),
+    'author': ('author__username',),
+    'author_name': ('author__first_name', 'author__last_name'),
+    'group': ('group__slug',),
+    'image': ('image',),
+    'thumbnails': (),
+    'image_placeholder': ('image_placeholder',),
+    'image_color': ('image_color',),
+}
+
+POST_DETAIL_FIELDS = dict(
+    POST_FIELDS,
+    comments_count=lambda post: post.comments_count,
+)
+
+COMMENT_FIELDS = {
+    'id': lambda comment: comment.pk,
+    'author': lambda comment: comment.author.username,
+    'text': lambda comment: comment.text,
+    'created': lambda comment: comment.created.isoformat(),
+}
+
+GROUP_FIELDS = {
+    'slug': lambda group: group.slug,
+    'title': lambda group: group.title,
+    'description': lambda group: group.description,
+    'posts_count': lambda group: group.posts_count,
+}
+
+
+def pick_fields(available, requested):
+    """Поля из ?fields= в порядке схемы; ValueError на неизвестное."""
+    if not requested:
+        return list(available)
+    names = {name.strip() for name in requested.split(',') if name.strip()}
+    unknown = names - set(available)
+    if unknown:
+        raise ValueError(
+            'Неизвестные поля: {}'.format(', '.join(sorted(unknown)))
+        )
+    return [name for name in available if name in names]
+
+
+def post_queryset(queryset, fields):
+    """Посты ленты только с колонками и связями полей fields."""
+    columns = {'pub_date'}
+    for name in fields:
+        columns.update(POST_COLUMNS[name])
+    related = sorted({
+        column.split('__')[0] for column in columns if '__' in column
+    })
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if related:
+        queryset = queryset.select_related(*related)
+    if 'thumbnails' in fields:
+        queryset = queryset.prefetch_related('thumbnails')
+    return queryset.only(*columns)
+
+
+def serialize(obj, available, fields):
+    return {name: available[name](obj) for name in fields}
+
+
+def dumps(data):
+    """Компактный JSON: без пробелов и \\u-экранирования кириллицы."""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
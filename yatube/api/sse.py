@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import re
+from http.cookies import CookieError, SimpleCookie
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections
+from django.http import HttpRequest
+
+from posts.models import Follow, Post
+from .events import author_channel, comments_channel
+
+logger = logging.getLogger(__name__)
+
+FOLLOW_PATH = re.compile(r'^/events/follow/$')
+COMMENTS_PATH = re.compile(r'^/events/posts/(?P<post_id>\d+)/comments/$')
+# Сколько ждать заголовков запроса, прежде чем закрыть соединение.
+HEADERS_TIMEOUT = 10
+MAX_HEADERS = 100
+# Пустой комментарий раз в столько секунд держит соединение открытым
+# через прокси и выявляет ушедших клиентов.
+HEARTBEAT = 15
+# Через столько миллисекунд браузер переподключается после обрыва.
+RETRY = 3000
+REASONS = {
+    400: 'Bad Request',
+    401: 'Unauthorized',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def format_event(event):
+    return (
+        f'id: {event.id}\nevent: {event.name}\ndata: {event.data}\n\n'
+    ).encode()
+
+
+def user_from_cookies(header):
+    """Пользователь по cookie сессии сайта."""
+    close_old_connections()
+    cookies = SimpleCookie()
+    try:
+        cookies.load(header)
+    except CookieError:
+        pass
+    morsel = cookies.get(settings.SESSION_COOKIE_NAME)
+    request = HttpRequest()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore(
+        morsel.value if morsel else None
+    )
+    return get_user(request)
+
+
+def follow_channels(header):
+    """Каналы авторов, на которых подписан владелец сессии."""
+    user = user_from_cookies(header)
+    if not user.is_authenticated:
+        return None
+    return [
+        author_channel(author_id) for author_id in Follow.objects.filter(
+            user=user
+        ).values_list('author_id', flat=True)
+    ]
+
+
+def comments_channels(post_id):
+    close_old_connections()
+    if not Post.objects.filter(pk=post_id).exists():
+        return None
+    return [comments_channel(post_id)]
+
+
+class EventStreamServer:
+    """HTTP-сервер потоков server-sent events на asyncio.
+
+    Каждый клиент — корутина, которая ждёт свою очередь в хабе, поэтому
+    один процесс держит тысячи простаивающих соединений. В базу ходят
+    только при подключении (сессия, подписки) — в пуле потоков.
+
+    ``/events/follow/`` — новые посты авторов из подписок (нужна сессия
+    сайта), ``/events/posts/<id>/comments/`` — новые комментарии к посту.
+    """
+
+    def __init__(self, hub, executor=None):
+        self.hub = hub
+        self.executor = executor
+        self.clients = 0
+
+    async def run_sync(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def handle(self, reader, writer):
+        try:
+            method, path, headers = await asyncio.wait_for(
+                self.read_request(reader), HEADERS_TIMEOUT
+            )
+            channels = await self.route(method, path, headers)
+            if isinstance(channels, int):
+                await self.respond(writer, channels)
+            else:
+                await self.stream(writer, channels, headers)
+        except (BadRequest, UnicodeDecodeError, ValueError):
+            await self.respond(writer, 400)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception:
+            logger.exception('Ошибка потока событий')
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        line = (await reader.readline()).decode('latin-1')
+        parts = line.split()
+        if len(parts) != 3:
+            raise BadRequest
+        method, target, _ = parts
+        headers = {}
+        for _ in range(MAX_HEADERS):
+            line = (await reader.readline()).decode('latin-1')
+            if line in ('\r\n', '\n', ''):
+                return method, target.split('?', 1)[0], headers
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        raise BadRequest
+
+    async def route(self, method, path, headers):
+        """Каналы для адреса или код ошибки."""
+        if method != 'GET':
+            return 405
+        if FOLLOW_PATH.match(path):
+            channels = await self.run_sync(
+                follow_channels, headers.get('cookie', '')
+            )
+            error = 401
+        else:
+            match = COMMENTS_PATH.match(path)
+            if match is None:
+                return 404
+            channels = await self.run_sync(
+                comments_channels, int(match['post_id'])
+            )
+            error = 404
+        if channels is None:
+            return error
+        return channels
+
+    async def respond(self, writer, status):
+        reason = REASONS[status]
+        writer.write(
+            f'HTTP/1.1 {status} {reason}\r\nContent-Type: text/plain; '
+            f'charset=utf-8\r\nContent-Length: {len(reason)}\r\n'
+            f'Connection: close\r\n\r\n{reason}'.encode()
+        )
+        await writer.drain()
+
+    async def stream(self, writer, channels, headers):
+        subscription = self.hub.subscribe(channels)
+        self.clients += 1
+        try:
+            writer.write(
+                b'HTTP/1.1 200 OK\r\n'
+                b'Content-Type: text/event-stream; charset=utf-8\r\n'
+                b'Cache-Control: no-cache\r\n'
+                b'X-Accel-Buffering: no\r\n'
+                b'Connection: close\r\n\r\n'
+                + f'retry: {RETRY}\n\n'.encode()
+            )
+            # Пока шло дочитывание, те же события могли попасть и в
+            # очередь. Сравнивать id нельзя: хаб рассылает событие с
+            # меньшим id и после большего.
+            replayed = await self.catch_up(
+                writer, subscription, headers.get('last-event-id')
+            )
+            while not subscription.overflowed:
+                event = await subscription.get(HEARTBEAT)
+                if event is None:
+                    writer.write(b': ping\n\n')
+                elif event.id not in replayed:
+                    writer.write(format_event(event))
+                await writer.drain()
+        finally:
+            self.clients -= 1
+            subscription.close()
+
+    async def catch_up(self, writer, subscription, last_event_id):
+        """Пропущенное после Last-Event-ID из буфера хаба; возвращает
+        id отправленных событий.
+
+        Если буфер уже не помнит нужных событий, клиент получает reset
+        и перечитывает страницу.
+        """
+        if not last_event_id or not last_event_id.isdigit():
+            return set()
+        missed = self.hub.replay(int(last_event_id), subscription.channels)
+        if missed is None:
+            writer.write(b'event: reset\ndata: {}\n\n')
+            return set()
+        for event in missed:
+            writer.write(format_event(event))
+        await writer.drain()
+        return {event.id for event in missed}
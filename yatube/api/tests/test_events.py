@@ -0,0 +1,224 @@
+import asyncio
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import (
+    Client, SimpleTestCase, TransactionTestCase, override_settings
+)
+from django.utils import timezone
+
+from core.pubsub import Event, Hub, relay
+from posts.models import Change, Comment, Follow, Post
+from ..events import ChangeLogBackend, author_channel, comments_channel
+from ..sse import EventStreamServer
+
+User = get_user_model()
+
+
+class HubTest(SimpleTestCase):
+    def test_publish_to_subscribed_channels(self):
+        async def scenario():
+            hub = Hub()
+            first = hub.subscribe(['a'])
+            second = hub.subscribe(['b'])
+            hub.publish(Event(1, 'a', 'post', '{}'))
+            self.assertEqual((await first.get(1)).id, 1)
+            self.assertIsNone(await second.get(0.01))
+            first.close()
+            second.close()
+            self.assertEqual(dict(hub.channels), {})
+
+        asyncio.run(scenario())
+
+    def test_replay_and_overflow(self):
+        async def scenario():
+            hub = Hub(backlog=2, queue_size=1)
+            subscription = hub.subscribe(['a'])
+            for number in range(1, 4):
+                hub.publish(Event(number, 'a', 'post', '{}'))
+            self.assertTrue(subscription.overflowed)
+            self.assertEqual(
+                [event.id for event in hub.replay(2, {'a'})], [3]
+            )
+            # Событие 1 вытеснено из буфера.
+            self.assertIsNone(hub.replay(0, {'a'}))
+
+        asyncio.run(scenario())
+
+    def test_late_lower_id_published_once(self):
+        """Событие с меньшим id, ставшее видным позже, рассылается; уже
+        разосланные при повторном чтении не дублируются."""
+        first = Event(1, 'a', 'post', '{}')
+        second = Event(2, 'a', 'post', '{}')
+
+        class Backend:
+            # Пока событие 1 не видно, курсор стоит на месте.
+            reads = [([second], 0), ([first, second], 0)]
+
+            def latest(self):
+                return 0
+
+            def read(self, after, limit):
+                if self.reads:
+                    return self.reads.pop(0)
+                return [], 2
+
+        async def scenario():
+            hub = Hub()
+            subscription = hub.subscribe(['a'])
+            backend = Backend()
+            task = asyncio.create_task(relay(hub, backend, 0.01))
+            received = [await subscription.get(1), await subscription.get(1)]
+            while backend.reads or hub.published:
+                await asyncio.sleep(0.01)
+            self.assertIsNone(await subscription.get(0.05))
+            task.cancel()
+            self.assertEqual(received, [second, first])
+            self.assertEqual(hub.replay(2, {'a'}), [first])
+
+        asyncio.run(scenario())
+
+
+@override_settings(CHANGELOG_SAFETY_LAG=0)
+class EventStreamTest(TransactionTestCase):
+    """Сервер событий поверх журнала изменений.
+
+    Потоки сервера ходят в базу своими соединениями, поэтому данные
+    должны быть закоммичены.
+    """
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.post = Post.objects.create(author=self.author, text='Пост')
+        self.backend = ChangeLogBackend()
+
+    def test_backend_reads_created_objects(self):
+        cursor = self.backend.latest()
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        post.text = 'Исправленный пост'
+        post.save()
+        comment = Comment.objects.create(
+            author=self.reader, post=self.post, text='Комментарий'
+        )
+        events, new_cursor = self.backend.read(cursor, 100)
+        self.assertEqual(
+            [(event.channel, event.name) for event in events],
+            [
+                (author_channel(self.author.pk), 'post'),
+                (comments_channel(self.post.pk), 'comment'),
+            ]
+        )
+        self.assertEqual(json.loads(events[0].data)['id'], post.pk)
+        self.assertEqual(json.loads(events[1].data)['id'], comment.pk)
+        self.assertEqual(self.backend.read(new_cursor, 100), ([], new_cursor))
+
+    @override_settings(CHANGELOG_SAFETY_LAG=60)
+    def test_backend_cursor_waits_for_late_commits(self):
+        cursor = self.backend.latest()
+        early = Post.objects.create(author=self.author, text='Ранний пост')
+        late = Post.objects.create(author=self.author, text='Поздний пост')
+        # Запись о раннем посте ещё не закоммичена.
+        change = Change.objects.get(object_id=early.pk, kind=Change.POST)
+        Change.objects.filter(pk=change.pk).delete()
+        events, new_cursor = self.backend.read(cursor, 100)
+        self.assertEqual(
+            [json.loads(event.data)['id'] for event in events], [late.pk]
+        )
+        self.assertEqual(new_cursor, cursor)
+        change.save()
+        events, new_cursor = self.backend.read(new_cursor, 100)
+        self.assertEqual(
+            [json.loads(event.data)['id'] for event in events],
+            [early.pk, late.pk]
+        )
+        Change.objects.update(created=timezone.now() - timedelta(minutes=2))
+        events, new_cursor = self.backend.read(new_cursor, 100)
+        self.assertEqual(new_cursor, events[-1].id)
+
+    def request(self, path, headers='', write=None):
+        """Статус ответа и первое событие после записи write().
+
+        Новые записи журнала переносятся в хаб так же, как это делает
+        relay, только один раз и после подключения клиента.
+        """
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            hub = Hub()
+            hub.floor = self.backend.latest()
+            server = EventStreamServer(hub)
+            listener = await asyncio.start_server(
+                server.handle, '127.0.0.1', 0
+            )
+            port = listener.sockets[0].getsockname()[1]
+            async with listener:
+                reader, writer = await asyncio.open_connection(
+                    '127.0.0.1', port
+                )
+                writer.write(
+                    f'GET {path} HTTP/1.1\r\n{headers}\r\n'.encode()
+                )
+                status = int((await reader.readline()).split()[1])
+                event = None
+                if status == 200:
+                    await reader.readuntil(b'\r\n\r\n')
+                    while not hub.channels:
+                        await asyncio.sleep(0.01)
+                    await loop.run_in_executor(None, write)
+                    events, _ = await loop.run_in_executor(
+                        None, self.backend.read, hub.floor, 100
+                    )
+                    for item in events:
+                        hub.publish(item)
+                    await reader.readuntil(b'\n\n')  # retry
+                    event = await asyncio.wait_for(
+                        reader.readuntil(b'\n\n'), 5
+                    )
+                writer.close()
+                return status, event
+
+        return asyncio.run(scenario())
+
+    def test_comments_stream(self):
+        def write():
+            Comment.objects.create(
+                author=self.reader, post=self.post, text='Комментарий'
+            )
+
+        status, event = self.request(
+            f'/events/posts/{self.post.pk}/comments/', write=write
+        )
+        self.assertEqual(status, 200)
+        lines = event.decode().splitlines()
+        self.assertEqual(lines[1], 'event: comment')
+        data = json.loads(lines[2][len('data: '):])
+        self.assertEqual(data['text'], 'Комментарий')
+        self.assertEqual(data['post'], self.post.pk)
+
+    def test_follow_stream_needs_session(self):
+        status, _ = self.request('/events/follow/')
+        self.assertEqual(status, 401)
+
+        client = Client()
+        client.force_login(self.reader)
+        session = client.cookies[settings.SESSION_COOKIE_NAME].value
+        other = User.objects.create_user(username='other')
+
+        def write():
+            Post.objects.create(author=other, text='Чужой пост')
+            Post.objects.create(author=self.author, text='Новый пост')
+
+        status, event = self.request(
+            '/events/follow/',
+            f'Cookie: {settings.SESSION_COOKIE_NAME}={session}\r\n',
+            write,
+        )
+        self.assertEqual(status, 200)
+        self.assertIn('Новый пост', event.decode())
+
+    def test_unknown_paths(self):
+        self.assertEqual(self.request('/events/unknown/')[0], 404)
+        self.assertEqual(self.request('/events/posts/0/comments/')[0], 404)
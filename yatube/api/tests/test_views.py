@@ -0,0 +1,286 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.paginator import CursorPaginator
+from posts.models import Change, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+def read(response):
+    if response.streaming:
+        return json.loads(b''.join(response.streaming_content))
+    return json.loads(response.content)
+
+
+class ApiViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост {number}'
+            )
+            for number in range(5)
+        ]
+        Comment.objects.create(
+            author=cls.reader, post=cls.posts[0], text='Комментарий'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_lists(self):
+        """Списки отдают посты, группы и комментарии."""
+        post_id = self.posts[0].pk
+        cases = {
+            reverse('api:posts'): 5,
+            reverse('api:groups'): 1,
+            reverse('api:group_posts', kwargs={'slug': 'group'}): 5,
+            reverse('api:profile_posts', kwargs={'username': 'author'}): 5,
+            reverse('api:post_comments', kwargs={'post_id': post_id}): 1,
+        }
+        for url, count in cases.items():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                data = read(response)
+                self.assertEqual(len(data['results']), count)
+                self.assertIsNone(data['next'])
+
+    def test_cursor_walks_whole_feed(self):
+        """Страницы по курсору идут без пропусков и повторов."""
+        url = reverse('api:posts') + '?limit=2&fields=id'
+        ids = []
+        while url:
+            data = read(self.client.get(url))
+            ids.extend(item['id'] for item in data['results'])
+            url = data['next']
+        self.assertEqual(ids, [post.pk for post in reversed(self.posts)])
+
+    def test_sparse_fields(self):
+        """?fields= оставляет только перечисленные поля."""
+        data = read(self.client.get(
+            reverse('api:posts') + '?fields=text,id&limit=1'
+        ))
+        self.assertEqual(
+            data['results'], [{'id': self.posts[-1].pk, 'text': 'Пост 4'}]
+        )
+
+    def test_sparse_fields_load_only_needed_columns(self):
+        """Без автора, группы и миниатюр в ?fields= связи не загружаются."""
+        with CaptureQueriesContext(connection) as queries:
+            read(self.client.get(reverse('api:posts') + '?fields=id,text'))
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('posts_thumbnail', sql)
+        self.assertNotIn('image_placeholder', sql)
+        self.client.force_login(self.reader)
+        data = read(self.client.get(
+            reverse('api:follow_posts') + '?fields=author,group&limit=1'
+        ))
+        self.assertEqual(
+            data['results'], [{'author': 'author', 'group': 'group'}]
+        )
+
+    def test_list_queries_run_before_response(self):
+        """Ошибка базы — исключение до ответа, а не обрезанный JSON."""
+        with mock.patch.object(
+            CursorPaginator, 'fetch', side_effect=DatabaseError
+        ):
+            with self.assertRaises(DatabaseError):
+                self.client.get(reverse('api:posts'))
+
+    def test_detail(self):
+        post = self.posts[0]
+        data = read(self.client.get(
+            reverse('api:post_detail', kwargs={'post_id': post.pk})
+        ))
+        self.assertEqual(data['author'], 'author')
+        self.assertEqual(data['group'], 'group')
+        self.assertEqual(data['comments_count'], 1)
+        data = read(self.client.get(
+            reverse('api:group_detail', kwargs={'slug': 'group'})
+        ))
+        self.assertEqual(data['posts_count'], 5)
+
+    def test_errors(self):
+        cases = {
+            reverse('api:posts') + '?fields=password': 400,
+            reverse('api:posts') + '?limit=0': 400,
+            reverse('api:posts') + '?cursor=broken': 400,
+            reverse('api:post_detail', kwargs={'post_id': 0}): 404,
+            reverse('api:group_posts', kwargs={'slug': 'missing'}): 404,
+            reverse('api:profile_posts', kwargs={'username': 'nobody'}): 404,
+            reverse('api:follow_posts'): 401,
+        }
+        for url, status in cases.items():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status)
+                self.assertIn('detail', read(response))
+
+    def test_read_only(self):
+        response = self.client.post(reverse('api:posts'))
+        self.assertEqual(response.status_code, 405)
+
+    def test_follow_feed(self):
+        """Лента подписок — как на странице follow_index."""
+        self.client.force_login(self.reader)
+        data = read(self.client.get(reverse('api:follow_posts')))
+        self.assertEqual(
+            [item['id'] for item in data['results']],
+            [post.pk for post in reversed(self.posts)],
+        )
+
+    def test_not_modified(self):
+        url = reverse('api:posts')
+        response = self.client.get(url)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(author=self.author, text='Новый пост')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CHANGELOG_SAFETY_LAG=0)
+class ChangesTest(TestCase):
+    """Изменения лент после курсора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Старый пост'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def cursor(self, url):
+        return read(self.client.get(url))['cursor']
+
+    def since(self, url, cursor):
+        return read(self.client.get(url, {'since': cursor}))
+
+    def test_created_edited_deleted(self):
+        """Новые, изменённые и удалённые посты и комментарии."""
+        url = reverse('api:posts_changes')
+        cursor = self.cursor(url)
+        self.assertEqual(self.since(url, cursor)['changes'], [])
+
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Исправленный пост'
+        post.save()
+        new = Post.objects.create(author=self.other, text='Новый пост')
+        comment = Comment.objects.create(
+            author=self.reader, post=new, text='Комментарий'
+        )
+        Post.objects.filter(pk=new.pk).delete()
+
+        data = self.since(url, cursor)
+        changes = {
+            (change['kind'], change['id']): change
+            for change in data['changes']
+        }
+        self.assertEqual(len(changes), 3)
+        edited = changes[('post', post.pk)]
+        self.assertEqual(edited['action'], 'updated')
+        self.assertEqual(edited['object']['text'], 'Исправленный пост')
+        self.assertEqual(changes[('post', new.pk)]['action'], 'deleted')
+        self.assertNotIn('object', changes[('post', new.pk)])
+        self.assertEqual(changes[('comment', comment.pk)]['post'], new.pk)
+        self.assertFalse(data['more'])
+        self.assertEqual(self.since(url, data['cursor'])['changes'], [])
+
+    def test_feed_filters(self):
+        """В ленту попадают только изменения её постов."""
+        urls = {
+            'group': reverse('api:group_changes', kwargs={'slug': 'group'}),
+            'profile': reverse(
+                'api:profile_changes', kwargs={'username': 'author'}
+            ),
+            'follow': reverse('api:follow_changes'),
+        }
+        cursors = {name: self.cursor(url) for name, url in urls.items()}
+        Post.objects.create(author=self.other, text='Чужой пост')
+        Comment.objects.create(
+            author=self.other, post=self.post, text='Комментарий'
+        )
+        for name, url in urls.items():
+            with self.subTest(feed=name):
+                changes = self.since(url, cursors[name])['changes']
+                self.assertEqual(
+                    [(change['kind'], change['post']) for change in changes],
+                    [('comment', self.post.pk)]
+                )
+
+    def test_moved_post_leaves_group(self):
+        url = reverse('api:group_changes', kwargs={'slug': 'group'})
+        cursor = self.cursor(url)
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = None
+        post.save()
+        changes = self.since(url, cursor)['changes']
+        self.assertEqual(
+            [(change['id'], change['action']) for change in changes],
+            [(post.pk, 'deleted')]
+        )
+
+    @override_settings(CHANGELOG_SAFETY_LAG=60)
+    def test_cursor_waits_for_late_commits(self):
+        """Свежие записи отдаются, но курсор за них не заходит."""
+        url = reverse('api:posts_changes')
+        cursor = self.cursor(url)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        for _ in range(2):
+            data = self.since(url, cursor)
+            self.assertEqual(
+                [change['id'] for change in data['changes']], [post.pk]
+            )
+            self.assertEqual(data['cursor'], cursor)
+            self.assertFalse(data['more'])
+        Change.objects.update(
+            created=timezone.now() - timedelta(minutes=2)
+        )
+        data = self.since(url, cursor)
+        self.assertEqual(data['cursor'], Change.objects.latest('pk').pk)
+        self.assertEqual(self.since(url, data['cursor'])['changes'], [])
+
+    def test_bad_and_expired_cursor(self):
+        url = reverse('api:posts_changes')
+        self.assertEqual(
+            self.client.get(url, {'since': 'вчера'}).status_code, 400
+        )
+        Post.objects.create(author=self.author, text='Пост')
+        Post.objects.create(author=self.author, text='Пост')
+        oldest = Change.objects.order_by('pk').first()
+        Change.objects.filter(pk__lte=oldest.pk).delete()
+        response = self.client.get(url, {'since': oldest.pk - 1})
+        self.assertEqual(response.status_code, 410)
+
+    def test_anonymous_follow_changes(self):
+        response = Client().get(reverse('api:follow_changes'))
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,43 @@
+from django.urls import path
+from . import views
+
+
+app_name = 'api'
+
+urlpatterns = [
+    # Лента всех постов
+    path('posts/', views.posts, name='posts'),
+    # Изменения лент после курсора
+    path('posts/changes/', views.posts_changes, name='posts_changes'),
+    path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
+    path('groups/', views.groups, name='groups'),
+    path('groups/<slug:slug>/', views.group_detail, name='group_detail'),
+    path(
+        'groups/<slug:slug>/posts/',
+        views.group_posts,
+        name='group_posts'
+    ),
+    path(
+        'groups/<slug:slug>/changes/',
+        views.group_changes,
+        name='group_changes'
+    ),
+    path(
+        'profiles/<str:username>/posts/',
+        views.profile_posts,
+        name='profile_posts'
+    ),
+    path(
+        'profiles/<str:username>/changes/',
+        views.profile_changes,
+        name='profile_changes'
+    ),
+    # Лента подписок текущего пользователя
+    path('follow/', views.follow_posts, name='follow_posts'),
+    path('follow/changes/', views.follow_changes, name='follow_changes'),
+]
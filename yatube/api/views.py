@@ -0,0 +1,338 @@
+from functools import wraps
+
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
+
+from core.decorators import versioned_condition
+from core.paginator import FORWARD, CursorPaginator, MergedCursorPaginator
+from posts import changelog
+from posts.models import Change, Comment, Group, Post, User
+from posts.timeline import TIMELINE_ORDERING, following_feed
+from posts.views import (
+    COMMENT_FIELDS as COMMENT_COLUMNS, COMMENT_ORDERING, comments_versions,
+    follow_versions, group_versions, index_versions, post_versions,
+    profile_versions
+)
+from .serializers import (
+    COMMENT_FIELDS, GROUP_FIELDS, POST_DETAIL_FIELDS, POST_FIELDS, dumps,
+    pick_fields, post_queryset, serialize
+)
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 500
+# Строки выбираются блоками по индексу, а JSON отправляется по
+# блоку: строка ответа целиком в памяти не собирается.
+BLOCK_SIZE = 100
+GROUP_ORDERING = ('slug',)
+# Сколько записей журнала отдаётся за один запрос изменений.
+CHANGES_LIMIT = 500
+
+
+def groups_versions(request):
+    # Правка группы сбрасывает 'site', новые посты — число постов.
+    return ['site', 'feed']
+
+
+def changes_versions(request, **kwargs):
+    return ['changes']
+
+
+def follow_changes_versions(request):
+    # Подписка или отписка меняет состав ленты, а не журнал.
+    return ['changes', f'profile:{request.user.username}']
+
+
+def error(status, detail):
+    return JsonResponse(
+        {'detail': detail},
+        status=status,
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+def json_response(data):
+    return HttpResponse(dumps(data), content_type='application/json')
+
+
+def api_login_required(view):
+    """Как login_required у HTML-страниц, но 401 вместо перехода на вход."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return error(401, 'Нужно войти на сайт')
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def parse_limit(request):
+    try:
+        limit = int(request.GET.get('limit', PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit должен быть числом')
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit должен быть от 1 до {MAX_PAGE_SIZE}')
+    return limit
+
+
+def stream_list(request, paginator_for, available):
+    """Страница списка по курсору потоком JSON.
+
+    ``{"results": [...], "next": адрес следующей страницы или null}``.
+    ``?limit=`` — размер страницы, ``?fields=`` — нужные поля,
+    ``?cursor=`` — продолжение из ``next``. paginator_for(fields) даёт
+    пагинатор по queryset, загружающему только эти поля.
+
+    Все запросы к базе выполняются до ответа: ошибка в них — обычная
+    500, а не обрезанный JSON после статуса 200. Потоком идёт только
+    сериализация.
+    """
+    try:
+        fields = pick_fields(available, request.GET.get('fields'))
+        limit = parse_limit(request)
+        paginator = paginator_for(fields)
+        position = None
+        if request.GET.get('cursor'):
+            direction, position = paginator.decode_cursor(
+                request.GET['cursor']
+            )
+            if direction != FORWARD:
+                raise ValueError('Некорректный курсор')
+    except ValueError as exc:
+        return error(400, str(exc))
+    blocks, last, more = _fetch_blocks(paginator, limit, position)
+    next_url = None
+    if more and last is not None:
+        query = request.GET.copy()
+        query['cursor'] = paginator.cursor_after(last)
+        next_url = f'{request.path}?{query.urlencode()}'
+    return StreamingHttpResponse(
+        _chunks(blocks, available, fields, next_url),
+        content_type='application/json',
+    )
+
+
+def _fetch_blocks(paginator, limit, position):
+    """Блоки строк страницы, последняя строка и есть ли продолжение."""
+    blocks = []
+    sent = 0
+    last = None
+    more = False
+    while sent < limit:
+        paginator.per_page = min(BLOCK_SIZE, limit - sent)
+        rows = paginator.fetch(position)
+        block = rows[:paginator.per_page]
+        more = len(rows) > len(block)
+        if block:
+            blocks.append(block)
+            sent += len(block)
+            last = block[-1]
+            position = paginator.sort_key(last)
+        if not more:
+            break
+    return blocks, last, more
+
+
+def _chunks(blocks, available, fields, next_url):
+    yield '{"results":['
+    for number, block in enumerate(blocks):
+        yield (',' if number else '') + ','.join(
+            dumps(serialize(obj, available, fields)) for obj in block
+        )
+    yield '],"next":' + dumps(next_url) + '}'
+
+
+def post_list(request, queryset):
+    """Список постов: загружаются только поля из ?fields=."""
+    return stream_list(
+        request,
+        lambda fields: CursorPaginator(
+            post_queryset(queryset, fields), PAGE_SIZE
+        ),
+        POST_FIELDS,
+    )
+
+
+def detail(request, obj, available):
+    try:
+        fields = pick_fields(available, request.GET.get('fields'))
+    except ValueError as exc:
+        return error(400, str(exc))
+    return json_response(serialize(obj, available, fields))
+
+
+@require_safe
+@versioned_condition(index_versions)
+def posts(request):
+    return post_list(request, Post.objects.feed())
+
+
+@require_safe
+@versioned_condition(post_versions)
+def post_detail(request, post_id):
+    post = Post.objects.select_related('author', 'group').prefetch_related(
+        'thumbnails'
+    ).filter(pk=post_id).first()
+    if post is None:
+        return error(404, 'Пост не найден')
+    return detail(request, post, POST_DETAIL_FIELDS)
+
+
+@require_safe
+@versioned_condition(comments_versions)
+def post_comments(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        return error(404, 'Пост не найден')
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author'
+    ).only(*COMMENT_COLUMNS)
+    return stream_list(
+        request,
+        lambda fields: CursorPaginator(comments, PAGE_SIZE, COMMENT_ORDERING),
+        COMMENT_FIELDS,
+    )
+
+
+@require_safe
+@versioned_condition(groups_versions)
+def groups(request):
+    return stream_list(
+        request,
+        lambda fields: CursorPaginator(
+            Group.objects.all(), PAGE_SIZE, GROUP_ORDERING
+        ),
+        GROUP_FIELDS,
+    )
+
+
+@require_safe
+@versioned_condition(group_versions)
+def group_detail(request, slug):
+    group = Group.objects.filter(slug=slug).first()
+    if group is None:
+        return error(404, 'Группа не найдена')
+    return detail(request, group, GROUP_FIELDS)
+
+
+@require_safe
+@versioned_condition(group_versions)
+def group_posts(request, slug):
+    group = Group.objects.filter(slug=slug).first()
+    if group is None:
+        return error(404, 'Группа не найдена')
+    return post_list(request, group.posts.feed())
+
+
+@require_safe
+@versioned_condition(profile_versions)
+def profile_posts(request, username):
+    author = User.objects.filter(username=username).first()
+    if author is None:
+        return error(404, 'Пользователь не найден')
+    return post_list(request, author.posts.feed())
+
+
+@require_safe
+@api_login_required
+@versioned_condition(follow_versions)
+def follow_posts(request):
+    own, popular = following_feed(request.user)
+    return stream_list(
+        request,
+        lambda fields: MergedCursorPaginator(
+            post_queryset(own, fields),
+            PAGE_SIZE,
+            ordering=TIMELINE_ORDERING,
+            extra=[post_queryset(queryset, fields) for queryset in popular],
+        ),
+        POST_FIELDS,
+    )
+
+
+def changes_response(request, feed):
+    """Что изменилось в ленте после курсора ``?since=``.
+
+    ``{"changes": [...], "cursor": ..., "more": ...}``: по записи на
+    объект — ``created``/``updated`` с объектом (вставить или заменить)
+    или ``deleted`` без него. ``cursor`` передаётся в следующий запрос,
+    ``more`` — изменения ещё есть. Без ``since`` — только текущий курсор,
+    с которого начинать. 410 — журнал после курсора уже очищен.
+    """
+    if 'since' not in request.GET:
+        return json_response({
+            'changes': [], 'cursor': changelog.latest_cursor(), 'more': False
+        })
+    try:
+        since = int(request.GET['since'])
+        if since < 0:
+            raise ValueError
+    except ValueError:
+        return error(400, 'since должен быть курсором из прошлого ответа')
+    if changelog.expired(since):
+        return error(410, 'Журнал после курсора очищен, загрузите ленту')
+    changes, cursor, more = changelog.changes_since(
+        since, feed, CHANGES_LIMIT
+    )
+
+    def alive(kind):
+        return [
+            change.object_id for change in changes
+            if change.kind == kind and change.action != Change.DELETED
+        ]
+
+    objects = {
+        Change.POST: Post.objects.feed().in_bulk(alive(Change.POST)),
+        Change.COMMENT: Comment.objects.select_related('author').only(
+            *COMMENT_COLUMNS
+        ).in_bulk(alive(Change.COMMENT)),
+    }
+    fields = {Change.POST: POST_FIELDS, Change.COMMENT: COMMENT_FIELDS}
+    results = []
+    for change in changes:
+        entry = {
+            'kind': change.kind,
+            'id': change.object_id,
+            'post': change.post_id,
+            'action': change.action,
+        }
+        obj = objects[change.kind].get(change.object_id)
+        if change.action == Change.DELETED or obj is None:
+            # Объект мог исчезнуть уже после записи журнала.
+            entry['action'] = Change.DELETED
+        else:
+            available = fields[change.kind]
+            entry['object'] = serialize(obj, available, available)
+        results.append(entry)
+    return json_response({'changes': results, 'cursor': cursor, 'more': more})
+
+
+@require_safe
+@versioned_condition(changes_versions)
+def posts_changes(request):
+    return changes_response(request, changelog.feed_filter())
+
+
+@require_safe
+@versioned_condition(changes_versions)
+def group_changes(request, slug):
+    group = Group.objects.filter(slug=slug).first()
+    if group is None:
+        return error(404, 'Группа не найдена')
+    return changes_response(request, changelog.feed_filter(group=group))
+
+
+@require_safe
+@versioned_condition(changes_versions)
+def profile_changes(request, username):
+    author = User.objects.filter(username=username).first()
+    if author is None:
+        return error(404, 'Пользователь не найден')
+    return changes_response(request, changelog.feed_filter(author=author))
+
+
+@require_safe
+@api_login_required
+@versioned_condition(follow_changes_versions)
+def follow_changes(request):
+    return changes_response(
+        request, changelog.feed_filter(follower=request.user)
+    )
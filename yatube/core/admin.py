@@ -0,0 +1,139 @@
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import DateTimeField, Lookup, Max, Min, QuerySet
+from django.db.models.sql.where import AND
+from django.utils import timezone
+
+from .paginator import EstimatedCountPaginator
+
+# Дальше стольких периодов date_hierarchy не проверяется по одному,
+# а считается обычным DISTINCT по всем строкам.
+MAX_PROBES = 400
+
+
+def next_period(start, kind):
+    if kind == 'year':
+        return date(start.year + 1, 1, 1)
+    if kind == 'month':
+        return date(
+            start.year + start.month // 12, start.month % 12 + 1, 1
+        )
+    return start + timedelta(days=1)
+
+
+def periods(first, last, kind):
+    """Пары (начало, начало следующего) периодов kind от first до last."""
+    if kind == 'year':
+        start = date(first.year, 1, 1)
+    elif kind == 'month':
+        start = date(first.year, first.month, 1)
+    else:
+        start = first
+    while start <= last:
+        end = next_period(start, kind)
+        yield start, end
+        start = end
+
+
+def local_day(value):
+    """Дата значения поля в текущем часовом поясе."""
+    if not isinstance(value, datetime):
+        return value
+    if settings.USE_TZ:
+        value = timezone.localtime(value)
+    return value.date()
+
+
+def start_of(field, day):
+    """Значение поля field в начале дня day."""
+    if not isinstance(field, DateTimeField):
+        return day
+    moment = datetime.combine(day, time())
+    return timezone.make_aware(moment) if settings.USE_TZ else moment
+
+
+class IndexedDatesQuerySet(QuerySet):
+    """Queryset для date_hierarchy на больших таблицах.
+
+    Стандартный ``dates()`` обрезает дату у каждой строки и делает
+    DISTINCT — это проход по всей таблице. Здесь берутся крайние даты
+    и каждый период проверяется запросом EXISTS по диапазону, который
+    отвечает по индексу: лет и месяцев немного, дней не больше 31.
+    Возвращается список дат, а не queryset, — шаблону админки этого
+    достаточно.
+    """
+
+    def aggregate(self, *args, **kwargs):
+        # SQLite берёт MIN и MAX из индекса, только когда агрегат
+        # в запросе один, а date_hierarchy просит оба сразу.
+        if not args and len(kwargs) > 1 and all(
+            isinstance(value, (Min, Max)) for value in kwargs.values()
+        ):
+            result = {}
+            for name, value in kwargs.items():
+                result.update(super().aggregate(**{name: value}))
+            return result
+        return super().aggregate(*args, **kwargs)
+
+    def only_filtered_by(self, field):
+        """Все условия запроса — сравнения самого поля field."""
+        where = self.query.where
+        return where.connector == AND and not where.negated and all(
+            isinstance(child, Lookup)
+            and getattr(child.lhs, 'target', None) == field
+            for child in where.children
+        )
+
+    def dates(self, field_name, kind, order='ASC'):
+        if kind not in ('year', 'month', 'day'):
+            return super().dates(field_name, kind, order)
+        field = self.model._meta.get_field(field_name)
+        first = self.aggregate(value=Min(field_name))['value']
+        last = self.aggregate(value=Max(field_name))['value']
+        if first is None:
+            return []
+        bounds = list(periods(local_day(first), local_day(last), kind))
+        if len(bounds) > MAX_PROBES:
+            return super().dates(field_name, kind, order)
+
+        # SQLite ограничивает проход по индексу только одной парой
+        # границ поля. Если queryset отфильтрован лишь по этой же дате
+        # (date_hierarchy, фильтр по дате), проверки идут по всей таблице
+        # в пределах [first, last] — с одной нижней и одной верхней
+        # границей. Иначе — по queryset с его условиями.
+        if self.only_filtered_by(field):
+            base = self.model._default_manager.all()
+        else:
+            base = self
+
+        def exists(start, end):
+            start, end = start_of(field, start), start_of(field, end)
+            lookups = {f'{field_name}__gte': max(start, first)}
+            if end > last:
+                lookups[f'{field_name}__lte'] = last
+            else:
+                lookups[f'{field_name}__lt'] = end
+            return base.filter(**lookups).exists()
+
+        found = [start for start, end in bounds if exists(start, end)]
+        return found if order == 'ASC' else found[::-1]
+
+
+class LargeTableAdminMixin:
+    """Список админки, который не проходит по всей таблице.
+
+    Оценка числа строк вместо COUNT(*), без второго подсчёта «всего»
+    и date_hierarchy по индексу даты.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return IndexedDatesQuerySet(
+            model=queryset.model,
+            query=queryset.query.chain(),
+            using=queryset._db,
+        )
@@ -0,0 +1,320 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.signals import request_started
+from django.dispatch import receiver
+
+from .metrics import record_cache
+
+# Метка поколения локальных копий в общем кеше. Меняется при очистке,
+# чтобы остальные процессы сбросили свои копии целиком.
+EPOCH_KEY = 'tiered:epoch'
+# Журнал точечных изменений: номер последней записи и сами записи —
+# списки локальных ключей, удалённых или изменённых через incr.
+LOG_KEY = 'tiered:log'
+LOG_ENTRY_KEY = 'tiered:log:{}'
+# Отстав больше чем на столько записей, процесс сбрасывает все копии.
+LOG_REPLAY_LIMIT = 100
+
+_MISSING = object()
+
+# Локальные уровни по одному на общий кеш: экземпляры бэкенда у Django
+# свои в каждом потоке, а копии должны быть общими для процесса.
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class LocalTier:
+    """Небольшой LRU в памяти процесса.
+
+    Значения хранятся сериализованными, как в LocMemCache: закешированный
+    ответ меняют middleware, и разные запросы не должны делить объект.
+    """
+
+    def __init__(self, shared_alias, max_entries, timeout):
+        self.shared_alias = shared_alias
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.epoch = None
+        self.log_position = None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                pickled, expires = item
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return pickle.loads(pickled)
+                del self._data[key]
+            self.misses += 1
+        return _MISSING
+
+    def set(self, key, value, timeout=None):
+        """Копия живёт не дольше timeout — срока значения в общем кеше."""
+        if timeout is not None and timeout <= 0:
+            self.delete(key)
+            return
+        if timeout is None or timeout > self.timeout:
+            timeout = self.timeout
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._data[key] = (pickled, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def sync(self, shared):
+        """Сбрасывает копии, изменённые другими процессами.
+
+        Новое поколение сбрасывает все копии, записи журнала — только
+        свои ключи. Если записи не хватает (истекла или ещё не записана)
+        или их слишком много, копии сбрасываются целиком.
+        """
+        found = shared.get_many([EPOCH_KEY, LOG_KEY])
+        epoch = found.get(EPOCH_KEY)
+        if epoch is None:
+            shared.add(EPOCH_KEY, time.time_ns(), None)
+            epoch = shared.get(EPOCH_KEY)
+        position = found.get(LOG_KEY, 0)
+        if (
+            epoch != self.epoch
+            or self.log_position is None
+            or not self.replay(shared, self.log_position, position)
+        ):
+            self.clear()
+        self.epoch = epoch
+        self.log_position = position
+
+    def replay(self, shared, start, end):
+        """Удаляет ключи из записей журнала (start, end]; False — нужно
+        сбросить всё."""
+        if end == start:
+            return True
+        if not start < end <= start + LOG_REPLAY_LIMIT:
+            return False
+        names = [LOG_ENTRY_KEY.format(n) for n in range(start + 1, end + 1)]
+        entries = shared.get_many(names)
+        if len(entries) < len(names):
+            return False
+        with self._lock:
+            for keys in entries.values():
+                for key in keys:
+                    self._data.pop(key, None)
+        return True
+
+    def publish(self, shared, keys):
+        """Убирает копии keys здесь и записывает их в журнал для
+        остальных процессов."""
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+        shared.add(LOG_KEY, 0, None)
+        position = shared.incr(LOG_KEY)
+        # Копии живут не дольше self.timeout, дольше хранить запись
+        # незачем: процесс, не видевший её, сбросит всё.
+        shared.set(LOG_ENTRY_KEY.format(position), list(keys), self.timeout)
+
+    def new_epoch(self, shared):
+        self.epoch = time.time_ns()
+        shared.set(EPOCH_KEY, self.epoch, None)
+
+    def stats(self):
+        return {
+            'local': {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._data),
+            },
+            'shared': {
+                'hits': self.shared_hits,
+                'misses': self.shared_misses,
+            },
+        }
+
+
+class TieredCache(BaseCache):
+    """Двухуровневый кеш: LRU процесса перед общим кешем.
+
+    Общий уровень — любой другой алиас из ``CACHES`` (файловый кеш
+    локально, Redis в продакшене). Ключи страниц и карточек содержат
+    версии, поэтому после записи старые локальные копии просто становятся
+    недостижимы; сами версии (``SHARED_ONLY_PREFIXES``) читаются только
+    из общего кеша. Копия живёт не дольше, чем значение в общем кеше.
+    Об удалениях и incr остальные процессы узнают из журнала ключей, об
+    очистке — по метке поколения; и то и другое проверяется в начале
+    каждого запроса.
+
+    Параметры в ``OPTIONS``: ``SHARED`` — алиас общего кеша,
+    ``LOCAL_MAX_ENTRIES``, ``LOCAL_TIMEOUT`` (секунды),
+    ``SHARED_ONLY_PREFIXES``.
+    """
+
+    def __init__(self, location, params):
+        options = params.get('OPTIONS', {})
+        super().__init__(params)
+        self.shared_alias = options.get('SHARED', location)
+        self.shared_only = tuple(
+            options.get('SHARED_ONLY_PREFIXES', ('version:',))
+        )
+        with _tiers_lock:
+            tier = _tiers.get(self.shared_alias)
+            if tier is None:
+                tier = LocalTier(
+                    self.shared_alias,
+                    options.get('LOCAL_MAX_ENTRIES', 1000),
+                    options.get('LOCAL_TIMEOUT', 60),
+                )
+                _tiers[self.shared_alias] = tier
+        self.local = tier
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def _local_key(self, key, version):
+        if key.startswith(self.shared_only):
+            return None
+        return self.make_key(key, version)
+
+    def get(self, key, default=None, version=None):
+        local_key = self._local_key(key, version)
+        if local_key is not None:
+            value = self.local.get(local_key)
+            if value is not _MISSING:
+                record_cache(hits=1)
+                return value
+        value = self.shared.get(key, _MISSING, version)
+        if value is _MISSING:
+            self.local.shared_misses += 1
+            record_cache(misses=1)
+            return default
+        self.local.shared_hits += 1
+        record_cache(hits=1)
+        if local_key is not None:
+            self.local.set(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        rest = []
+        for key in keys:
+            local_key = self._local_key(key, version)
+            value = (
+                _MISSING if local_key is None
+                else self.local.get(local_key)
+            )
+            if value is _MISSING:
+                rest.append(key)
+            else:
+                found[key] = value
+        if rest:
+            fetched = self.shared.get_many(rest, version)
+            self.local.shared_hits += len(fetched)
+            self.local.shared_misses += len(rest) - len(fetched)
+            for key, value in fetched.items():
+                local_key = self._local_key(key, version)
+                if local_key is not None:
+                    self.local.set(local_key, value)
+            found.update(fetched)
+        record_cache(hits=len(found), misses=len(keys) - len(found))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        self.shared.set(key, value, timeout, version)
+        local_key = self._local_key(key, version)
+        if local_key is not None:
+            self.local.set(local_key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        added = self.shared.add(key, value, timeout, version)
+        local_key = self._local_key(key, version)
+        if added and local_key is not None:
+            self.local.set(local_key, value, timeout)
+        return added
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        failed = self.shared.set_many(data, timeout, version)
+        for key, value in data.items():
+            local_key = self._local_key(key, version)
+            if local_key is not None and key not in failed:
+                self.local.set(local_key, value, timeout)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return self.shared.touch(key, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version)
+        self._invalidate([key], version)
+        return value
+
+    def delete(self, key, version=None):
+        self.shared.delete(key, version)
+        self._invalidate([key], version)
+
+    def delete_many(self, keys, version=None):
+        self.shared.delete_many(keys, version)
+        self._invalidate(keys, version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version) is not _MISSING
+
+    def clear(self):
+        self.shared.clear()
+        self.local.clear()
+        self.local.new_epoch(self.shared)
+        # Журнал стёрт вместе с общим кешем и начнётся с нуля.
+        self.local.log_position = 0
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def sync(self):
+        self.local.sync(self.shared)
+
+    def stats(self):
+        """Попадания и промахи по уровням с момента запуска процесса."""
+        return self.local.stats()
+
+    def _invalidate(self, keys, version):
+        local_keys = [
+            local_key for local_key in (
+                self._local_key(key, version) for key in keys
+            ) if local_key is not None
+        ]
+        if local_keys:
+            self.local.publish(self.shared, local_keys)
+
+
+@receiver(request_started)
+def sync_local_tiers(sender, **kwargs):
+    for tier in list(_tiers.values()):
+        tier.sync(caches[tier.shared_alias])
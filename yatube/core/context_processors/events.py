@@ -0,0 +1,8 @@
+from django.conf import settings
+
+
+def events(request):
+    """Добавляет адрес сервера событий для живых обновлений страниц."""
+    return {
+        'events_url': settings.EVENTS_URL
+    }
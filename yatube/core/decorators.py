@@ -0,0 +1,134 @@
+import os
+from functools import lru_cache, wraps
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .versions import get_versions
+
+
+def page_versions(request, versions, *args, **kwargs):
+    """Версии данных страницы; считаются один раз за запрос.
+
+    Ими пользуются и условный GET, и кеш страниц, а между ними
+    версии не меняются. Шапка любой страницы показывает имя вошедшего,
+    поэтому к версиям страницы добавляется и его ``user:<pk>``.
+    """
+    if not hasattr(request, '_page_versions'):
+        names = list(versions(request, *args, **kwargs))
+        if request.user.is_authenticated:
+            names.append(f'user:{request.user.pk}')
+        request._page_versions = get_versions(*names)
+    return request._page_versions
+
+
+def _viewer(request):
+    """Кто смотрит страницу: для ключа кеша и ETag.
+
+    У вошедшего учитывается и секрет CSRF: формы страницы несут токен
+    от него, а новый вход того же пользователя секрет меняет. Страница
+    со старым токеном после повторного входа не должна отдаваться ни из
+    кеша, ни ответом 304. Без cookie секрет выписывается сразу, чтобы
+    этот же ответ и следующий запрос дали одинаковый ETag.
+    """
+    if not request.user.is_authenticated:
+        return 'anon'
+    if 'CSRF_COOKIE' not in request.META:
+        get_token(request)
+    return '{}:{}'.format(request.user.pk, request.META.get('CSRF_COOKIE'))
+
+
+@lru_cache(maxsize=None)
+def templates_stamp():
+    """Время последней правки шаблонов проекта, нс.
+
+    Новая выкладка с изменёнными шаблонами меняет ETag страниц,
+    даже если данные остались прежними.
+    """
+    stamp = 0
+    for engine in settings.TEMPLATES:
+        for directory in engine.get('DIRS', []):
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    stamp = max(
+                        stamp, os.stat(os.path.join(root, name)).st_mtime_ns
+                    )
+    return stamp
+
+
+def versioned_condition(versions):
+    """Условный GET по версиям данных страницы.
+
+    ETag собирается из адреса, пользователя, шаблонов и версий. На
+    совпавший If-None-Match отвечает 304, не вызывая представление: ни
+    шаблонов, ни запросов ленты. Last-Modified не отдаётся: он точен до
+    секунды, и две записи за одну секунду дали бы устаревший 304.
+    ``versions`` — как у ``versioned_cache_page``.
+    """
+    def etag(request, *args, **kwargs):
+        stamps = page_versions(request, versions, *args, **kwargs)
+        raw = '{}|{}|{}|{}'.format(
+            request.get_full_path(),
+            _viewer(request),
+            templates_stamp(),
+            ':'.join(map(str, stamps)),
+        )
+        return md5(raw.encode()).hexdigest()
+
+    def decorator(view):
+        conditional = condition(etag)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                # Хранить можно, но перед показом — сверить валидаторы.
+                patch_cache_control(
+                    response,
+                    no_cache=True,
+                    private=request.user.is_authenticated,
+                )
+            return response
+        return wrapper
+    return decorator
+
+
+def versioned_cache_page(timeout, versions):
+    """Кеширует страницу, пока не сменились версии её данных.
+
+    ``versions(request, **kwargs)`` возвращает имена версий, от которых
+    зависит страница. Ключ складывается из полного пути (с номером или
+    курсором страницы), пользователя и текущих значений версий, поэтому
+    запись сразу делает старую копию недостижимой и срок жизни можно
+    держать большим.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            stamps = page_versions(request, versions, *args, **kwargs)
+            raw_key = '{}|{}|{}'.format(
+                request.get_full_path(),
+                _viewer(request),
+                ':'.join(map(str, stamps)),
+            )
+            key = 'page:' + md5(raw_key.encode()).hexdigest()
+            response = cache.get(key)
+            if response is not None:
+                return response
+            response = view(request, *args, **kwargs)
+            # Ответы с cookie (например, CSRF) не должны достаться другим.
+            if (
+                response.status_code == 200
+                and not response.streaming
+                and not response.cookies
+            ):
+                cache.set(key, response, timeout)
+            return response
+        return wrapper
+    return decorator
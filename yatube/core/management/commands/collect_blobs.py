@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.storage import collect, recount
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из хранилища по хешу файлы, на которые больше никто '
+        'не ссылается.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько файлов выбирать за раз.',
+        )
+        parser.add_argument(
+            '--grace', type=int, default=settings.BLOB_GRACE_PERIOD,
+            help='Сколько секунд файл без ссылок ждёт удаления.',
+        )
+        parser.add_argument(
+            '--recount', action='store_true',
+            help='Сначала пересчитать ссылки по данным моделей.',
+        )
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            fixed = recount()
+            self.stdout.write(f'Исправлено счётчиков ссылок: {fixed}')
+        removed = collect(options['batch_size'], options['grace'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено файлов: {removed}'))
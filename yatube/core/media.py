@@ -0,0 +1,176 @@
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+# Форматы вариантов миниатюр, которых может не быть в mimetypes.
+mimetypes.add_type('image/webp', '.webp')
+mimetypes.add_type('image/avif', '.avif')
+
+# Часть пути из 32 и более шестнадцатеричных знаков — хеш содержимого
+# (картинки постов, варианты, миниатюры sorl): под таким именем файл
+# не меняется, и браузер может не перепроверять его.
+HASHED_NAME = re.compile(r'(?:^|/)[0-9a-f]{32,}(?:[./]|$)')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Один диапазон: bytes=начало-конец, bytes=начало- или bytes=-длина.
+BYTE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+SENDFILE_HEADERS = {
+    'x-sendfile': 'X-Sendfile',
+    'x-accel-redirect': 'X-Accel-Redirect',
+}
+
+
+class Unsatisfiable(ValueError):
+    pass
+
+
+def parse_range(header, size):
+    """Диапазон (начало, конец включительно) из заголовка Range.
+
+    None — отдать файл целиком: заголовок непонятен или диапазонов
+    несколько (так разрешает RFC 7233). Unsatisfiable — диапазон вне
+    файла.
+    """
+    match = BYTE_RANGE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        length = int(last)
+        if not length or not size:
+            raise Unsatisfiable
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise Unsatisfiable
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+def if_range_matches(request, etag, last_modified):
+    """Диапазон применяется, только если файл не менялся с If-Range."""
+    value = request.META.get('HTTP_IF_RANGE')
+    if value is None:
+        return True
+    if value.startswith('"'):
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+class FileRange:
+    """Окно открытого файла для FileResponse: read() не выходит за него.
+
+    fileno() у окна нет намеренно: не всякий wsgi.file_wrapper
+    ограничивает sendfile длиной ответа, и часть файла отдаётся чтением.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def offload(path, full_path, content_type):
+    """Пустой ответ, тело которого отдаст фронтенд-сервер по заголовку
+    MEDIA_SENDFILE. Диапазоны и sendfile он обрабатывает сам."""
+    response = HttpResponse(content_type=content_type)
+    header = SENDFILE_HEADERS[settings.MEDIA_SENDFILE]
+    if header == 'X-Accel-Redirect':
+        response[header] = quote(settings.MEDIA_ACCEL_PREFIX + path)
+    else:
+        response[header] = full_path
+    return response
+
+
+def file_response(request, full_path, content_type, size, etag,
+                  last_modified):
+    """Файл или его диапазон через FileResponse.
+
+    Целый файл сервер WSGI отдаёт через wsgi.file_wrapper, то есть
+    sendfile без копирования в память процесса, если умеет.
+    """
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and if_range_matches(
+        request, etag, last_modified
+    ):
+        try:
+            byte_range = parse_range(request.META['HTTP_RANGE'], size)
+        except Unsatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        return FileResponse(file, content_type=content_type)
+    start, end = byte_range
+    response = FileResponse(
+        FileRange(file, start, end - start + 1),
+        status=206,
+        content_type=content_type,
+    )
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = end - start + 1
+    return response
+
+
+@require_safe
+def serve(request, path):
+    """Отдаёт файл из MEDIA_ROOT: с диапазонами, условными запросами и
+    долгим кешем для имён с хешем.
+
+    С MEDIA_SENDFILE тело отдаёт фронтенд-сервер. Если фронтенд сам
+    раздаёт MEDIA_URL, сюда запросы не доходят.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        status = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404
+    if not stat.S_ISREG(status.st_mode):
+        raise Http404
+    etag = '"{:x}-{:x}"'.format(status.st_mtime_ns, status.st_size)
+    last_modified = int(status.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        content_type = mimetypes.guess_type(full_path)[0]
+        content_type = content_type or 'application/octet-stream'
+        if settings.MEDIA_SENDFILE:
+            response = offload(path, full_path, content_type)
+        else:
+            response = file_response(
+                request, full_path, content_type, status.st_size, etag,
+                last_modified
+            )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = (
+        IMMUTABLE if HASHED_NAME.search(path)
+        else f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+    )
+    return response
@@ -0,0 +1,225 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import (
+    DjangoTemplates as BaseDjangoTemplates, Template, reraise
+)
+
+# Границы корзин гистограмм; последняя корзина (+Inf) подразумевается.
+METRICS = {
+    'queries': (
+        'SQL-запросов за запрос',
+        (1, 2, 3, 5, 10, 20, 50, 100),
+    ),
+    'sql_seconds': (
+        'Время SQL-запросов, с',
+        (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+    ),
+    'template_seconds': (
+        'Время отрисовки шаблонов, с',
+        (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+    ),
+    'cache_hits': (
+        'Попаданий в кеш за запрос',
+        (0, 1, 2, 5, 10, 20, 50),
+    ),
+    'cache_misses': (
+        'Промахов кеша за запрос',
+        (0, 1, 2, 5, 10, 20, 50),
+    ),
+    'latency_seconds': (
+        'Полное время ответа, с',
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+    ),
+}
+
+_local = threading.local()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Пары (граница, число наблюдений не больше неё)."""
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class Registry:
+    """Гистограммы метрик по имени представления, общие для процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, view, values):
+        with self._lock:
+            for metric, value in values.items():
+                key = (metric, view)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = Histogram(METRICS[metric][1])
+                    self._histograms[key] = histogram
+                histogram.observe(value)
+
+    def snapshot(self):
+        """{метрика: {представление: {'count', 'sum', 'buckets'}}}."""
+        data = {metric: {} for metric in METRICS}
+        with self._lock:
+            for (metric, view), histogram in sorted(self._histograms.items()):
+                data[metric][view] = {
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'buckets': [
+                        [bound, count]
+                        for bound, count in histogram.cumulative()
+                    ],
+                }
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+registry = Registry()
+
+
+class RequestStats:
+    """Счётчики одного запроса; живут в локальной памяти потока."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0
+        self.template_seconds = 0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Обёртка connection.execute_wrapper: считает каждый запрос.
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_seconds += time.perf_counter() - start
+
+    def values(self, latency):
+        return {
+            'queries': self.queries,
+            'sql_seconds': self.sql_seconds,
+            'template_seconds': self.template_seconds,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'latency_seconds': latency,
+        }
+
+
+def current():
+    return getattr(_local, 'stats', None)
+
+
+def record_cache(hits=0, misses=0):
+    """Отмечает обращения к кешу в текущем запросе, если он измеряется."""
+    stats = current()
+    if stats is not None:
+        stats.cache_hits += hits
+        stats.cache_misses += misses
+
+
+def measure(view_name, get_response, request):
+    """Выполняет запрос и записывает его метрики под именем представления.
+
+    Имя берётся у ``view_name(request)`` уже после ответа, когда адрес
+    разрешён.
+    """
+    stats = RequestStats()
+    _local.stats = stats
+    start = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = get_response(request)
+    finally:
+        _local.stats = None
+    registry.observe(
+        view_name(request), stats.values(time.perf_counter() - start)
+    )
+    return response
+
+
+class TimedTemplate(Template):
+    """Шаблон, время отрисовки которого идёт в метрики запроса."""
+
+    def render(self, context=None, request=None):
+        stats = current()
+        if stats is None:
+            return super().render(context, request)
+        # Шаблоны, отрисованные внутри другого (карточки через
+        # render_to_string), входят во время внешнего.
+        stats.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_depth -= 1
+            if not stats.template_depth:
+                stats.template_seconds += time.perf_counter() - start
+
+
+class DjangoTemplates(BaseDjangoTemplates):
+    """Бэкенд DjangoTemplates, отдающий TimedTemplate."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(
+                self.engine.get_template(template_name), self
+            )
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def prometheus(snapshot, extra=()):
+    """Текст в формате Prometheus для снимка ``registry.snapshot()``.
+
+    ``extra`` — строки уже готовых метрик, которые дописываются в конец.
+    """
+    lines = []
+    for metric, views in snapshot.items():
+        name = f'yatube_view_{metric}'
+        lines.append(f'# HELP {name} {METRICS[metric][0]}')
+        lines.append(f'# TYPE {name} histogram')
+        for view, data in views.items():
+            label = f'view="{_label(view)}"'
+            for bound, count in data['buckets']:
+                lines.append(
+                    f'{name}_bucket{{{label},le="{bound}"}} {count}'
+                )
+            lines.append(f'{name}_sum{{{label}}} {data["sum"]}')
+            lines.append(f'{name}_count{{{label}}} {data["count"]}')
+    lines.extend(extra)
+    return '\n'.join(lines) + '\n'
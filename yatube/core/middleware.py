@@ -0,0 +1,21 @@
+from . import metrics
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else '<unresolved>'
+
+
+class MetricsMiddleware:
+    """Собирает по каждому представлению число и время SQL-запросов,
+    время шаблонов, обращения к кешу и полное время ответа.
+
+    Ставится первой в MIDDLEWARE, чтобы учитывать и остальные middleware.
+    Время шаблонов считает бэкенд core.metrics.DjangoTemplates.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return metrics.measure(view_name, self.get_response, request)
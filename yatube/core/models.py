@@ -11,3 +11,34 @@ class CreatedModel(models.Model):
     class Meta:
         # Это абстрактная модель:
         abstract = True
+
+
+class Blob(models.Model):
+    """Файл в хранилище по хешу содержимого и число ссылок на него."""
+    name = models.CharField(
+        'Имя файла',
+        max_length=255,
+        unique=True
+    )
+    size = models.PositiveIntegerField('Размер')
+    refs = models.PositiveIntegerField('Ссылок', default=0)
+    # С какого момента на файл никто не ссылается: сборка мусора
+    # удаляет его только спустя BLOB_GRACE_PERIOD.
+    unused_since = models.DateTimeField(
+        'Без ссылок с',
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+        indexes = [
+            models.Index(
+                fields=['refs', 'unused_since'],
+                name='blob_unused_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
@@ -1,8 +1,296 @@
-from django.core.paginator import Paginator
+import heapq
+import json
 
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 
-def paginator_func(request, page, ordering):
-    paginator = Paginator(page, ordering)
+# Ключ сортировки ленты: сначала свежие, при равной дате — больший id.
+FEED_ORDERING = ('-pub_date', '-pk')
+
+FORWARD = 'n'
+BACKWARD = 'p'
+
+# Больше стольких строк отфильтрованный список не пересчитывает.
+COUNT_LIMIT = 10000
+# Старые ссылки ?page=N читаются через OFFSET; дальше этой страницы
+# они ведут на первую, глубже листают только курсорами.
+MAX_PAGE_NUMBER = 50
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинация по ключу сортировки вместо OFFSET.
+
+    Страница выбирается условием «строго после/до позиции» по индексу,
+    поэтому первая и сорокатысячная страницы стоят одинаково, а COUNT(*)
+    не выполняется вовсе. Пагинатор создаётся на один запрос: после
+    получения страницы он хранит курсоры соседних страниц.
+
+    Номер страницы у курсорных страниц относительный: 1 — первая
+    страница, 2 — любая следующая. Этого достаточно стандартному
+    ``Page``, чтобы отвечать на has_next/has_previous без подсчёта строк.
+
+    Ключом могут быть поля модели или аннотации queryset.
+    """
+
+    def __init__(self, object_list, per_page, ordering=FEED_ORDERING):
+        super().__init__(object_list.order_by(*ordering), per_page)
+        self.ordering = ordering
+        annotations = self.object_list.query.annotations
+        opts = self.object_list.model._meta
+        self.fields = []
+        self.attrs = []
+        for name in ordering:
+            name = name.lstrip('-')
+            if name in annotations:
+                self.fields.append(annotations[name].output_field)
+                self.attrs.append(name)
+                continue
+            field = opts.pk if name == 'pk' else opts.get_field(name)
+            self.fields.append(field)
+            self.attrs.append(field.attname)
+        self.number = 1
+        self.has_next = False
+        self.first_position = None
+        self.last_position = None
+
+    @property
+    def num_pages(self):
+        # Известно только окно вокруг текущей страницы.
+        return self.number + int(self.has_next)
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise InvalidPage('Номер страницы должен быть числом')
+        if number < 1:
+            raise InvalidPage('Номер страницы меньше 1')
+        if number > MAX_PAGE_NUMBER:
+            raise InvalidPage('Слишком далёкая страница')
+        return number
+
+    def get_page(self, number):
+        try:
+            number = self.validate_number(number)
+        except InvalidPage:
+            number = 1
+        return self.page(number)
+
+    def page(self, number):
+        """Страница по номеру — для старых ссылок вида ``?page=N``.
+
+        Номер не больше MAX_PAGE_NUMBER, так что OFFSET ограничен; за
+        концом списка — пустая последняя страница.
+        """
+        number = self.validate_number(number)
+        rows = self.fetch(offset=(number - 1) * self.per_page)
+        return self._build_page(rows, number)
+
+    def get_cursor_page(self, cursor):
+        """Страница по непрозрачному курсору.
+
+        Курсор за концом списка (строки удалили) даёт пустую последнюю
+        страницу, битый курсор — InvalidPage.
+        """
+        try:
+            direction, position = self.decode_cursor(cursor)
+        except ValueError as error:
+            raise InvalidPage(str(error))
+        if direction == FORWARD:
+            return self._build_page(self.fetch(position), 2)
+        rows = self.fetch(position, reverse=True)
+        if len(rows) <= self.per_page:
+            # Перед позицией меньше страницы строк: это начало списка,
+            # и предыдущая страница — настоящая первая.
+            return self.page(1)
+        return self._build_page(
+            rows[:self.per_page][::-1], 2, position is not None
+        )
+
+    def empty_page(self):
+        """Пустая страница без продолжения — конец списка."""
+        return self._build_page([], 2, has_next=False)
+
+    def fetch(self, position=None, reverse=False, offset=0):
+        """Строки после позиции — на одну больше размера страницы."""
+        return list(
+            self.filter_after(self.object_list, position, reverse)[
+                offset:offset + self.per_page + 1
+            ]
+        )
+
+    def filter_after(self, queryset, position, reverse=False):
+        if reverse:
+            queryset = queryset.reverse()
+        if position is None:
+            return queryset
+        return queryset.filter(self._after(position, reverse))
+
+    def _build_page(self, rows, number, has_next=None):
+        if has_next is None:
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        self.number = number
+        self.has_next = has_next
+        if rows:
+            self.first_position = self._position(rows[0])
+            self.last_position = self._position(rows[-1])
+        return Page(rows, number, self)
+
+    def sort_key(self, obj):
+        return tuple(getattr(obj, attr) for attr in self.attrs)
+
+    def _position(self, obj):
+        return [
+            value.isoformat() if hasattr(value, 'isoformat') else str(value)
+            for value in self.sort_key(obj)
+        ]
+
+    def _after(self, position, reverse=False):
+        """Q-условие «строка идёт после позиции» в порядке сортировки."""
+        condition = Q()
+        equal = Q()
+        for name, value in zip(self.ordering, position):
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, direction, position=None):
+        payload = json.dumps([direction, position], separators=(',', ':'))
+        return urlsafe_base64_encode(payload.encode())
+
+    def decode_cursor(self, cursor):
+        try:
+            direction, position = json.loads(urlsafe_base64_decode(cursor))
+        except (TypeError, ValueError):
+            raise ValueError('Некорректный курсор')
+        if direction not in (FORWARD, BACKWARD):
+            raise ValueError('Некорректный курсор')
+        if position is not None and len(position) != len(self.fields):
+            raise ValueError('Некорректный курсор')
+        if direction == FORWARD and position is None:
+            raise ValueError('Некорректный курсор')
+        if position is not None:
+            try:
+                position = [
+                    field.to_python(value)
+                    for field, value in zip(self.fields, position)
+                ]
+            except ValidationError:
+                raise ValueError('Некорректный курсор')
+        return direction, position
+
+    def cursor_after(self, obj):
+        """Курсор на строки после obj — для выдачи по частям."""
+        return self.encode_cursor(FORWARD, self._position(obj))
+
+    @property
+    def next_cursor(self):
+        if self.has_next:
+            return self.encode_cursor(FORWARD, self.last_position)
+        return None
+
+    @property
+    def previous_cursor(self):
+        # У пустой страницы за концом предыдущая — последняя страница.
+        if self.number > 1:
+            return self.encode_cursor(BACKWARD, self.first_position)
+        return None
+
+    @property
+    def last_cursor(self):
+        return self.encode_cursor(BACKWARD)
+
+
+def estimate_rows(queryset):
+    """Примерное число строк таблицы без прохода по ней.
+
+    PostgreSQL хранит оценку в статистике планировщика; в остальных
+    базах берётся наибольший id: ключи не переиспользуются, поэтому
+    после удалений оценка только завышена.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] > 0:
+            return row[0]
+    return queryset.aggregate(pk=Max('pk'))['pk'] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор для больших таблиц без точного COUNT(*).
+
+    Для таблицы целиком число строк оценивается, для отфильтрованной —
+    считается не дальше COUNT_LIMIT строк. Страница за пределами
+    настоящего конца просто окажется пустой.
+    """
+
+    count_limit = COUNT_LIMIT
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return estimate_rows(queryset)
+        return queryset.order_by()[:self.count_limit].count()
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """Keyset-пагинация по нескольким queryset с общим ключом.
+
+    Из каждого источника берётся не больше страницы после позиции,
+    затем строки сливаются в Python; строки с одинаковым ключом
+    считаются одной записью. Все поля ключа сортируются в одну сторону.
+    """
+
+    def __init__(self, object_list, per_page, ordering=FEED_ORDERING,
+                 extra=()):
+        super().__init__(object_list, per_page, ordering)
+        self.sources = [self.object_list] + [
+            queryset.order_by(*ordering) for queryset in extra
+        ]
+
+    def fetch(self, position=None, reverse=False, offset=0):
+        limit = offset + self.per_page + 1
+        streams = [
+            list(self.filter_after(queryset, position, reverse)[:limit])
+            for queryset in self.sources
+        ]
+        descending = self.ordering[0].startswith('-') != reverse
+        rows = []
+        last_key = None
+        for row in heapq.merge(
+            *streams, key=self.sort_key, reverse=descending
+        ):
+            key = self.sort_key(row)
+            if key != last_key:
+                rows.append(row)
+                last_key = key
+        return rows[offset:limit]
+
+
+def paginator_func(request, page, per_page, paginator_class=CursorPaginator,
+                   **kwargs):
+    paginator = paginator_class(page, per_page, **kwargs)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            return paginator.get_cursor_page(cursor)
+        except InvalidPage:
+            return paginator.page(1)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from collections import defaultdict, deque, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# id — возрастающий номер события в общем хранилище, channel — канал
+# подписки, name — тип события для клиента, data — готовая строка.
+Event = namedtuple('Event', 'id channel name data')
+
+
+class Subscription:
+    """Очередь событий одного клиента."""
+
+    def __init__(self, hub, channels, size):
+        self.hub = hub
+        self.channels = frozenset(channels)
+        self.queue = asyncio.Queue(size)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Медленный клиент не копит память сервера: его отключают,
+            # а пропущенное он получит по Last-Event-ID.
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """Следующее событие или None, если за timeout ничего не пришло."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class Hub:
+    """Рассылка событий по каналам внутри процесса.
+
+    Подписчик — очередь asyncio, поэтому тысяча ждущих клиентов — это
+    тысяча корутин, а не потоков. Последние события остаются в буфере:
+    переподключившийся клиент дочитывает из него пропущенное.
+
+    id событий возрастают, но приходить могут не по порядку: запись с
+    меньшим id бывает видна позже. Поэтому хранилище отдаёт свежие
+    события повторно, пока они не устоятся (см. settle), а хаб помнит
+    разосланные id и второй раз их не рассылает.
+    """
+
+    def __init__(self, backlog=1000, queue_size=100):
+        self.channels = defaultdict(set)
+        self.recent = deque(maxlen=backlog)
+        self.queue_size = queue_size
+        # Все события с id больше floor есть в буфере.
+        self.floor = 0
+        # Разосланные id, которые хранилище ещё может отдать повторно.
+        self.published = set()
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels, self.queue_size)
+        for channel in subscription.channels:
+            self.channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for channel in subscription.channels:
+            subscribers = self.channels.get(channel)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.channels[channel]
+
+    def publish(self, event):
+        if event.id in self.published:
+            return
+        self.published.add(event.id)
+        if len(self.recent) == self.recent.maxlen:
+            self.floor = max(self.floor, self.recent[0].id)
+        self.recent.append(event)
+        for subscription in tuple(self.channels.get(event.channel, ())):
+            subscription.put(event)
+
+    def settle(self, cursor):
+        """События с id до cursor больше не придут: их можно забыть."""
+        self.published = {
+            event_id for event_id in self.published if event_id > cursor
+        }
+
+    def replay(self, after, channels):
+        """События каналов, разосланные после события after; None —
+        буфер их не помнит."""
+        if after < self.floor:
+            return None
+        ids = [event.id for event in self.recent]
+        if after in ids:
+            # По порядку рассылки: событие с меньшим id могло прийти позже.
+            missed = list(self.recent)[ids.index(after) + 1:]
+        else:
+            missed = [event for event in self.recent if event.id > after]
+        return [event for event in missed if event.channel in channels]
+
+
+async def relay(hub, backend, interval, batch=500, executor=None):
+    """Переносит события из общего хранилища в хаб процесса.
+
+    ``backend`` — объект с методами ``latest()`` (id последнего события)
+    и ``read(after, limit)`` (события после id и новый курсор). Его методы
+    синхронные и выполняются в ``executor``, не останавливая цикл событий.
+    Курсор может отставать от последнего события: всё после него
+    хранилище отдаст снова, а хаб отбросит уже разосланное.
+    """
+    loop = asyncio.get_running_loop()
+    cursor = await loop.run_in_executor(executor, backend.latest)
+    hub.floor = cursor
+    while True:
+        previous = cursor
+        try:
+            events, cursor = await loop.run_in_executor(
+                executor, backend.read, cursor, batch
+            )
+        except Exception:
+            logger.exception('Не удалось прочитать события')
+            events = []
+        for event in events:
+            hub.publish(event)
+        hub.settle(cursor)
+        if len(events) < batch or cursor == previous:
+            await asyncio.sleep(interval)
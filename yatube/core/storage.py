@@ -0,0 +1,203 @@
+import hashlib
+import os
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import Storage, get_storage_class
+from django.db import models, transaction
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+
+from .models import Blob
+
+# Файл удалён сборкой мусора: можно забыть всё, что из него получено.
+blob_collected = Signal(providing_args=['name'])
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(Storage):
+    """Хранилище, где имя файла — хеш его содержимого.
+
+    Одинаковые файлы лежат один раз: повторная загрузка получает имя
+    уже сохранённого файла, поэтому и миниатюры sorl у них общие. Ссылки
+    на файл считает модель Blob (retain и release), файлы без ссылок
+    удаляет collect. Сами байты хранит BLOB_STORAGE_BACKEND — локальная
+    папка или объектное хранилище с тем же интерфейсом.
+    """
+
+    def __init__(self, backend=None, options=None):
+        self._backend = backend
+        self._options = options
+
+    @cached_property
+    def backend(self):
+        backend = get_storage_class(
+            self._backend or settings.BLOB_STORAGE_BACKEND
+        )
+        options = self._options
+        if options is None:
+            options = settings.BLOB_STORAGE_OPTIONS
+        return backend(**options)
+
+    def blob_name(self, name, digest):
+        """posts/ab/cd/abcd….jpg: папка из upload_to, имя из хеша."""
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name), digest[:2], digest[2:4],
+            digest + extension
+        )
+
+    def get_available_name(self, name, max_length=None):
+        # Одинаковое имя значит одинаковое содержимое: файл не заменяется.
+        return name
+
+    def _save(self, name, content):
+        name = self.blob_name(name, content_hash(content))
+        now = timezone.now()
+        # Строка Blob и проверка файла — в одной транзакции. Пока пост не
+        # сохранён, ссылки нет, поэтому первым запросом сборка мусора
+        # откладывается: UPDATE блокирует строку (SQLite — всю базу) до
+        # конца транзакции. collect удаляет строку и файл тоже в
+        # транзакции и по тому же условию, так что он либо уже удалил
+        # их, либо дождётся нас и увидит свежий unused_since.
+        with transaction.atomic():
+            if not Blob.objects.filter(name=name, refs=0).update(
+                unused_since=now
+            ):
+                Blob.objects.get_or_create(
+                    name=name,
+                    defaults={'size': content.size, 'unused_since': now},
+                )
+            if not self.backend.exists(name):
+                saved = self.backend.save(name, content)
+                if saved != name:
+                    # Такой же файл успели записать параллельно.
+                    self.backend.delete(saved)
+        return name
+
+    def _open(self, name, mode='rb'):
+        return self.backend.open(name, mode)
+
+    def delete(self, name):
+        """Удаляет сам файл, не глядя на ссылки; для сборки мусора."""
+        self.backend.delete(name)
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def listdir(self, path):
+        return self.backend.listdir(path)
+
+    def size(self, name):
+        return self.backend.size(name)
+
+    def url(self, name):
+        return self.backend.url(name)
+
+    def path(self, name):
+        return self.backend.path(name)
+
+    def get_accessed_time(self, name):
+        return self.backend.get_accessed_time(name)
+
+    def get_created_time(self, name):
+        return self.backend.get_created_time(name)
+
+    def get_modified_time(self, name):
+        return self.backend.get_modified_time(name)
+
+
+blob_storage = ContentAddressedStorage()
+
+
+def retain(name):
+    """Учитывает новую ссылку на файл. Файлы не из хранилища по хешу
+    (загруженные до него) строк Blob не имеют и не считаются."""
+    if name:
+        Blob.objects.filter(name=name).update(
+            refs=F('refs') + 1, unused_since=None
+        )
+
+
+def release(name):
+    if not name:
+        return
+    Blob.objects.filter(name=name, refs__gt=0).update(refs=F('refs') - 1)
+    Blob.objects.filter(name=name, refs=0, unused_since=None).update(
+        unused_since=timezone.now()
+    )
+
+
+def collect(batch_size=100, grace=None, storage=blob_storage):
+    """Удаляет файлы без ссылок, пролежавшие дольше grace секунд.
+
+    Файлы выбираются пачками по batch_size, каждый удаляется в своей
+    транзакции. Возвращает число удалённых файлов.
+    """
+    if grace is None:
+        grace = settings.BLOB_GRACE_PERIOD
+    deadline = timezone.now() - timedelta(seconds=grace)
+    unused = Blob.objects.filter(refs=0, unused_since__lt=deadline)
+    removed = 0
+    while True:
+        batch = list(unused.order_by('pk').values_list('pk', 'name')[
+            :batch_size
+        ])
+        for pk, name in batch:
+            with transaction.atomic():
+                # Ссылка могла появиться, пока шла пачка.
+                if not unused.filter(pk=pk).delete()[0]:
+                    continue
+                storage.delete(name)
+            blob_collected.send(sender=Blob, name=name)
+            removed += 1
+        if len(batch) < batch_size:
+            return removed
+
+
+def references():
+    """Сколько раз каждое имя встречается в файловых полях моделей,
+    которые хранят файлы в ContentAddressedStorage."""
+    counts = Counter()
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, models.FileField) and isinstance(
+                field.storage, ContentAddressedStorage
+            ):
+                counts.update(
+                    model._base_manager.exclude(
+                        **{field.name: ''}
+                    ).values_list(field.name, flat=True).iterator()
+                )
+    return counts
+
+
+def recount():
+    """Пересчитывает ссылки по данным моделей. Возвращает число
+    исправленных файлов."""
+    counts = references()
+    now = timezone.now()
+    fixed = 0
+    for blob in Blob.objects.iterator():
+        refs = counts.get(blob.name, 0)
+        if refs == blob.refs:
+            continue
+        Blob.objects.filter(pk=blob.pk).update(
+            refs=refs,
+            unused_since=None if refs else blob.unused_since or now,
+        )
+        fixed += 1
+    return fixed
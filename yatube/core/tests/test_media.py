@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from ..media import parse_range, Unsatisfiable
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+HASHED = 'posts/ab/cd/' + 'abcd' * 16 + '.jpg'
+CONTENT = bytes(range(256)) * 4
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ServeMediaTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for name in ('old.jpg', HASHED):
+            path = os.path.join(TEMP_MEDIA_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def get(self, name, **headers):
+        return self.client.get(settings.MEDIA_URL + name, **headers)
+
+    def test_whole_file_and_caching(self):
+        response = self.get('old.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Content-Length'], str(len(CONTENT)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        response.close()
+        not_modified = self.get(
+            'old.jpg', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertEqual(not_modified['Cache-Control'], 'public, max-age=3600')
+        response = self.get(HASHED)
+        self.assertIn('immutable', response['Cache-Control'])
+        response.close()
+
+    def test_byte_ranges(self):
+        cases = {
+            'bytes=10-19': (10, 19),
+            'bytes=1000-': (1000, 1023),
+            'bytes=-4': (1020, 1023),
+            'bytes=1020-5000': (1020, 1023),
+        }
+        for header, (start, end) in cases.items():
+            with self.subTest(header):
+                response = self.get(HASHED, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(
+                    b''.join(response.streaming_content),
+                    CONTENT[start:end + 1]
+                )
+                self.assertEqual(
+                    response['Content-Range'], f'bytes {start}-{end}/1024'
+                )
+                self.assertEqual(
+                    response['Content-Length'], str(end - start + 1)
+                )
+                response.close()
+        response = self.get(HASHED, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+        # Файл изменился с If-Range — отдаётся целиком.
+        response = self.get(
+            HASHED, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"other"'
+        )
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_parse_range(self):
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 10))
+        self.assertIsNone(parse_range('bytes=5-1', 10))
+        self.assertIsNone(parse_range('items=0-1', 10))
+        with self.assertRaises(Unsatisfiable):
+            parse_range('bytes=-0', 10)
+
+    def test_missing_and_outside_paths(self):
+        for name in ('missing.jpg', '../settings.py', 'posts/'):
+            with self.subTest(name):
+                self.assertEqual(self.get(name).status_code, 404)
+        response = self.client.post(settings.MEDIA_URL + 'old.jpg')
+        self.assertEqual(response.status_code, 405)
+
+    def test_sendfile_offload(self):
+        with self.settings(MEDIA_SENDFILE='x-accel-redirect'):
+            response = self.get(HASHED)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/internal-media/' + HASHED
+        )
+        self.assertIn('immutable', response['Cache-Control'])
+        with self.settings(MEDIA_SENDFILE='x-sendfile'):
+            response = self.get('old.jpg')
+        self.assertEqual(
+            response['X-Sendfile'], os.path.join(TEMP_MEDIA_ROOT, 'old.jpg')
+        )
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.urls import path
+
+from . import media, views
+
+
+app_name = 'core'
+
+urlpatterns = [
+    path('metrics/', views.metrics_text, name='metrics'),
+    path('metrics.json', views.metrics_json, name='metrics_json'),
+]
+
+# Медиафайлы со своего адреса; MEDIA_URL на другом домене раздаёт CDN.
+if settings.MEDIA_URL.startswith('/'):
+    urlpatterns.append(path(
+        settings.MEDIA_URL.lstrip('/') + '<path:path>', media.serve,
+        name='media'
+    ))
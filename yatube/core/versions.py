@@ -0,0 +1,59 @@
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+# Версии храним без срока: устаревшая версия хуже лишнего промаха.
+VERSION_TIMEOUT = None
+
+# Открытые recording(): в каждое попадают имена из bump.
+_recorders = []
+
+
+def _key(name):
+    return f'version:{name}'
+
+
+def _new_version():
+    # Время в наносекундах: не повторяется после потери ключа в кеше
+    # и заодно говорит, когда объект менялся в последний раз.
+    return time.time_ns()
+
+
+def get_versions(*names):
+    """Текущие версии объектов; отсутствующие заводятся заново."""
+    keys = [_key(name) for name in names]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            version = _new_version()
+            if not cache.add(key, version, VERSION_TIMEOUT):
+                version = cache.get(key, version)
+            found[key] = version
+    return [found[key] for key in keys]
+
+
+def bump(*names):
+    """Новые версии объектов: всё, что закешировано по старым, устаревает."""
+    version = _new_version()
+    cache.set_many(
+        {_key(name): version for name in names}, VERSION_TIMEOUT
+    )
+    for recorder in _recorders:
+        recorder.update(names)
+
+
+@contextmanager
+def recording():
+    """Собирает имена версий, сменённых внутри блока.
+
+    Нужно, когда записи блока откатываются: по новым версиям в кеше
+    остались страницы с откатанными данными, и после отката эти версии
+    надо сменить ещё раз.
+    """
+    names = set()
+    _recorders.append(names)
+    try:
+        yield names
+    finally:
+        _recorders.remove(names)
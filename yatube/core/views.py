@@ -1,5 +1,12 @@
+import hmac
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render
 
+from . import metrics
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию;
@@ -17,3 +24,42 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, "core/403.html", status=403)
+
+
+def _check_metrics_access(request):
+    # Метрики видят только сотрудники и сборщик с токеном. Адрес клиента
+    # не в счёт: за прокси на той же машине он всегда 127.0.0.1.
+    if request.user.is_staff:
+        return
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not token or not hmac.compare_digest(header, f'Bearer {token}'):
+        raise Http404
+
+
+def _cache_stats():
+    return cache.stats() if hasattr(cache, 'stats') else {}
+
+
+def metrics_text(request):
+    """Метрики представлений в текстовом формате Prometheus."""
+    _check_metrics_access(request)
+    extra = []
+    for event in ('hits', 'misses'):
+        name = f'yatube_cache_{event}_total'
+        extra.append(f'# TYPE {name} counter')
+        for tier, stats in _cache_stats().items():
+            extra.append(f'{name}{{tier="{tier}"}} {stats[event]}')
+    return HttpResponse(
+        metrics.prometheus(metrics.registry.snapshot(), extra),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+def metrics_json(request):
+    """Те же метрики в JSON."""
+    _check_metrics_access(request)
+    return JsonResponse({
+        'views': metrics.registry.snapshot(),
+        'cache': _cache_stats(),
+    })
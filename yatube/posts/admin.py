@@ -1,8 +1,32 @@
 from django.contrib import admin
+
+from core.admin import LargeTableAdminMixin
 from .models import Post, Group, Follow, Comment
+from .search import comment_filter, post_filter
+
+
+class IndexSearchMixin:
+    """Поиск в админке по полнотекстовому индексу вместо LIKE '%...%'."""
+
+    search_filter = None
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(**self.search_filter(search_term)), False
 
 
-class PostAdmin(admin.ModelAdmin):
+class GroupAdmin(admin.ModelAdmin):
+    list_display = (
+        'title',
+        'slug',
+        'posts_count',
+    )
+    search_fields = ('title', 'slug',)
+
+
+class PostAdmin(IndexSearchMixin, LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'text',
@@ -12,33 +36,48 @@ class PostAdmin(admin.ModelAdmin):
         'image',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group',)
+    # Поле id вместо <select> со всеми группами в каждой строке.
+    raw_id_fields = ('author', 'group',)
+    # Каждая строка — форма с виджетом группы, рендер дороже запроса.
+    list_per_page = 50
     search_fields = ('text',)
+    search_filter = staticmethod(post_filter)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
     empty_value_display = '-пусто-'
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(IndexSearchMixin, LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         'created',
         'post',
         'author',
         'text',
     )
-    search_fields = ('author', 'post', 'text',)
+    list_select_related = ('post', 'author',)
+    raw_id_fields = ('post', 'author',)
+    search_fields = ('text',)
+    search_filter = staticmethod(comment_filter)
     list_filter = ('created',)
+    date_hierarchy = 'created'
     empty_value_display = '-пусто-'
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'user',
         'author',
     )
-    search_fields = ('user', 'author',)
+    list_select_related = ('user', 'author',)
+    raw_id_fields = ('user', 'author',)
+    # Точное имя пользователя ищется по уникальному индексу.
+    search_fields = ('=user__username', '=author__username',)
+    date_hierarchy = 'created'
 
 
 admin.site.register(Post, PostAdmin)
-admin.site.register(Group)
+admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
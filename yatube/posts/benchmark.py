@@ -0,0 +1,119 @@
+import math
+from urllib.parse import urlencode
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from .models import Group, Post
+
+User = get_user_model()
+
+# Адрес клиента вне INTERNAL_IPS: иначе в замер попадёт debug_toolbar.
+CLIENT_ADDR = '10.0.0.2'
+
+# Колонки отчёта по каждому представлению.
+REPORT_FIELDS = ('rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries')
+# Что сравнивается с эталоном: True — больше лучше, False — меньше лучше.
+# p99 на сотнях запросов слишком шумный, он только в отчёте.
+GATED_FIELDS = {
+    'rps': True,
+    'p50_ms': False,
+    'p95_ms': False,
+    'queries': False,
+}
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу; values уже отсортированы."""
+    if not values:
+        return 0
+    rank = max(math.ceil(share * len(values)), 1)
+    return values[rank - 1]
+
+
+def pick_fixtures():
+    """Самые «тяжёлые» объекты базы для замеров.
+
+    Читатель — с наибольшим числом подписок, автор — с наибольшим
+    числом постов, группа — самая большая, пост — последний.
+    """
+    reader = User.objects.order_by('-stats__following_count', 'pk').first()
+    author = User.objects.order_by('-stats__posts_count', 'pk').first()
+    group = Group.objects.order_by('-posts_count', 'pk').first()
+    post = Post.objects.order_by('-pub_date', '-pk').first()
+    if None in (reader, author, group, post):
+        raise ValueError(
+            'Для замеров нужны пользователи, группа и посты: '
+            'заполните базу командой generate_data'
+        )
+    return {'reader': reader, 'author': author, 'group': group, 'post': post}
+
+
+def scenarios(fixtures):
+    """Запросы по представлениям: имя -> (метод, адрес, данные)."""
+    post_id = fixtures['post'].pk
+    return {
+        'posts:index': ('get', reverse('posts:index'), None),
+        'posts:group_list': ('get', reverse(
+            'posts:group_list', kwargs={'slug': fixtures['group'].slug}
+        ), None),
+        'posts:profile': ('get', reverse(
+            'posts:profile', kwargs={'username': fixtures['author'].username}
+        ), None),
+        'posts:post_detail': ('get', reverse(
+            'posts:post_detail', kwargs={'post_id': post_id}
+        ), None),
+        'posts:post_comments': ('get', reverse(
+            'posts:post_comments', kwargs={'post_id': post_id}
+        ), None),
+        'posts:follow_index': ('get', reverse('posts:follow_index'), None),
+        'posts:search': ('get', '{}?{}'.format(
+            reverse('posts:search'),
+            urlencode({'q': ' '.join(fixtures['post'].text.split()[:2])}),
+        ), None),
+        'posts:add_comment': ('post', reverse(
+            'posts:add_comment', kwargs={'post_id': post_id}
+        ), {'text': 'Комментарий для замера'}),
+        'posts:post_create': ('post', reverse('posts:post_create'), {
+            'text': 'Пост для замера'
+        }),
+    }
+
+
+def summarize(latencies, queries, elapsed, errors):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'queries': round(sum(queries) / len(queries), 1) if queries else 0,
+    }
+
+
+def regressions(results, baseline, threshold):
+    """Отличия от эталона хуже, чем на долю threshold.
+
+    Число запросов к базе не зависит от скорости машины, поэтому для
+    него любой рост — регрессия.
+    """
+    found = []
+    for view, result in results.items():
+        reference = baseline.get(view)
+        if reference is None:
+            continue
+        for field, higher_is_better in GATED_FIELDS.items():
+            old, new = reference.get(field), result[field]
+            if old is None:
+                continue
+            if field == 'queries':
+                worse = new > old
+            elif higher_is_better:
+                worse = new < old / (1 + threshold)
+            else:
+                worse = new > old * (1 + threshold)
+            if worse:
+                found.append(f'{view}: {field} {old} -> {new}')
+    return found
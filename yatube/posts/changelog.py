@@ -0,0 +1,122 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from core.versions import bump
+from .models import Change, Follow, Post
+
+
+def record(kind, action, object_id, post_id, author_id, group_id):
+    Change.objects.create(
+        kind=kind,
+        action=action,
+        object_id=object_id,
+        post_id=post_id,
+        author_id=author_id,
+        group_id=group_id,
+    )
+    bump('changes')
+    # Запрос между bump и коммитом запомнил бы ETag без этой записи и
+    # получал бы 304 до следующего изменения.
+    transaction.on_commit(lambda: bump('changes'))
+
+
+def record_post(post, action, group_id=None):
+    """Изменение поста; group_id — если запись для другой группы."""
+    record(
+        Change.POST, action, post.pk, post.pk, post.author_id,
+        post.group_id if group_id is None else group_id,
+    )
+
+
+def record_comment(comment, action):
+    """Изменение комментария попадает в ленты его поста."""
+    if comment.post_id is None:
+        return
+    keys = Post.objects.filter(pk=comment.post_id).values_list(
+        'author_id', 'group_id'
+    ).first()
+    if keys is None:
+        return
+    record(Change.COMMENT, action, comment.pk, comment.post_id, *keys)
+
+
+def feed_filter(group=None, author=None, follower=None):
+    """Условие журнала для ленты: общей, группы, автора или подписок."""
+    if group is not None:
+        return {'group_id': group.pk}
+    if author is not None:
+        return {'author_id': author.pk}
+    if follower is not None:
+        return {'author_id__in': Follow.objects.filter(
+            user=follower
+        ).values('author_id')}
+    return {}
+
+
+def latest_cursor():
+    return Change.objects.aggregate(value=Max('pk'))['value'] or 0
+
+
+def expired(since):
+    """Записи после since уже удалены из журнала: клиенту нужна
+    полная перезагрузка ленты."""
+    oldest = Change.objects.aggregate(value=Min('pk'))['value']
+    return oldest is not None and since + 1 < oldest
+
+
+def changes_since(since, feed, limit):
+    """Записи ленты после since: (последние по объекту, курсор, есть ли ещё).
+
+    Читается не больше limit записей по индексу (лента, id), поэтому
+    работа зависит от числа изменений, а не от размера ленты. Из
+    нескольких записей об одном объекте остаётся последняя.
+
+    id выдаётся при вставке, а видна запись после коммита: в PostgreSQL
+    транзакция с меньшим id может закоммититься позже большего. Поэтому
+    курсор не заходит за записи моложе CHANGELOG_SAFETY_LAG секунд —
+    они придут и в следующем ответе, клиент просто заменит объект ещё
+    раз. Пока курсор придержан, more ложно: клиент спросит позже.
+    """
+    rows = list(
+        Change.objects.filter(pk__gt=since, **feed).order_by('pk')[:limit + 1]
+    )
+    more = len(rows) > limit
+    rows = rows[:limit]
+    latest = {}
+    for change in rows:
+        key = (change.kind, change.object_id)
+        latest.pop(key, None)
+        latest[key] = change
+    cursor = settled_cursor(rows, since)
+    more = more and cursor == rows[-1].pk
+    return list(latest.values()), cursor, more
+
+
+def settled_cursor(rows, since):
+    """id последней записи, перед которой все старше окна
+    CHANGELOG_SAFETY_LAG: за ней уже не закоммитится запись с меньшим id."""
+    settled = timezone.now() - timedelta(
+        seconds=settings.CHANGELOG_SAFETY_LAG
+    )
+    cursor = since
+    for change in rows:
+        if change.created > settled:
+            break
+        cursor = change.pk
+    return cursor
+
+
+def prune(days=None):
+    """Удаляет записи старше days дней; последняя запись остаётся,
+    чтобы курсор не терял опору."""
+    if days is None:
+        days = settings.CHANGELOG_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = Change.objects.filter(
+        created__lt=cutoff, pk__lt=latest_cursor()
+    ).delete()
+    return deleted
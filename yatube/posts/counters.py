@@ -0,0 +1,68 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def _increment(queryset, field, delta):
+    if delta < 0:
+        # Счётчик не уходит ниже нуля, даже если успел разойтись с данными.
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def bump_group(group_id, delta):
+    if group_id is not None:
+        _increment(Group.objects.filter(pk=group_id), 'posts_count', delta)
+
+
+def bump_post(post_id, delta):
+    if post_id is not None:
+        _increment(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def bump_user(user_id, field, delta):
+    """Сдвигает счётчик пользователя, заводя запись при первом росте."""
+    queryset = UserStats.objects.filter(user_id=user_id)
+    if not _increment(queryset, field, delta) and delta > 0:
+        UserStats.objects.get_or_create(user_id=user_id)
+        _increment(queryset, field, delta)
+
+
+def user_stats(user):
+    """Счётчики пользователя; пустые, если записи ещё нет."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats(user=user)
+
+
+def _count(queryset, field):
+    """Подзапрос «число строк queryset на значение поля field»."""
+    counts = (
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def rebuild_counters():
+    """Пересчитывает все счётчики по данным таблиц."""
+    UserStats.objects.bulk_create(
+        [
+            UserStats(user_id=pk)
+            for pk in User.objects.filter(stats__isnull=True)
+            .values_list('pk', flat=True)
+            .iterator()
+        ],
+    )
+    Group.objects.update(posts_count=_count(Post.objects, 'group'))
+    Post.objects.update(comments_count=_count(Comment.objects, 'post'))
+    UserStats.objects.update(
+        posts_count=_count(Post.objects, 'author'),
+        followers_count=_count(Follow.objects, 'author'),
+        following_count=_count(Follow.objects, 'user'),
+    )
@@ -1,12 +1,93 @@
-from .models import Post, Comment
+import uuid
+
 from django import forms
 
+from . import uploads
+from .models import Post, Comment, ImageUpload
+
 
 class PostForm(forms.ModelForm):
+    """Пост с картинкой, принятой потоком или загруженной частями.
+
+    Файл от ImageUploadHandler уже проверен по заголовку; отвергнутый
+    при приёме приходит как RejectedUpload и превращается в ошибку поля.
+    Картинка, загруженная частями, приходит не файлом, а id загрузки в
+    поле upload (отдельным полем формы оно не объявлено). Перед
+    сохранением картинка проходит uploads.prepare_image. Загрузку
+    частями форма убирает после сохранения поста, поэтому при
+    save(commit=False) нужен form.save_m2m() после post.save().
+    """
+
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+        self.image_upload = None
+        self.image_error = None
+        image = self.files.get('image')
+        if isinstance(image, uploads.RejectedUpload):
+            self.image_error = image.error
+            self.files = self.files.copy()
+            del self.files['image']
+
+    def clean_image(self):
+        if self.image_error is not None:
+            raise forms.ValidationError(
+                self.image_error, code='invalid_image'
+            )
+        image = self.cleaned_data.get('image')
+        if getattr(image, 'image_format', None) is not None:
+            try:
+                image = uploads.prepare_image(image)
+            except uploads.UploadRejected as error:
+                raise forms.ValidationError(
+                    str(error), code='invalid_image'
+                )
+        return image
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload_id = self.data.get('upload')
+        if not upload_id or 'image' in self.files or self.image_error:
+            return cleaned_data
+        try:
+            upload = ImageUpload.objects.filter(
+                pk=uuid.UUID(upload_id), user=self.user
+            ).first()
+        except ValueError:
+            upload = None
+        if upload is None or not upload.complete or not upload.format:
+            self.add_error('image', 'Картинка загружена не полностью')
+            return cleaned_data
+        image = uploads.PartialUploadedFile(
+            uploads.part_path(upload.pk),
+            upload.name,
+            uploads.CONTENT_TYPES[upload.format],
+            upload.size,
+        )
+        try:
+            cleaned_data['image'] = uploads.prepare_image(image)
+        except uploads.UploadRejected as error:
+            image.close()
+            self.add_error('image', str(error))
+            return cleaned_data
+        self.image_upload = upload
+        return cleaned_data
+
+    def _save_m2m(self):
+        super()._save_m2m()
+        # Сюда доходит только после сохранения поста (при commit=False —
+        # из form.save_m2m()): файл части хранилище переносит в
+        # post.save(), а если такая картинка уже была, он остаётся и
+        # удаляется здесь.
+        if self.image_upload is not None:
+            self.cleaned_data['image'].close()
+            uploads.discard(self.image_upload)
+            self.image_upload = None
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,50 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.signals import invalidate_post
+from posts.thumbnails import update_placeholder
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Считает заглушки для картинок постов, у которых их ещё нет, и '
+        'сбрасывает закешированные страницы с этими постами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов выбирать за раз.',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').filter(
+            image_color=''
+        ).only('image', 'author', 'group').prefetch_related(
+            'thumbnails'
+        ).order_by('pk')
+        done = failed = last_pk = 0
+        while True:
+            batch = list(
+                posts.filter(pk__gt=last_pk)[:options['batch_size']]
+            )
+            for post in batch:
+                try:
+                    if update_placeholder(post):
+                        invalidate_post(post)
+                except Exception:
+                    logger.exception('Не удалось посчитать заглушку поста %s',
+                                     post.pk)
+                    failed += 1
+                else:
+                    done += 1
+            if len(batch) < options['batch_size']:
+                break
+            last_pk = batch[-1].pk
+        self.stdout.write(self.style.SUCCESS(
+            f'Заглушки посчитаны для постов: {done}, с ошибкой: {failed}'
+        ))
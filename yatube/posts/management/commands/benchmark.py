@@ -0,0 +1,158 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+
+from core.versions import bump, recording
+from posts.benchmark import (
+    CLIENT_ADDR, REPORT_FIELDS, pick_fixtures, regressions, scenarios,
+    summarize
+)
+
+
+class QueryCounter:
+    """Обёртка connection.execute_wrapper, считающая запросы к базе."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет скорость представлений posts на текущей базе и сравнивает '
+        'результат с сохранённым эталоном. Записи откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--views', nargs='+', metavar='VIEW',
+            help='Только эти представления, например posts:index.',
+        )
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кеш перед каждым запросом.',
+        )
+        parser.add_argument(
+            '--baseline',
+            default=os.path.join(settings.BASE_DIR, 'benchmarks',
+                                 'baseline.json'),
+            help='Файл эталона.',
+        )
+        parser.add_argument(
+            '--save', action='store_true',
+            help='Сохранить результат как новый эталон.',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимое ухудшение относительно эталона (0.2 = 20%%).',
+        )
+        parser.add_argument('--output', help='Записать результат в JSON.')
+
+    def handle(self, *args, **options):
+        try:
+            fixtures = pick_fixtures()
+        except ValueError as error:
+            raise CommandError(error)
+        plan = scenarios(fixtures)
+        views = options['views'] or list(plan)
+        unknown = set(views) - set(plan)
+        if unknown:
+            raise CommandError(f'Неизвестные представления: {unknown}')
+
+        client = Client(REMOTE_ADDR=CLIENT_ADDR)
+        client.force_login(fixtures['reader'])
+        results = self.run(client, plan, views, options)
+        self.report(results)
+
+        data = {
+            'requests': options['requests'],
+            'cold': options['cold'],
+            'views': results,
+        }
+        if options['output']:
+            self.write(options['output'], data)
+        if options['save']:
+            self.write(options['baseline'], data)
+            self.stdout.write(f'Эталон сохранён: {options["baseline"]}')
+            return
+        if not os.path.exists(options['baseline']):
+            self.stdout.write('Эталона нет, сравнивать не с чем.')
+            return
+        with open(options['baseline'], encoding='utf-8') as file:
+            baseline = json.load(file)
+        if baseline['cold'] != options['cold']:
+            raise CommandError(
+                'Эталон снят с другим режимом кеша (--cold), '
+                'сравнивать нельзя'
+            )
+        found = regressions(results, baseline['views'], options['threshold'])
+        if found:
+            raise CommandError('Регрессии:\n' + '\n'.join(found))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def run(self, client, plan, views, options):
+        """Замеры по представлениям.
+
+        Комментарии и посты замера не должны остаться ни в базе, ни в
+        кеше: каждый запрос откатывается, а версии, сменённые за замер,
+        после него меняются ещё раз.
+        """
+        results = {}
+        with recording() as touched:
+            try:
+                for view in views:
+                    results[view] = self.measure(
+                        client, *plan[view], options
+                    )
+            finally:
+                bump('site', *touched)
+        return results
+
+    def measure(self, client, method, url, data, options):
+        send = getattr(client, method)
+        for _ in range(options['warmup']):
+            with transaction.atomic():
+                send(url, data)
+                transaction.set_rollback(True)
+        latencies, queries, errors = [], [], 0
+        for _ in range(options['requests']):
+            if options['cold']:
+                cache.clear()
+            counter = QueryCounter()
+            # Своя короткая транзакция на запрос: база не заперта на
+            # запись всё время замера.
+            with transaction.atomic():
+                with connection.execute_wrapper(counter):
+                    start = time.perf_counter()
+                    response = send(url, data)
+                    latencies.append(time.perf_counter() - start)
+                transaction.set_rollback(True)
+            queries.append(counter.count)
+            if response.status_code not in (200, 302):
+                errors += 1
+        return summarize(latencies, queries, sum(latencies), errors)
+
+    def report(self, results):
+        header = ['view'] + list(REPORT_FIELDS) + ['errors']
+        self.stdout.write(''.join(f'{name:>12}' for name in header))
+        for view, result in results.items():
+            row = [view.split(':')[-1]] + [
+                result[field] for field in header[1:]
+            ]
+            self.stdout.write(''.join(f'{value:>12}' for value in row))
+
+    def write(self, path, data):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False, indent=2)
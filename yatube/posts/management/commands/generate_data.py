@@ -0,0 +1,329 @@
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import AutoField, DateTimeField, Max
+from django.utils import timezone
+
+from core.versions import bump
+from posts.models import Comment, Follow, Group, Post, User
+
+WORDS = (
+    'пост лента автор группа подписка новости сегодня вчера завтра город '
+    'фото котик кофе работа отпуск море лес книга фильм музыка дождь '
+    'солнце утро вечер ночь дорога дом друзья проект код релиз ошибка '
+    'тест база кеш запрос страница'
+).split()
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Пётр', 'Ольга', 'Сергей', 'Елена')
+LAST_NAMES = ('Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов')
+
+# Доля постов, опубликованных в группе.
+GROUP_SHARE = 0.7
+# Вероятность, что следующий пост напишет тот же автор (серия постов).
+SAME_AUTHOR = 0.5
+# Доля коротких интервалов между постами и их средняя длина
+# относительно среднего интервала: посты идут всплесками.
+BURST_SHARE = 0.8
+BURST_GAP = 0.1
+# Среднее время до комментария после публикации, с.
+COMMENT_DELAY = 6 * 60 * 60
+# Тексты берутся из заранее собранного набора: склеивать слова
+# для каждой из миллионов строк заметно дольше самой вставки.
+TEXT_POOL = 4096
+
+
+def zipf_weights(size, alpha):
+    """Накопленные веса степенного распределения по рангам 1..size."""
+    return list(accumulate(1 / rank ** alpha for rank in range(1, size + 1)))
+
+
+class ChunkWriter:
+    """Пишет строки таблицы модели порциями по chunk штук.
+
+    Строки вставляются одним подготовленным INSERT через executemany,
+    без создания объектов модели и компиляции запроса на каждую порцию:
+    при миллионах строк это в разы быстрее bulk_create. Поля, которых
+    нет в ``fields``, получают значения по умолчанию, автоключ — от базы.
+    ``depends`` — писатель, чьи строки нужно сохранить раньше (посты
+    раньше их комментариев).
+    """
+
+    def __init__(self, model, fields, chunk, depends=None):
+        opts = model._meta
+        given = [opts.get_field(name) for name in fields]
+        rest = [
+            field for field in opts.concrete_fields
+            if field not in given and not isinstance(field, AutoField)
+        ]
+        self.dates = [
+            position for position, field in enumerate(given)
+            if isinstance(field, DateTimeField)
+        ]
+        self.defaults = tuple(
+            field.get_db_prep_save(field.get_default(), connection)
+            for field in rest
+        )
+        quote = connection.ops.quote_name
+        columns = [quote(field.column) for field in given + rest]
+        self.sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote(opts.db_table),
+            ', '.join(columns),
+            ', '.join(['%s'] * len(columns)),
+        )
+        self.chunk = chunk
+        self.depends = depends
+        self.rows = []
+        self.written = 0
+
+    def add(self, *values):
+        if self.dates:
+            values = list(values)
+            for position in self.dates:
+                values[position] = connection.ops.adapt_datetimefield_value(
+                    values[position]
+                )
+        self.rows.append(tuple(values) + self.defaults)
+        if len(self.rows) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        if self.depends is not None:
+            self.depends.flush()
+        if self.rows:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(self.sql, self.rows)
+            self.written += len(self.rows)
+            self.rows = []
+
+
+def next_pk(model):
+    return (model.objects.aggregate(pk=Max('pk'))['pk'] or 0) + 1
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими данными: пользователи, группы, '
+        'посты, комментарии и подписки с неравномерным распределением.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней разбросаны посты.',
+        )
+        parser.add_argument(
+            '--alpha', type=float, default=1.1,
+            help='Показатель степенного распределения популярности.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk', type=int, default=50000)
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help='Не пересчитывать счётчики, ленты подписок и поиск.',
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['chunk'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь и chunk > 0')
+        self.options = options
+        self.seed = options['seed']
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=options['days'])
+        self.step('Пользователи', self.create_users)
+        self.step('Группы', self.create_groups)
+        self.step('Подписки', self.create_follows)
+        self.step('Посты и комментарии', self.create_posts)
+        self.reset_sequences()
+        if not options['no_rebuild']:
+            call_command('rebuild_counters', stdout=self.stdout)
+            call_command('rebuild_timelines', stdout=self.stdout)
+            call_command('rebuild_search', stdout=self.stdout)
+        bump('site', 'feed')
+
+    def rng(self, name):
+        # Свой генератор на каждую сущность: добавление новой не сдвигает
+        # данные остальных при том же seed.
+        return random.Random(f'{self.seed}:{name}')
+
+    def step(self, title, method):
+        started = time.monotonic()
+        written = method()
+        self.stdout.write(
+            f'{title}: {written} за {time.monotonic() - started:.1f} с'
+        )
+
+    def create_users(self):
+        rng = self.rng('users')
+        self.first_user = next_pk(User)
+        password = make_password(None)
+        writer = ChunkWriter(
+            User,
+            ('id', 'username', 'first_name', 'last_name', 'password'),
+            self.options['chunk'],
+        )
+        for pk in range(
+            self.first_user, self.first_user + self.options['users']
+        ):
+            writer.add(
+                pk,
+                f'user{pk}',
+                rng.choice(FIRST_NAMES),
+                rng.choice(LAST_NAMES),
+                password,
+            )
+        writer.flush()
+        # Популярность: ранг в степенном распределении у случайного
+        # пользователя, отдельно для подписчиков и для числа постов.
+        self.popular = list(range(self.options['users']))
+        rng.shuffle(self.popular)
+        self.prolific = list(range(self.options['users']))
+        rng.shuffle(self.prolific)
+        self.user_weights = zipf_weights(
+            self.options['users'], self.options['alpha']
+        )
+        return writer.written
+
+    def create_groups(self):
+        first = next_pk(Group)
+        writer = ChunkWriter(
+            Group,
+            ('id', 'title', 'slug', 'description'),
+            self.options['chunk'],
+        )
+        for pk in range(first, first + self.options['groups']):
+            writer.add(
+                pk, f'Группа {pk}', f'group-{pk}', f'Описание группы {pk}'
+            )
+        writer.flush()
+        self.group_ids = list(range(first, first + self.options['groups']))
+        self.group_weights = zipf_weights(
+            self.options['groups'], self.options['alpha']
+        )
+        return writer.written
+
+    def pick_user(self, rng, ranking):
+        rank = rng.choices(ranking, cum_weights=self.user_weights)[0]
+        return self.first_user + rank
+
+    def create_follows(self):
+        rng = self.rng('follows')
+        users = self.options['users']
+        left = self.options['follows']
+        average = left / users if users else 0
+        writer = ChunkWriter(
+            Follow, ('user', 'author', 'created'), self.options['chunk']
+        )
+        for user_id in range(self.first_user, self.first_user + users):
+            if left <= 0 or not average:
+                break
+            wanted = min(self.skewed(rng, average), users - 1, left)
+            authors = set()
+            for _ in range(wanted * 3):
+                if len(authors) == wanted:
+                    break
+                author_id = self.pick_user(rng, self.popular)
+                if author_id != user_id:
+                    authors.add(author_id)
+            for author_id in sorted(authors):
+                writer.add(
+                    user_id,
+                    author_id,
+                    self.start + timedelta(
+                        seconds=rng.uniform(0, self.span())
+                    ),
+                )
+            left -= len(authors)
+        writer.flush()
+        return writer.written
+
+    def skewed(self, rng, mean):
+        """Целое с заданным средним и длинным хвостом."""
+        return int(rng.expovariate(1 / mean) + rng.random())
+
+    def span(self):
+        return (self.now - self.start).total_seconds()
+
+    def gaps(self, rng, count):
+        """Интервалы между постами: много коротких, изредка длинные."""
+        mean = self.span() / max(count, 1)
+        burst = mean * BURST_GAP
+        calm = mean * (1 - BURST_SHARE * BURST_GAP) / (1 - BURST_SHARE)
+        while True:
+            if rng.random() < BURST_SHARE:
+                yield rng.expovariate(1 / burst)
+            else:
+                yield rng.expovariate(1 / calm)
+
+    def texts(self, rng):
+        return [
+            ' '.join(rng.choices(WORDS, k=rng.randint(5, 40))).capitalize()
+            for _ in range(TEXT_POOL)
+        ]
+
+    def create_posts(self):
+        rng = self.rng('posts')
+        count = self.options['posts']
+        users = self.options['users']
+        comments_per_post = self.options['comments'] / max(count, 1)
+        texts = self.texts(rng)
+        first = next_pk(Post)
+        posts = ChunkWriter(
+            Post,
+            ('id', 'text', 'pub_date', 'author', 'group'),
+            self.options['chunk'],
+        )
+        comments = ChunkWriter(
+            Comment,
+            ('post', 'author', 'text', 'created'),
+            self.options['chunk'],
+            posts,
+        )
+        offset = 0
+        author_id = None
+        gaps = self.gaps(rng, count)
+        for pk in range(first, first + count):
+            offset += next(gaps)
+            pub_date = min(self.start + timedelta(seconds=offset), self.now)
+            if author_id is None or rng.random() >= SAME_AUTHOR:
+                author_id = self.pick_user(rng, self.prolific)
+            group_id = None
+            if self.group_ids and rng.random() < GROUP_SHARE:
+                group_id = rng.choices(
+                    self.group_ids, cum_weights=self.group_weights
+                )[0]
+            posts.add(pk, rng.choice(texts), pub_date, author_id, group_id)
+            if not comments_per_post:
+                continue
+            # Комментарии пишутся вместе с постом, пока известна его дата.
+            for _ in range(self.skewed(rng, comments_per_post)):
+                delay = timedelta(seconds=rng.expovariate(1 / COMMENT_DELAY))
+                comments.add(
+                    pk,
+                    self.first_user + rng.randrange(users),
+                    rng.choice(texts),
+                    min(pub_date + delay, self.now),
+                )
+        comments.flush()
+        self.stdout.write(f'Комментарии: {comments.written}')
+        return posts.written
+
+    def reset_sequences(self):
+        # Ключи заданы явно: счётчики автоинкремента (PostgreSQL)
+        # нужно догнать, иначе следующие вставки упадут на дубликатах.
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [User, Group, Post, Comment, Follow]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
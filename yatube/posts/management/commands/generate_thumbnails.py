@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import process, process_in_thread, stale_posts
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Готовит недостающие миниатюры для уже загруженных картинок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать миниатюры всех постов с картинками.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.THUMBNAIL_WORKERS,
+            help='Число потоков; 0 — в текущем потоке.',
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            post_ids = self.all_post_ids()
+        else:
+            post_ids = (post.pk for post in stale_posts(
+                batch_size=BATCH_SIZE
+            ))
+        done = 0
+        while True:
+            # Пачками: список постов к обработке не растёт с таблицей.
+            batch = list(islice(post_ids, BATCH_SIZE))
+            if not batch:
+                break
+            self.process(batch, options['workers'])
+            done += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюры подготовлены для постов: {done}'
+        ))
+
+    def all_post_ids(self):
+        posts = Post.objects.exclude(image='').order_by('pk').values_list(
+            'pk', flat=True
+        )
+        last_pk = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[:BATCH_SIZE])
+            yield from batch
+            if len(batch) < BATCH_SIZE:
+                return
+            last_pk = batch[-1]
+
+    def process(self, post_ids, workers):
+        if workers:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(process_in_thread, post_ids))
+        else:
+            for post_id in post_ids:
+                process(post_id)
@@ -0,0 +1,257 @@
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from http.client import HTTPConnection
+from socketserver import ThreadingMixIn
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import got_request_exception
+from django.db import OperationalError
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.test import Client
+
+from posts.benchmark import CLIENT_ADDR, pick_fixtures, scenarios, summarize
+from posts.models import Comment, Post
+from yatube.wsgi import application
+
+User = get_user_model()
+
+# Обычная смесь: в основном анонимное чтение главной.
+DEFAULT_MIX = 'index=80,follow_index=10,add_comment=5,post_create=5'
+# Представления, которые открывают без входа на сайт.
+ANONYMOUS = {'index', 'group_list', 'profile', 'post_detail'}
+# Метка текста, по которой записи нагрузки удаляются после прогона.
+MARKER = '[loadtest]'
+LOCKED = 'database is locked'
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def parse_mix(value, known):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in known:
+            raise CommandError(f'Неизвестное представление в смеси: {name}')
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise CommandError(f'Неверный вес в смеси: {part}')
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        'Поднимает многопоточный WSGI-сервер с yatube и нагружает его '
+        'смесью запросов из нескольких потоков. Записи нагрузки удаляются '
+        'после прогона; запускайте на копии базы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--requests', type=int, default=0,
+            help='Сколько запросов делает каждый поток; 0 — сколько '
+                 'успеет за --duration.',
+        )
+        parser.add_argument(
+            '--mix', default=DEFAULT_MIX,
+            help='Веса запросов, например index=80,follow_index=20.',
+        )
+        parser.add_argument(
+            '--users', type=int, default=20,
+            help='Сколько пользователей входят на сайт.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Не удалять посты и комментарии нагрузки.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            fixtures = pick_fixtures()
+        except ValueError as error:
+            raise CommandError(error)
+        plan = {
+            view.split(':')[-1]: scenario
+            for view, scenario in scenarios(fixtures).items()
+        }
+        mix = parse_mix(options['mix'], plan)
+        self.sessions = self.login(options['users'])
+        self.server_errors = Counter()
+        self.errors_lock = threading.Lock()
+
+        got_request_exception.connect(self.record_exception)
+        # Исключения сервера собираются в отчёт; трассировки каждого
+        # «database is locked» в консоли только мешают его читать.
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        server = make_server(
+            '127.0.0.1', 0, self.wrap(application),
+            server_class=ThreadingWSGIServer, handler_class=QuietHandler,
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        start = time.monotonic()
+        try:
+            samples = self.run_clients(server.server_port, plan, mix, options)
+            elapsed = time.monotonic() - start
+        finally:
+            server.shutdown()
+            server.server_close()
+            got_request_exception.disconnect(self.record_exception)
+            request_logger.setLevel(level)
+            if not options['keep']:
+                self.cleanup()
+        self.report(samples, elapsed)
+
+    def wrap(self, application):
+        def wrapped(environ, start_response):
+            # Адрес вне INTERNAL_IPS: debug_toolbar не должен попасть
+            # в замер.
+            environ['REMOTE_ADDR'] = CLIENT_ADDR
+            return application(environ, start_response)
+        return wrapped
+
+    def login(self, count):
+        """Cookie сессий и CSRF для самых активных читателей."""
+        readers = User.objects.order_by(
+            '-stats__following_count', 'pk'
+        )[:count]
+        sessions = []
+        for user in readers:
+            client = Client()
+            client.force_login(user)
+            request = HttpRequest()
+            token = get_token(request)
+            session = client.cookies[settings.SESSION_COOKIE_NAME].value
+            sessions.append({
+                'Cookie': '{}={}; {}={}'.format(
+                    settings.SESSION_COOKIE_NAME, session,
+                    settings.CSRF_COOKIE_NAME, request.META['CSRF_COOKIE'],
+                ),
+                'X-CSRFToken': token,
+            })
+        return sessions
+
+    def record_exception(self, sender, request=None, **kwargs):
+        error = sys.exc_info()[1]
+        if error is None:
+            return
+        key = f'{type(error).__name__}: {str(error)[:80]}'
+        with self.errors_lock:
+            self.server_errors[key] += 1
+
+    def run_clients(self, port, plan, mix, options):
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        deadline = time.monotonic() + options['duration']
+        limit = options['requests'] or None
+        samples = defaultdict(list)
+        lock = threading.Lock()
+
+        def client(number):
+            rng = random.Random(f'{options["seed"]}:{number}')
+            local = defaultdict(list)
+            sent = 0
+            while time.monotonic() < deadline and sent != limit:
+                name = rng.choices(names, weights)[0]
+                local[name].append(self.send(port, name, plan[name], rng))
+                sent += 1
+            with lock:
+                for name, items in local.items():
+                    samples[name].extend(items)
+
+        threads = [
+            threading.Thread(target=client, args=(number,))
+            for number in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples
+
+    def send(self, port, name, scenario, rng):
+        """Один запрос: (время, статус или имя исключения)."""
+        method, url, data = scenario
+        headers = {}
+        if name not in ANONYMOUS:
+            if not self.sessions:
+                return 0, 'no session'
+            headers.update(rng.choice(self.sessions))
+        body = None
+        if method == 'post':
+            data = {key: f'{MARKER} {value}' for key, value in data.items()}
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        connection = HTTPConnection('127.0.0.1', port, timeout=60)
+        start = time.perf_counter()
+        try:
+            connection.request(method.upper(), url, body, headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except OSError as error:
+            status = type(error).__name__
+        finally:
+            connection.close()
+        return time.perf_counter() - start, status
+
+    def cleanup(self):
+        # Удаление через модели: сигналы вернут счётчики и ленты.
+        for model in (Comment, Post):
+            for obj in model.objects.filter(text__startswith=MARKER):
+                try:
+                    obj.delete()
+                except OperationalError as error:
+                    self.stderr.write(f'Не удалось удалить {obj!r}: {error}')
+
+    def report(self, samples, duration):
+        header = [
+            'view', 'requests', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'errors'
+        ]
+        self.stdout.write(''.join(f'{name:>12}' for name in header))
+        total = 0
+        failures = Counter()
+        for name, items in sorted(samples.items()):
+            latencies = [latency for latency, _ in items]
+            errors = [
+                status for _, status in items
+                if not isinstance(status, int) or status >= 400
+            ]
+            failures.update(f'{name}: {status}' for status in errors)
+            result = summarize(latencies, [], duration, len(errors))
+            total += len(items)
+            row = [name] + [result[field] for field in header[1:]]
+            self.stdout.write(''.join(f'{value:>12}' for value in row))
+        self.stdout.write(
+            f'Всего: {total} запросов, {total / duration:.1f} в секунду'
+        )
+        for failure, count in failures.most_common():
+            self.stdout.write(f'Ошибка {failure}: {count}')
+        for error, count in self.server_errors.most_common():
+            self.stdout.write(f'Исключение на сервере {error}: {count}')
+        locked = sum(
+            count for error, count in self.server_errors.items()
+            if LOCKED in error
+        )
+        self.stdout.write(f'Блокировки SQLite ({LOCKED}): {locked}')
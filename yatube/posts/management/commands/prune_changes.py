@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.changelog import prune
+
+
+class Command(BaseCommand):
+    help = 'Удаляет старые записи журнала изменений.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.CHANGELOG_RETENTION_DAYS,
+            help='Сколько последних дней журнала оставить.',
+        )
+
+    def handle(self, *args, **options):
+        deleted = prune(options['days'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Удалено записей журнала: {deleted}')
+        )
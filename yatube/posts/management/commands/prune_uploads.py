@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.uploads import prune
+
+
+class Command(BaseCommand):
+    help = 'Удаляет брошенные загрузки картинок частями.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age', type=int, default=settings.UPLOAD_SESSION_TTL,
+            help='Сколько секунд хранить незавершённую загрузку.',
+        )
+
+    def handle(self, *args, **options):
+        removed = prune(options['max_age'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Удалено загрузок и файлов: {removed}')
+        )
@@ -1,7 +1,10 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 
 from core.models import CreatedModel
+from core.storage import blob_storage
 
 User = get_user_model()
 
@@ -18,6 +21,10 @@ class Group(models.Model):
     description = models.TextField(
         verbose_name='Описание группы',
         help_text='Опишите группу')
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов',
+        default=0,
+        editable=False)
 
     class Meta:
         verbose_name_plural = 'Группы'
@@ -26,6 +33,30 @@ class Group(models.Model):
         return self.title
 
 
+# Колонки, которые нужны карточке поста в ленте.
+FEED_FIELDS = (
+    'text',
+    'pub_date',
+    'image',
+    'image_placeholder',
+    'image_color',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group__title',
+    'group__slug',
+)
+
+
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        """Лента: автор и группа одним запросом, без лишних колонок,
+        и готовые миниатюры вторым."""
+        return self.select_related('author', 'group').only(
+            *FEED_FIELDS
+        ).prefetch_related('thumbnails')
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст поста',
@@ -56,18 +87,59 @@ class Post(models.Model):
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='posts/',
+        storage=blob_storage,
         help_text='Аватар профиля',
         blank=True
     )
+    # Заглушка на время загрузки миниатюры: крошечный PNG в data URI и
+    # основной цвет. Считаются вместе с миниатюрами.
+    image_placeholder = models.TextField(
+        verbose_name='Заглушка картинки',
+        blank=True,
+        editable=False
+    )
+    image_color = models.CharField(
+        verbose_name='Цвет картинки',
+        max_length=7,
+        blank=True,
+        editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Число комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ["-pub_date"]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Индексы под ключ ленты (pub_date, id) для каждого пути доступа.
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        # Счётчики обновляются в post_save — в той же транзакции.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class Comment(CreatedModel):
     post = models.ForeignKey(
@@ -94,10 +166,25 @@ class Comment(CreatedModel):
     class Meta:
         ordering = ["-created"]
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='comment_post_created_idx'
+            ),
+            # Сортировка и date_hierarchy в админке.
+            models.Index(
+                fields=['-created', '-id'],
+                name='comment_created_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class Follow(CreatedModel):
     user = models.ForeignKey(
@@ -120,3 +207,234 @@ class Follow(CreatedModel):
                 name='unique follows'
             )]
         unique_together = ('user', 'author',)
+        # Подписчики автора — для раскладки постов по лентам.
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx'
+            ),
+            # Сортировка и date_hierarchy в админке.
+            models.Index(
+                fields=['-created', '-id'],
+                name='follow_created_idx'
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов',
+        default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Число подписчиков',
+        default=0
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Число подписок',
+        default=0
+    )
+
+    class Meta:
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class TimelineEntry(models.Model):
+    """Пост в ленте подписок читателя, разложенный при публикации."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    # Копия даты поста, чтобы лента читалась по индексу одной таблицы.
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique timeline entry'
+            )]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='timeline_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
+
+
+class Thumbnail(models.Model):
+    """Заранее подготовленный вариант миниатюры картинки поста:
+    размер alias в одной из ширин и одном из форматов."""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='thumbnails',
+        verbose_name='Пост'
+    )
+    alias = models.CharField(
+        verbose_name='Размер',
+        max_length=32
+    )
+    # Имя исходной картинки: при замене картинки миниатюра устаревает.
+    source = models.CharField(
+        verbose_name='Исходная картинка',
+        max_length=255
+    )
+    url = models.CharField(
+        verbose_name='Адрес',
+        max_length=255
+    )
+    format = models.CharField(
+        verbose_name='Формат',
+        max_length=8,
+        default='JPEG'
+    )
+    width = models.PositiveIntegerField(verbose_name='Ширина')
+    height = models.PositiveIntegerField(verbose_name='Высота')
+
+    class Meta:
+        verbose_name_plural = 'Миниатюры'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'alias', 'format', 'width'],
+                name='unique thumbnail variant'
+            )]
+
+    def __str__(self):
+        return f'{self.post_id}: {self.alias}'
+
+
+class Change(models.Model):
+    """Запись журнала изменений постов и комментариев.
+
+    По нему клиент забирает только то, что изменилось после курсора
+    (id записи), не перечитывая ленту. Ссылки хранятся числами без
+    внешних ключей: запись об удалении переживает сам объект.
+    """
+    POST = 'post'
+    COMMENT = 'comment'
+    KINDS = [
+        (POST, 'Пост'),
+        (COMMENT, 'Комментарий'),
+    ]
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTIONS = [
+        (CREATED, 'Создан'),
+        (UPDATED, 'Изменён'),
+        (DELETED, 'Удалён'),
+    ]
+    kind = models.CharField(
+        verbose_name='Объект',
+        max_length=16,
+        choices=KINDS
+    )
+    action = models.CharField(
+        verbose_name='Действие',
+        max_length=16,
+        choices=ACTIONS
+    )
+    object_id = models.PositiveIntegerField(verbose_name='id объекта')
+    post_id = models.PositiveIntegerField(verbose_name='id поста')
+    # Автор и группа поста — по ним изменение попадает в ленты,
+    # в том числе изменение комментария к этому посту.
+    author_id = models.PositiveIntegerField(verbose_name='id автора поста')
+    group_id = models.PositiveIntegerField(
+        verbose_name='id группы поста',
+        null=True
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now_add=True
+    )
+
+    class Meta:
+        verbose_name_plural = 'Журнал изменений'
+        indexes = [
+            models.Index(
+                fields=['author_id', 'id'],
+                name='change_author_idx'
+            ),
+            models.Index(
+                fields=['group_id', 'id'],
+                name='change_group_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.pk}: {self.kind} {self.object_id} {self.action}'
+
+
+class ImageUpload(CreatedModel):
+    """Картинка поста, которая загружается частями.
+
+    Куски дописываются в файл uploads.part_path(id); после обрыва
+    клиент узнаёт received и продолжает с этого места.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='image_uploads',
+        verbose_name='Пользователь'
+    )
+    name = models.CharField(verbose_name='Имя файла', max_length=255)
+    size = models.PositiveIntegerField(verbose_name='Размер')
+    received = models.PositiveIntegerField(
+        verbose_name='Принято байт',
+        default=0
+    )
+    # Формат по заголовку; пусто, пока заголовок не принят целиком.
+    format = models.CharField(
+        verbose_name='Формат',
+        max_length=8,
+        blank=True
+    )
+
+    class Meta:
+        verbose_name_plural = 'Загрузки картинок'
+
+    def __str__(self):
+        return f'{self.name}: {self.received}/{self.size}'
+
+    @property
+    def complete(self):
+        return self.received == self.size
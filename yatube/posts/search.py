@@ -0,0 +1,175 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Comment, Post
+
+# Таблицы полнотекстового индекса SQLite FTS5. В индексе постов rowid
+# совпадает с id поста, в индексе комментариев — с id комментария.
+POST_INDEX = 'posts_post_fts'
+COMMENT_INDEX = 'posts_comment_fts'
+# Совпадение в комментарии весит меньше совпадения в тексте поста.
+# bm25 отрицателен (чем меньше, тем лучше), поэтому множитель < 1.
+COMMENT_WEIGHT = 0.5
+COMMENT_WINDOW = 5
+
+WORD = re.compile(r'\w+')
+
+
+def enabled():
+    """Индекс есть только в SQLite; в остальных базах — поиск по LIKE."""
+    return connection.vendor == 'sqlite'
+
+
+def match_query(text):
+    """Запрос FTS5 из пользовательской строки.
+
+    Каждое слово берётся в кавычки (спецсимволы FTS не сработают) и
+    ищется как префикс: «котик» найдёт и «котики». Все слова обязательны.
+    """
+    return ' '.join(f'"{word}"*' for word in WORD.findall(text.lower()))
+
+
+def index_post(post):
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {POST_INDEX} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {POST_INDEX} (rowid, text) VALUES (%s, %s)',
+            [post.pk, post.text],
+        )
+
+
+def unindex_post(post_id):
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {POST_INDEX} WHERE rowid = %s', [post_id])
+
+
+def unindex_post_comments(post_id):
+    """Убирает из индекса комментарии поста перед его удалением.
+
+    Комментарии удалённого поста остаются в базе без поста (SET_NULL),
+    в выдаче им делать нечего. Столбец post_id в FTS5 не индексирован,
+    поэтому строки находятся по rowid через таблицу комментариев, пока
+    связь с постом ещё не обнулена.
+    """
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {COMMENT_INDEX} WHERE rowid IN ('
+            f'SELECT id FROM {Comment._meta.db_table} WHERE post_id = %s)',
+            [post_id],
+        )
+
+
+def index_comment(comment):
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {COMMENT_INDEX} WHERE rowid = %s', [comment.pk]
+        )
+        if comment.post_id is None:
+            return
+        cursor.execute(
+            f'INSERT INTO {COMMENT_INDEX} (rowid, text, post_id) '
+            'VALUES (%s, %s, %s)',
+            [comment.pk, comment.text, comment.post_id],
+        )
+
+
+def unindex_comment(comment_id):
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {COMMENT_INDEX} WHERE rowid = %s', [comment_id]
+        )
+
+
+def rebuild_index():
+    """Заполняет индекс заново по таблицам постов и комментариев."""
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {POST_INDEX}')
+        cursor.execute(
+            f'INSERT INTO {POST_INDEX} (rowid, text) '
+            f'SELECT id, text FROM {Post._meta.db_table}'
+        )
+        cursor.execute(f'DELETE FROM {COMMENT_INDEX}')
+        cursor.execute(
+            f'INSERT INTO {COMMENT_INDEX} (rowid, text, post_id) '
+            f'SELECT id, text, post_id FROM {Comment._meta.db_table} '
+            'WHERE post_id IS NOT NULL'
+        )
+        for table in (POST_INDEX, COMMENT_INDEX):
+            cursor.execute(
+                f"INSERT INTO {table} ({table}) VALUES ('optimize')"
+            )
+
+
+def ranked_post_ids(text, limit, offset=0):
+    """id постов по убыванию релевантности: текст поста и комментарии.
+
+    Каждый индекс отдаёт только лучшие строки (ORDER BY rank LIMIT у FTS5
+    не сортирует все совпадения), затем окна сливаются по лучшему рангу
+    поста. У поста может быть несколько подходящих комментариев, поэтому
+    окно комментариев берётся в COMMENT_WINDOW раз шире.
+    """
+    query = match_query(text)
+    if not query:
+        return []
+    if not enabled():
+        posts = Post.objects.filter(text__icontains=text).order_by(
+            '-pub_date', '-pk'
+        )
+        return list(
+            posts.values_list('pk', flat=True)[offset:offset + limit]
+        )
+    window = offset + limit
+    sql = (
+        'SELECT post_id FROM ('
+        'SELECT * FROM ('
+        f'SELECT rowid AS post_id, rank FROM {POST_INDEX} '
+        f'WHERE {POST_INDEX} MATCH %s ORDER BY rank LIMIT %s'
+        ') UNION ALL SELECT * FROM ('
+        f'SELECT post_id, rank * %s AS rank FROM {COMMENT_INDEX} '
+        f'WHERE {COMMENT_INDEX} MATCH %s ORDER BY rank LIMIT %s'
+        ')) GROUP BY post_id ORDER BY MIN(rank), post_id DESC '
+        'LIMIT %s OFFSET %s'
+    )
+    params = [
+        query, window,
+        COMMENT_WEIGHT, query, window * COMMENT_WINDOW,
+        limit, offset,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _index_filter(table, text):
+    query = match_query(text)
+    if not enabled():
+        return {'text__icontains': text}
+    if not query:
+        return {'pk__in': []}
+    return {'pk__in': RawSQL(
+        f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [query]
+    )}
+
+
+def post_filter(text):
+    """Условие для queryset постов (админка): по индексу, без ранжирования."""
+    return _index_filter(POST_INDEX, text)
+
+
+def comment_filter(text):
+    """Условие для queryset комментариев (админка)."""
+    return _index_filter(COMMENT_INDEX, text)
@@ -0,0 +1,228 @@
+from django.db.models import DEFERRED
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from core import storage
+from core.versions import bump
+from . import changelog, counters, search, thumbnails, timeline
+from .models import Change, Comment, Follow, Group, Post, User, UserStats
+
+
+# Поля пользователя, которые показываются на страницах.
+USER_DISPLAY_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def _profiles(*user_ids):
+    return [
+        f'profile:{username}' for username in User.objects.filter(
+            pk__in=user_ids
+        ).values_list('username', flat=True)
+    ]
+
+
+def _groups(*group_ids):
+    group_ids = [pk for pk in group_ids if pk not in (None, DEFERRED)]
+    if not group_ids:
+        return []
+    return [
+        f'group:{slug}' for slug in Group.objects.filter(
+            pk__in=group_ids
+        ).values_list('slug', flat=True)
+    ]
+
+
+def _image_name(post):
+    image = post.__dict__.get('image')
+    return getattr(image, 'name', image) or ''
+
+
+def invalidate_post(post, *group_ids):
+    """Сбрасывает карточку поста и страницы лент, где он виден."""
+    bump(
+        f'post:{post.pk}',
+        'feed',
+        *_profiles(post.author_id),
+        *_groups(post.group_id, *group_ids),
+    )
+
+
+def _user_display(user):
+    return tuple(
+        user.__dict__.get(field, DEFERRED) for field in USER_DISPLAY_FIELDS
+    )
+
+
+@receiver(post_init, sender=User)
+def remember_user_state(sender, instance, **kwargs):
+    # Запоминаем то, что пользователь видит на страницах, чтобы сбрасывать
+    # их только при смене имени, а не при входе или смене пароля.
+    instance._saved_display = _user_display(instance)
+
+
+def _user_pages(user, old_username):
+    """Версии страниц, где видно имя пользователя: его карточки, профиль,
+    ленты с его постами и комментарии под постами."""
+    usernames = {user.username, old_username} - {DEFERRED}
+    group_ids = Post.objects.filter(author=user).exclude(
+        group=None
+    ).values_list('group_id', flat=True).distinct()
+    post_ids = Comment.objects.filter(author=user).values_list(
+        'post_id', flat=True
+    ).distinct()
+    return [
+        f'user:{user.pk}',
+        'feed',
+        *(f'profile:{username}' for username in usernames),
+        *_groups(*group_ids),
+        *(f'comments:{post_id}' for post_id in post_ids),
+    ]
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, update_fields=None,
+               **kwargs):
+    if created:
+        if not raw:
+            UserStats.objects.get_or_create(user=instance)
+        # Новый пользователь нигде не показан, кроме своего профиля.
+        bump(f'profile:{instance.username}')
+    elif (
+        update_fields is None
+        or set(update_fields) & set(USER_DISPLAY_FIELDS)
+    ):
+        saved = instance._saved_display
+        if saved != _user_display(instance):
+            bump(*_user_pages(instance, saved[0]))
+    instance._saved_display = _user_display(instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    bump(f'user:{instance.pk}', 'site')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Карточки помечены id группы, страницы — slug: у них разные имена
+    # версий, иначе группа со slug «5» совпала бы с группой id 5.
+    bump(f'group-card:{instance.pk}', 'site')
+
+
+@receiver(post_init, sender=Post)
+def remember_post_state(sender, instance, **kwargs):
+    # Запоминаем группу, чтобы при правке перенести счётчик,
+    # и картинку, чтобы пересоздать миниатюры только при её замене.
+    instance._saved_group_id = instance.__dict__.get('group_id', DEFERRED)
+    instance._saved_image = _image_name(instance)
+
+
+def _text_changed(update_fields):
+    return update_fields is None or 'text' in update_fields
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, update_fields=None,
+               **kwargs):
+    if raw:
+        return
+    if _text_changed(update_fields):
+        search.index_post(instance)
+    old_group_id = instance._saved_group_id
+    if created:
+        counters.bump_group(instance.group_id, 1)
+        counters.bump_user(instance.author_id, 'posts_count', 1)
+        timeline.fan_out(instance)
+    elif old_group_id not in (DEFERRED, instance.group_id):
+        counters.bump_group(old_group_id, -1)
+        counters.bump_group(instance.group_id, 1)
+        # Для ленты прежней группы перенесённый пост удалён.
+        if old_group_id is not None:
+            changelog.record_post(instance, Change.DELETED, old_group_id)
+    changelog.record_post(
+        instance, Change.CREATED if created else Change.UPDATED
+    )
+    image = _image_name(instance)
+    if image != instance._saved_image or created and image:
+        thumbnails.schedule(instance)
+        storage.retain(image)
+        if not created:
+            storage.release(instance._saved_image)
+            # Заглушка прежней картинки новой не подходит.
+            instance.image_placeholder = instance.image_color = ''
+            Post.objects.filter(pk=instance.pk).update(
+                image_placeholder='', image_color=''
+            )
+    invalidate_post(instance, old_group_id)
+    instance._saved_group_id = instance.group_id
+    instance._saved_image = image
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    # После удаления у комментариев уже не будет post_id.
+    search.unindex_post_comments(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_group(instance.group_id, -1)
+    counters.bump_user(instance.author_id, 'posts_count', -1)
+    search.unindex_post(instance.pk)
+    changelog.record_post(instance, Change.DELETED)
+    storage.release(_image_name(instance))
+    invalidate_post(instance)
+
+
+@receiver(thumbnails.thumbnails_ready)
+def thumbnails_ready(sender, post, **kwargs):
+    # Готовые миниатюры заменяют заглушку в карточке и лентах.
+    invalidate_post(post)
+
+
+@receiver(storage.blob_collected)
+def blob_collected(sender, name, **kwargs):
+    thumbnails.forget(name)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, update_fields=None,
+                  **kwargs):
+    if raw:
+        return
+    if created:
+        counters.bump_post(instance.post_id, 1)
+    if _text_changed(update_fields):
+        search.index_comment(instance)
+    changelog.record_comment(
+        instance, Change.CREATED if created else Change.UPDATED
+    )
+    bump(f'comments:{instance.post_id}')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_post(instance.post_id, -1)
+    search.unindex_comment(instance.pk)
+    changelog.record_comment(instance, Change.DELETED)
+    bump(f'comments:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_user(instance.author_id, 'followers_count', 1)
+        counters.bump_user(instance.user_id, 'following_count', 1)
+        timeline.backfill(instance.user_id, instance.author_id)
+        bump(*_profiles(instance.user_id, instance.author_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, 'followers_count', -1)
+    counters.bump_user(instance.user_id, 'following_count', -1)
+    timeline.trim(instance.user_id, instance.author_id)
+    timeline.follower_removed(instance.author_id)
+    bump(*_profiles(instance.user_id, instance.author_id))
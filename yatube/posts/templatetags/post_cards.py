@@ -0,0 +1,79 @@
+from collections import defaultdict
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from core.versions import get_versions
+from .. import thumbnails
+from ..uploads import CONTENT_TYPES
+
+register = template.Library()
+
+# Карточка меняется только вместе с версиями, поэтому живёт долго.
+CARD_TIMEOUT = 60 * 60 * 24
+CARD_TEMPLATE = 'posts/includes/post_list.html'
+
+
+def card_versions(post):
+    return [
+        f'post:{post.pk}',
+        f'user:{post.author_id}',
+        f'group-card:{post.group_id}',
+    ]
+
+
+@register.simple_tag
+def post_card(post):
+    """Карточка поста из кеша; ключ зависит от версий поста, автора, группы.
+
+    Одна и та же карточка используется на всех лентах.
+    """
+    versions = get_versions(*card_versions(post))
+    key = 'post_card:{}:{}'.format(post.pk, ':'.join(map(str, versions)))
+    card = cache.get(key)
+    if card is None:
+        card = get_template(CARD_TEMPLATE).render({'post': post})
+        cache.set(key, card, CARD_TIMEOUT)
+    return mark_safe(card)
+
+
+def srcset(thumbnails):
+    return ', '.join(
+        f'{thumbnail.url} {thumbnail.width}w'
+        for thumbnail in sorted(thumbnails, key=lambda item: item.width)
+    )
+
+
+@register.inclusion_tag('posts/includes/thumbnail.html')
+def post_thumbnail(post, alias='card'):
+    """<picture> с вариантами миниатюры поста или заглушка, пока их
+    готовит пул.
+
+    Источники идут в порядке THUMBNAIL_FORMATS, браузер берёт первый
+    понятный ему формат и ширину под sizes; <img> — JPEG основной ширины.
+    """
+    variants = defaultdict(list)
+    if post.image:
+        for item in post.thumbnails.all():
+            if item.alias == alias and item.source == post.image.name:
+                variants[item.format].append(item)
+    width, height = thumbnails.geometry(alias)
+    fallback = variants.pop(thumbnails.FALLBACK_FORMAT, [])
+    thumbnail = next(
+        (item for item in fallback if item.width == width), None
+    )
+    return {
+        'post': post,
+        'thumbnail': thumbnail,
+        'srcset': srcset(fallback),
+        'sources': [
+            {'type': CONTENT_TYPES[name], 'srcset': srcset(variants[name])}
+            for name in settings.THUMBNAIL_FORMATS if variants.get(name)
+        ],
+        'sizes': settings.THUMBNAIL_ALIASES[alias].get('sizes'),
+        'width': width,
+        'height': height,
+    }
@@ -0,0 +1,96 @@
+from datetime import datetime
+
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core.admin import IndexedDatesQuerySet
+from core.paginator import EstimatedCountPaginator
+from posts.models import Comment, Follow, Group, Post, User
+
+
+def moment(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class LargeTableAdminTest(TestCase):
+    """Списки админки без проходов по всей таблице."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        dates = [
+            moment(2025, 12, 31, 23), moment(2026, 3, 1),
+            moment(2026, 3, 5), moment(2026, 7, 9),
+        ]
+        cls.posts = []
+        for number, pub_date in enumerate(dates):
+            post = Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост {number}'
+            )
+            Post.objects.filter(pk=post.pk).update(pub_date=pub_date)
+            cls.posts.append(post)
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.author, text='Комментарий'
+        )
+        Follow.objects.create(user=cls.admin, author=cls.author)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def test_dates_match_default(self):
+        """Даты по индексу совпадают с обычным dates()."""
+        filters = [
+            {},
+            {'pub_date__gte': moment(2026, 1, 1)},
+            {'pub_date__gte': moment(2026, 3, 1),
+             'pub_date__lt': moment(2026, 4, 1)},
+            {'text__endswith': '2'},
+        ]
+        for lookups in filters:
+            for kind in ('year', 'month', 'day'):
+                with self.subTest(lookups=lookups, kind=kind):
+                    self.assertEqual(
+                        IndexedDatesQuerySet(model=Post).filter(
+                            **lookups
+                        ).dates('pub_date', kind),
+                        list(Post.objects.filter(**lookups).dates(
+                            'pub_date', kind
+                        )),
+                    )
+
+    def test_estimated_count(self):
+        """Таблица целиком оценивается, выборка считается до предела."""
+        Post.objects.filter(pk=self.posts[1].pk).delete()
+        paginator = EstimatedCountPaginator(Post.objects.all(), 2)
+        # Оценка по наибольшему id не замечает удалённую строку.
+        self.assertEqual(paginator.count, self.posts[-1].pk)
+        paginator = EstimatedCountPaginator(
+            Post.objects.filter(author=self.author), 2
+        )
+        paginator.count_limit = 2
+        self.assertEqual(paginator.count, 2)
+
+    def test_changelists(self):
+        """Списки открываются с date_hierarchy и поиском по имени."""
+        urls = [
+            (reverse('admin:posts_post_changelist'), {}),
+            (reverse('admin:posts_post_changelist'),
+             {'pub_date__year': 2026, 'pub_date__month': 3}),
+            (reverse('admin:posts_comment_changelist'), {}),
+            (reverse('admin:posts_follow_changelist'), {'q': 'author'}),
+        ]
+        for url, params in urls:
+            with self.subTest(url=url, params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response = self.client.get(
+            reverse('admin:posts_follow_changelist'), {'q': 'auth'}
+        )
+        self.assertEqual(response.context['cl'].result_count, 0)
@@ -0,0 +1,99 @@
+import time
+
+from django.core.cache import cache, caches
+from django.test import SimpleTestCase
+
+from core.cache import EPOCH_KEY, LOG_ENTRY_KEY, LOG_KEY, sync_local_tiers
+
+
+class TieredCacheTest(SimpleTestCase):
+    """Двухуровневый кеш: LRU процесса перед общим кешем."""
+
+    def setUp(self):
+        cache.clear()
+        self.shared = caches['shared']
+
+    def test_local_tier_serves_repeated_reads(self):
+        """Повторное чтение не идёт в общий кеш."""
+        cache.set('key', 'value')
+        self.shared.delete('key')
+        hits = cache.stats()['local']['hits']
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(cache.stats()['local']['hits'], hits + 1)
+
+    def test_shared_hit_fills_local_tier(self):
+        """Значение из общего кеша копируется в локальный уровень."""
+        self.shared.set('key', 'value')
+        stats = cache.stats()
+        self.assertEqual(cache.get_many(['key', 'missing']), {'key': 'value'})
+        self.assertEqual(cache.get('key'), 'value')
+        new_stats = cache.stats()
+        self.assertEqual(
+            new_stats['shared']['hits'], stats['shared']['hits'] + 1
+        )
+        self.assertEqual(
+            new_stats['shared']['misses'], stats['shared']['misses'] + 1
+        )
+        self.assertEqual(
+            new_stats['local']['hits'], stats['local']['hits'] + 1
+        )
+
+    def test_versions_bypass_local_tier(self):
+        """Версии всегда читаются из общего кеша."""
+        cache.set('version:post:1', 1)
+        self.shared.set('version:post:1', 2)
+        self.assertEqual(cache.get('version:post:1'), 2)
+
+    def test_epoch_change_clears_local_tier(self):
+        """Удаление в другом процессе сбрасывает локальные копии."""
+        cache.set('key', 'value')
+        self.shared.delete('key')
+        self.shared.set(EPOCH_KEY, 0, None)
+        sync_local_tiers(sender=None)
+        self.assertIsNone(cache.get('key'))
+
+    def test_local_copy_expires_with_shared_value(self):
+        """Копия не переживает срок значения в общем кеше."""
+        cache.set('key', 'value', 0)
+        self.assertIsNone(cache.get('key'))
+        cache.set('key', 'value', 30)
+        self.shared.delete('key')
+        self.assertEqual(cache.get('key'), 'value')
+        expires = cache.local._data[cache.make_key('key')][1]
+        self.assertLessEqual(expires - time.monotonic(), 30)
+
+    def test_delete_elsewhere_drops_only_that_key(self):
+        """Удаление в другом процессе сбрасывает только этот ключ."""
+        cache.set('kept', 'value')
+        cache.set('key', 'value')
+        sync_local_tiers(sender=None)
+        # Другой процесс: удаляет в общем кеше и пишет в журнал.
+        self.shared.delete('key')
+        self.shared.add(LOG_KEY, 0, None)
+        position = self.shared.incr(LOG_KEY)
+        self.shared.set(
+            LOG_ENTRY_KEY.format(position), [cache.make_key('key')]
+        )
+        sync_local_tiers(sender=None)
+        self.assertIsNone(cache.get('key'))
+        self.shared.delete('kept')
+        self.assertEqual(cache.get('kept'), 'value')
+
+    def test_incr_and_delete_do_not_clear_local_tier(self):
+        """incr и delete не меняют поколение и не трогают другие ключи."""
+        cache.set('kept', 'value')
+        cache.set('counter', 1)
+        epoch = self.shared.get(EPOCH_KEY)
+        self.assertEqual(cache.incr('counter'), 2)
+        cache.delete('missing')
+        self.assertEqual(self.shared.get(EPOCH_KEY), epoch)
+        sync_local_tiers(sender=None)
+        self.shared.delete('kept')
+        self.assertEqual(cache.get('kept'), 'value')
+        self.assertEqual(cache.get('counter'), 2)
+
+    def test_local_values_are_copies(self):
+        """Изменение полученного объекта не портит закешированный."""
+        cache.set('key', ['value'])
+        cache.get('key').append('other')
+        self.assertEqual(cache.get('key'), ['value'])
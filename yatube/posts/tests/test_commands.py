@@ -0,0 +1,224 @@
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db.models import F, Sum
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from core.versions import bump
+
+from ..management.commands.loadtest import MARKER, Command, parse_mix
+from ..models import (
+    Change, Comment, Follow, Group, Post, TimelineEntry, UserStats
+)
+
+User = get_user_model()
+
+
+class GenerateDataTest(TestCase):
+    """Генератор синтетических данных."""
+    SIZES = {
+        'users': 30,
+        'groups': 4,
+        'posts': 300,
+        'comments': 200,
+        'follows': 60,
+        'chunk': 50,
+    }
+
+    def generate(self, seed=1):
+        call_command(
+            'generate_data', seed=seed, stdout=StringIO(), **self.SIZES
+        )
+
+    def snapshot(self):
+        first_user = User.objects.order_by('pk').first().pk
+        first_post = Post.objects.order_by('pk').first().pk
+        return [
+            (post.pk - first_post, post.author_id - first_user, post.text)
+            for post in Post.objects.order_by('pk')
+        ]
+
+    def test_sizes_and_counters(self):
+        """Создаётся заданное число строк, счётчики и ленты пересчитаны."""
+        self.generate()
+        self.assertEqual(User.objects.count(), self.SIZES['users'])
+        self.assertEqual(Group.objects.count(), self.SIZES['groups'])
+        self.assertEqual(Post.objects.count(), self.SIZES['posts'])
+        self.assertTrue(
+            0 < Follow.objects.count() <= self.SIZES['follows']
+        )
+        self.assertTrue(Comment.objects.exists())
+        self.assertFalse(Follow.objects.filter(user=F('author')).exists())
+        self.assertEqual(
+            UserStats.objects.aggregate(total=Sum('posts_count'))['total'],
+            self.SIZES['posts']
+        )
+        self.assertTrue(TimelineEntry.objects.exists())
+
+    def test_posts_follow_time_order(self):
+        """Посты идут по времени в порядке ключей."""
+        self.generate()
+        dates = list(Post.objects.order_by('pk').values_list(
+            'pub_date', flat=True
+        ))
+        self.assertEqual(dates, sorted(dates))
+
+    def test_same_seed_same_data(self):
+        """Тот же seed даёт те же данные."""
+        self.generate()
+        first = self.snapshot()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.generate()
+        self.assertEqual(self.snapshot(), first)
+
+
+class BenchmarkTest(TestCase):
+    """Замеры представлений и сравнение с эталоном."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command(
+            'generate_data', users=10, groups=2, posts=30, comments=10,
+            follows=20, seed=1, stdout=StringIO(),
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.baseline = os.path.join(directory.name, 'baseline.json')
+
+    def benchmark(self, **options):
+        out = StringIO()
+        call_command(
+            'benchmark', requests=3, warmup=0, baseline=self.baseline,
+            stdout=out, **options
+        )
+        return out.getvalue()
+
+    def test_baseline_saved_and_writes_rolled_back(self):
+        """Эталон сохраняется по всем представлениям, записи откатываются."""
+        posts = Post.objects.count()
+        comments = Comment.objects.count()
+        self.benchmark(save=True)
+        with open(self.baseline, encoding='utf-8') as file:
+            views = json.load(file)['views']
+        self.assertIn('posts:follow_index', views)
+        self.assertIn('posts:post_create', views)
+        self.assertEqual(views['posts:index']['errors'], 0)
+        self.assertEqual(Post.objects.count(), posts)
+        self.assertEqual(Comment.objects.count(), comments)
+
+    def test_versions_changed_during_run_bumped_again(self):
+        """После отката версии, сменённые замером, меняются ещё раз."""
+        post = Post.objects.order_by('-pub_date', '-pk').first()
+        with mock.patch(
+            'posts.management.commands.benchmark.bump', wraps=bump
+        ) as bumped:
+            self.benchmark(views=['posts:add_comment'])
+        names = bumped.call_args[0]
+        self.assertIn('site', names)
+        self.assertIn(f'comments:{post.pk}', names)
+
+    def test_regression_fails(self):
+        """Рост числа запросов сверх эталона — ошибка."""
+        self.benchmark(save=True, views=['posts:index'])
+        self.assertIn('Регрессий нет', self.benchmark(
+            views=['posts:index'], threshold=100
+        ))
+        with open(self.baseline, encoding='utf-8') as file:
+            data = json.load(file)
+        data['views']['posts:index']['queries'] = 0
+        with open(self.baseline, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        with self.assertRaisesMessage(CommandError, 'posts:index: queries'):
+            self.benchmark(views=['posts:index'], threshold=100)
+
+
+class LoadTestMixTest(TestCase):
+    """Разбор смеси запросов нагрузки."""
+
+    def test_parse_mix(self):
+        known = {'index': None, 'follow_index': None}
+        self.assertEqual(
+            parse_mix('index=80, follow_index=20', known),
+            {'index': 80, 'follow_index': 20}
+        )
+        for mix in ('index=80,unknown=1', 'index=много'):
+            with self.subTest(mix=mix):
+                with self.assertRaises(CommandError):
+                    parse_mix(mix, known)
+
+
+class LoadTestRunTest(TransactionTestCase):
+    """Короткий прогон нагрузки на настоящем сервере."""
+
+    def setUp(self):
+        call_command(
+            'generate_data', users=5, groups=1, posts=10, comments=5,
+            follows=5, seed=1, stdout=StringIO(),
+        )
+
+    def test_requests_counted_and_writes_removed(self):
+        posts = Post.objects.count()
+        comments = Comment.objects.count()
+        written = []
+        cleanup = Command.cleanup
+
+        def counted_cleanup(command):
+            written.append(Comment.objects.filter(
+                text__startswith=MARKER
+            ).count())
+            cleanup(command)
+
+        out = StringIO()
+        with mock.patch.object(Command, 'cleanup', counted_cleanup):
+            call_command(
+                'loadtest', concurrency=2, requests=3, duration=60,
+                mix='index=1,add_comment=1', users=2, stdout=out,
+            )
+        report = out.getvalue()
+        self.assertIn('Всего: 6 запросов', report)
+        # Строки отчёта: view, requests, …, errors. Ошибками могут быть
+        # блокировки SQLite, но каждый удачный комментарий записан.
+        rows = {
+            row[0]: (int(row[1]), int(row[-1]))
+            for row in map(str.split, report.splitlines()[1:3])
+        }
+        self.assertEqual(set(rows), {'index', 'add_comment'})
+        self.assertEqual(sum(requests for requests, _ in rows.values()), 6)
+        requests, errors = rows['add_comment']
+        self.assertGreaterEqual(written[0], requests - errors)
+        self.assertEqual(Post.objects.count(), posts)
+        self.assertEqual(Comment.objects.count(), comments)
+        self.assertFalse(Comment.objects.filter(
+            text__startswith=MARKER
+        ).exists())
+
+
+class PruneChangesTest(TestCase):
+    """Очистка журнала изменений."""
+
+    def test_old_entries_removed(self):
+        author = User.objects.create_user(username='author')
+        posts = [
+            Post.objects.create(author=author, text=f'Пост {number}')
+            for number in range(3)
+        ]
+        Change.objects.filter(
+            object_id__in=[posts[0].pk, posts[2].pk]
+        ).update(created=timezone.now() - timedelta(days=30))
+        call_command('prune_changes', days=7, stdout=StringIO())
+        # Последняя запись остаётся, даже если она старая.
+        self.assertEqual(
+            list(Change.objects.values_list('object_id', flat=True)),
+            [posts[1].pk, posts[2].pk]
+        )
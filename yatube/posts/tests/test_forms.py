@@ -1,19 +1,25 @@
+import io
+import os
 import shutil
 import tempfile
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from http import HTTPStatus
 
-from ..models import Post, Group, User, Comment
+from ..models import Post, Group, User, Comment, ImageUpload
+from ..uploads import part_path
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -57,6 +63,8 @@ class PostFormTests(TestCase):
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
+        # Файл общий для тестов: после отправки он прочитан до конца.
+        self.uploaded.seek(0)
 
     def test_create_post(self):
         """Валидная форма создает запись в Post."""
@@ -118,3 +126,187 @@ class PostFormTests(TestCase):
         self.assertEqual(comment.text, form_data['text'])
         self.assertEqual(comment.post, PostFormTests.post)
         self.assertEqual(comment.author, PostFormTests.user)
+
+
+def jpeg_with_exif(size):
+    """JPEG с EXIF (модель камеры и поворот на 90°)."""
+    exif = Image.Exif()
+    exif[0x0110] = 'Тестовая камера'
+    exif[0x0112] = 6
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    UPLOAD_CHUNKS_DIR=os.path.join(TEMP_MEDIA_ROOT, 'parts'),
+    UPLOAD_IMAGE_MAX_SIDE=100,
+)
+class ImageUploadTests(TestCase):
+    """Приём картинок постов потоком и частями."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='uploader')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def create_post(self, **data):
+        return self.client.post(
+            reverse('posts:post_create'), {'text': 'Пост', **data}
+        )
+
+    def test_photo_rotated_cleaned_and_downscaled(self):
+        photo = SimpleUploadedFile('photo.jpg', jpeg_with_exif((300, 150)))
+        self.create_post(image=photo)
+        post = Post.objects.get(author=self.user)
+        with Image.open(post.image.path) as image:
+            # Повёрнута по EXIF и вписана в 100 точек.
+            self.assertEqual(image.size, (50, 100))
+            self.assertNotIn('exif', image.info)
+
+    def test_not_an_image_rejected(self):
+        cases = {
+            'text.jpg': b'just some text, not an image at all',
+            'broken.png': b'\x89PNG\r\n\x1a\n' + b'\x00' * 100,
+        }
+        for name, content in cases.items():
+            with self.subTest(name=name):
+                response = self.create_post(
+                    image=SimpleUploadedFile(name, content)
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertTrue(response.context['form'].errors['image'])
+        self.assertFalse(Post.objects.exists())
+
+    def test_truncated_image_rejected(self):
+        """Обрезанный JPEG с целым заголовком — ошибка поля, а не 500,
+        и при обычной загрузке, и при загрузке частями."""
+        buffer = io.BytesIO()
+        Image.effect_noise((300, 200), 64).convert('RGB').save(
+            buffer, 'JPEG'
+        )
+        content = buffer.getvalue()[:len(buffer.getvalue()) // 2]
+        response = self.create_post(
+            image=SimpleUploadedFile('photo.jpg', content)
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn('повреждён', response.context['form'].errors['image'][0])
+
+        response = self.client.post(
+            reverse('posts:upload_start'),
+            {'name': 'photo.jpg', 'size': len(content)},
+        )
+        state = self.put(
+            response.json()['url'], content, 0, len(content)
+        ).json()
+        self.assertTrue(state['complete'])
+        response = self.create_post(upload=state['id'])
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn('повреждён', response.context['form'].errors['image'][0])
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(UPLOAD_IMAGE_MAX_SIZE=1000)
+    def test_too_large_rejected_while_streaming(self):
+        photo = SimpleUploadedFile('photo.jpg', jpeg_with_exif((300, 300)))
+        response = self.create_post(image=photo)
+        self.assertIn('больше', response.context['form'].errors['image'][0])
+
+    def put(self, url, content, start, total):
+        return self.client.put(
+            url, content, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{start + len(content) - 1}/'
+                               f'{total}',
+        )
+
+    def test_chunked_upload_resumes(self):
+        content = jpeg_with_exif((80, 40))
+        response = self.client.post(
+            reverse('posts:upload_start'),
+            {'name': 'photo.jpg', 'size': len(content)},
+        )
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        url = response.json()['url']
+        half = len(content) // 2
+        self.assertEqual(
+            self.put(url, content[:half], 0, len(content)).json()['offset'],
+            half
+        )
+        # Кусок не с того места: сервер называет верный offset.
+        response = self.put(url, content[:10], 0, len(content))
+        self.assertEqual(response.status_code, HTTPStatus.CONFLICT)
+        self.assertEqual(self.client.get(url).json()['offset'], half)
+        state = self.put(url, content[half:], half, len(content)).json()
+        self.assertTrue(state['complete'])
+
+        self.create_post(upload=state['id'])
+        post = Post.objects.get(author=self.user)
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (40, 80))
+        self.assertFalse(ImageUpload.objects.exists())
+
+    def test_chunked_upload_of_stored_image(self):
+        """Если такая картинка уже есть, файл части не переносится и
+        удаляется после сохранения поста."""
+        buffer = io.BytesIO()
+        Image.new('RGB', (20, 10), 'blue').save(buffer, 'PNG')
+        content = buffer.getvalue()
+        stored = Post.objects.create(
+            author=self.user, text='Было',
+            image=SimpleUploadedFile('first.png', content),
+        )
+        response = self.client.post(
+            reverse('posts:upload_start'),
+            {'name': 'second.png', 'size': len(content)},
+        )
+        upload_id = response.json()['id']
+        state = self.put(
+            response.json()['url'], content, 0, len(content)
+        ).json()
+        self.assertTrue(state['complete'])
+
+        self.create_post(upload=upload_id)
+        post = Post.objects.exclude(pk=stored.pk).get()
+        self.assertEqual(post.image.name, stored.image.name)
+        self.assertFalse(ImageUpload.objects.exists())
+        self.assertFalse(os.path.exists(part_path(upload_id)))
+
+    def test_chunked_upload_checks_header(self):
+        response = self.client.post(
+            reverse('posts:upload_start'), {'name': 'a.jpg', 'size': 100}
+        )
+        upload_id = response.json()['id']
+        response = self.put(
+            response.json()['url'], b'not an image' * 2, 0, 100
+        )
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(ImageUpload.objects.exists())
+        self.assertFalse(os.path.exists(part_path(upload_id)))
+
+    def test_foreign_upload_not_used(self):
+        other = User.objects.create_user(username='other')
+        upload = ImageUpload.objects.create(
+            user=other, name='a.jpg', size=1, received=1, format='JPEG'
+        )
+        response = self.create_post(upload=upload.pk)
+        self.assertTrue(response.context['form'].errors['image'])
+
+    def test_stale_uploads_pruned(self):
+        upload = ImageUpload.objects.create(
+            user=self.user, name='a.jpg', size=10
+        )
+        self.put(
+            reverse('posts:upload_chunk', args=[upload.pk]),
+            jpeg_with_exif((10, 10))[:5], 0, 10,
+        )
+        call_command('prune_uploads', max_age=0, stdout=io.StringIO())
+        self.assertFalse(ImageUpload.objects.exists())
+        self.assertEqual(os.listdir(settings.UPLOAD_CHUNKS_DIR), [])
@@ -0,0 +1,84 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.metrics import registry
+
+from ..models import Post
+
+User = get_user_model()
+
+
+class MetricsTest(TestCase):
+    """Метрики представлений и их выгрузка."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+        registry.clear()
+        self.guest_client = Client(REMOTE_ADDR='10.0.0.1')
+        self.staff_client = Client(REMOTE_ADDR='10.0.0.1')
+        self.staff_client.force_login(MetricsTest.staff)
+
+    def test_view_metrics_recorded(self):
+        """Запрос к ленте попадает в гистограммы под именем представления."""
+        self.guest_client.get(reverse('posts:index'))
+        self.guest_client.get(reverse('posts:index'))
+        snapshot = registry.snapshot()
+        latency = snapshot['latency_seconds']['posts:index']
+        self.assertEqual(latency['count'], 2)
+        # Вторая страница берётся из кеша и не ходит в базу.
+        queries = snapshot['queries']['posts:index']
+        self.assertGreater(queries['sum'], 0)
+        self.assertEqual(queries['buckets'][0], [1, 1])
+        self.assertGreater(
+            snapshot['template_seconds']['posts:index']['sum'], 0
+        )
+        self.assertGreater(snapshot['cache_hits']['posts:index']['sum'], 0)
+        self.assertGreater(snapshot['cache_misses']['posts:index']['sum'], 0)
+
+    def test_metrics_hidden_from_guests(self):
+        """Метрики не видны посторонним."""
+        for name in ('core:metrics', 'core:metrics_json'):
+            with self.subTest(name=name):
+                response = self.guest_client.get(reverse(name))
+                self.assertEqual(response.status_code, 404)
+
+    def test_internal_address_is_not_enough(self):
+        """Адрес из INTERNAL_IPS доступа не даёт: за прокси он у всех."""
+        response = Client(REMOTE_ADDR='127.0.0.1').get(reverse('core:metrics'))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_grants_access(self):
+        """Сборщик метрик проходит по токену."""
+        url = reverse('core:metrics')
+        response = self.guest_client.get(
+            url, HTTP_AUTHORIZATION='Bearer secret'
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.guest_client.get(
+            url, HTTP_AUTHORIZATION='Bearer wrong'
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_prometheus_and_json_export(self):
+        """Сотрудник получает метрики в формате Prometheus и в JSON."""
+        self.guest_client.get(reverse('posts:index'))
+        response = self.staff_client.get(reverse('core:metrics'))
+        self.assertContains(
+            response,
+            'yatube_view_queries_count{view="posts:index"} 1'
+        )
+        self.assertContains(response, 'le="+Inf"')
+        self.assertContains(response, 'yatube_cache_hits_total{tier="local"}')
+        response = self.staff_client.get(reverse('core:metrics_json'))
+        latency = response.json()['views']['latency_seconds']
+        self.assertEqual(latency['posts:index']['count'], 1)
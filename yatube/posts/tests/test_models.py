@@ -3,7 +3,8 @@ from django.test import Client, TestCase
 
 from django.core.cache import cache
 
-from ..models import Group, Post
+from ..counters import rebuild_counters
+from ..models import Comment, Follow, Group, Post, UserStats
 
 User = get_user_model()
 
@@ -100,3 +101,74 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     group._meta.get_field(field).help_text, expected_value)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Тестовое описание',
+        )
+
+    def assert_counters(self, posts, group_posts, comments, followers):
+        post = Post.objects.get(pk=self.post.pk)
+        self.author.stats.refresh_from_db()
+        self.reader.stats.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(self.author.stats.posts_count, posts)
+        self.assertEqual(self.group.posts_count, group_posts)
+        self.assertEqual(post.comments_count, comments)
+        self.assertEqual(self.author.stats.followers_count, followers)
+        self.assertEqual(self.reader.stats.following_count, followers)
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются при создании и удалении объектов."""
+        self.post = Post.objects.create(
+            author=self.author, group=self.group, text='Пост'
+        )
+        extra = Post.objects.create(
+            author=self.author, group=self.group, text='Ещё пост'
+        )
+        comment = Comment.objects.create(
+            author=self.reader, post=self.post, text='Комментарий'
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assert_counters(posts=2, group_posts=2, comments=1, followers=1)
+
+        extra.group = self.other_group
+        extra.save()
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.other_group.posts_count, 1)
+        self.assert_counters(posts=2, group_posts=1, comments=1, followers=1)
+
+        extra.delete()
+        comment.delete()
+        follow.delete()
+        self.assert_counters(posts=1, group_posts=1, comments=0, followers=0)
+
+    def test_rebuild_counters(self):
+        """Пересчёт восстанавливает разошедшиеся счётчики."""
+        self.post = Post.objects.create(
+            author=self.author, group=self.group, text='Пост'
+        )
+        Comment.objects.create(
+            author=self.reader, post=self.post, text='Комментарий'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.all().delete()
+        Group.objects.update(posts_count=0)
+        Post.objects.update(comments_count=5)
+        rebuild_counters()
+        self.author = User.objects.get(pk=self.author.pk)
+        self.reader = User.objects.get(pk=self.reader.pk)
+        self.assert_counters(posts=1, group_posts=1, comments=1, followers=1)
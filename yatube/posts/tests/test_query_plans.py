@@ -0,0 +1,91 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Полный проход по таблице: «SCAN posts_post» без «USING ... INDEX».
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\S+$')
+
+
+class QueryPlanTest(TestCase):
+    """Запросы лент идут по индексам и не сортируют во временном B-tree."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(15):
+            post = Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост {i}'
+            )
+        Comment.objects.create(author=cls.reader, post=post, text='Текст')
+        cls.post = post
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(QueryPlanTest.reader)
+
+    def assert_plans_use_indexes(self, queries):
+        cursor = connection.cursor()
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            for row in cursor.fetchall():
+                detail = row[-1]
+                with self.subTest(sql=sql, plan=detail):
+                    self.assertNotIn('TEMP B-TREE', detail)
+                    self.assertIsNone(FULL_SCAN.match(detail))
+
+    def get_feeds(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+        for url in urls:
+            response = self.authorized_client.get(url)
+            page_obj = response.context.get('page_obj')
+            if page_obj is not None and page_obj.has_next():
+                self.authorized_client.get(
+                    url, {'cursor': page_obj.paginator.next_cursor}
+                )
+
+    def test_feed_queries_use_indexes(self):
+        """Ленты, пост и комментарии читаются по индексам."""
+        with CaptureQueriesContext(connection) as queries:
+            self.get_feeds()
+        self.assert_plans_use_indexes(queries)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_authors_use_indexes(self):
+        """Посты популярных авторов подмешиваются по индексу автора."""
+        with CaptureQueriesContext(connection) as queries:
+            self.get_feeds()
+        self.assert_plans_use_indexes(queries)
+
+    def test_timeline_writes_use_indexes(self):
+        """Раскладка поста и отписка не сканируют таблицы."""
+        with CaptureQueriesContext(connection) as queries:
+            Post.objects.create(author=self.author, text='Новый пост')
+            Follow.objects.get(user=self.reader, author=self.author).delete()
+        self.assert_plans_use_indexes(queries)
@@ -0,0 +1,104 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Post, User
+from posts.search import (
+    COMMENT_INDEX, POST_INDEX, match_query, ranked_post_ids
+)
+
+
+class SearchTest(TestCase):
+    """Полнотекстовый поиск по индексу FTS5."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader')
+        cls.cat = Post.objects.create(
+            author=cls.user, text='Рыжий котик спит на солнце'
+        )
+        cls.other = Post.objects.create(
+            author=cls.user, text='Пост про кофе и работу'
+        )
+        Comment.objects.create(
+            post=cls.other, author=cls.user, text='А у меня котики дома'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_match_query_escapes_syntax(self):
+        """Спецсимволы FTS из запроса не ломают выражение."""
+        self.assertEqual(match_query('Кот" OR *'), '"кот"* "or"*')
+        self.assertEqual(match_query('"*()'), '')
+
+    def test_post_ranked_above_comment_match(self):
+        """Совпадение в посте выше совпадения только в комментарии."""
+        self.assertEqual(
+            ranked_post_ids('котик', 10), [self.cat.pk, self.other.pk]
+        )
+
+    def test_index_follows_edits_and_deletes(self):
+        """Правка и удаление поста сразу видны в поиске."""
+        post = Post.objects.get(pk=self.cat.pk)
+        post.text = 'Теперь про собаку'
+        post.save()
+        self.assertEqual(ranked_post_ids('рыжий', 10), [])
+        self.assertEqual(ranked_post_ids('собаку', 10), [post.pk])
+        Post.objects.get(pk=self.other.pk).delete()
+        self.assertEqual(ranked_post_ids('котики', 10), [])
+
+    def test_deleted_post_comments_leave_index(self):
+        """Комментарии удалённого поста убираются из индекса по rowid."""
+        comment = Comment.objects.get(post=self.other)
+        Post.objects.get(pk=self.other.pk).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(*) FROM {COMMENT_INDEX} WHERE rowid = %s',
+                [comment.pk]
+            )
+            self.assertEqual(cursor.fetchone()[0], 0)
+        comment.refresh_from_db()
+        self.assertIsNone(comment.post_id)
+
+    def test_search_page(self):
+        """Страница поиска показывает найденные посты и листается."""
+        for number in range(11):
+            Post.objects.create(author=self.user, text=f'Котик номер {number}')
+        url = reverse('posts:search')
+        response = Client().get(url, {'q': 'котик'})
+        self.assertEqual(len(response.context['posts']), 10)
+        self.assertTrue(response.context['has_next'])
+        response = Client().get(url, {'q': 'котик', 'page': 2})
+        self.assertEqual(len(response.context['posts']), 3)
+        self.assertFalse(response.context['has_next'])
+        response = Client().get(url, {'q': '*'})
+        self.assertEqual(response.context['posts'], [])
+
+    def test_rebuild_search(self):
+        """Команда восстанавливает индекс по таблицам."""
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {POST_INDEX}')
+        self.assertEqual(ranked_post_ids('рыжий', 10), [])
+        call_command('rebuild_search', stdout=open('/dev/null', 'w'))
+        self.assertEqual(ranked_post_ids('рыжий', 10), [self.cat.pk])
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке находит посты по префиксу слова."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        client = Client()
+        client.force_login(admin)
+        response = client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'рыж'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.cat]
+        )
+        response = client.get(
+            reverse('admin:posts_comment_changelist'), {'q': 'котики'}
+        )
+        self.assertEqual(response.context['cl'].result_count, 1)
@@ -0,0 +1,110 @@
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.models import Blob
+from core.storage import blob_storage, collect
+from ..models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def gif(name='small.gif', content=SMALL_GIF):
+    return SimpleUploadedFile(name, content, content_type='image/gif')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='author')
+
+    def create_post(self, image):
+        return Post.objects.create(
+            author=self.user, text='Пост', image=image
+        )
+
+    def test_same_content_stored_once(self):
+        first = self.create_post(gif('first.GIF'))
+        second = self.create_post(gif('second.gif'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(
+            first.image.name, r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}'
+            r'\.gif$'
+        )
+        self.assertEqual(Blob.objects.get().refs, 2)
+        other = self.create_post(gif(content=SMALL_GIF + b'\x00'))
+        self.assertNotEqual(other.image.name, first.image.name)
+        self.assertEqual(Blob.objects.count(), 2)
+
+    def test_references_follow_posts(self):
+        first = self.create_post(gif())
+        second = self.create_post(gif())
+        name = first.image.name
+        second.image = gif(content=SMALL_GIF + b'\x00')
+        second.save()
+        self.assertEqual(Blob.objects.get(name=name).refs, 1)
+        first.delete()
+        blob = Blob.objects.get(name=name)
+        self.assertEqual(blob.refs, 0)
+        self.assertIsNotNone(blob.unused_since)
+        # Повторная загрузка возвращает файлу ссылку.
+        self.assertEqual(self.create_post(gif()).image.name, name)
+        blob.refresh_from_db()
+        self.assertEqual((blob.refs, blob.unused_since), (1, None))
+
+    def test_collect_removes_unused_after_grace(self):
+        kept = self.create_post(gif()).image.name
+        post = self.create_post(gif(content=SMALL_GIF + b'\x00'))
+        name = post.image.name
+        post.delete()
+        self.assertEqual(collect(), 0)
+        self.assertTrue(blob_storage.exists(name))
+        Blob.objects.filter(name=name).update(
+            unused_since=timezone.now() - timedelta(days=1)
+        )
+        self.assertEqual(collect(batch_size=1), 1)
+        self.assertFalse(blob_storage.exists(name))
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+        self.assertTrue(blob_storage.exists(kept))
+
+    def test_saving_again_postpones_collection(self):
+        """Повторное сохранение файла без ссылок заново отсчитывает
+        отсрочку: collect не удалит его до сохранения поста."""
+        post = self.create_post(gif())
+        name = post.image.name
+        post.delete()
+        Blob.objects.filter(name=name).update(
+            unused_since=timezone.now() - timedelta(days=1)
+        )
+        self.assertEqual(blob_storage.save('posts/again.gif', gif()), name)
+        self.assertEqual(collect(), 0)
+        self.assertTrue(blob_storage.exists(name))
+
+    def test_recount(self):
+        post = self.create_post(gif())
+        Blob.objects.update(refs=5)
+        call_command(
+            'collect_blobs', '--recount', '--grace=0', stdout=io.StringIO()
+        )
+        self.assertEqual(Blob.objects.get(name=post.image.name).refs, 1)
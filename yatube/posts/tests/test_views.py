@@ -1,15 +1,31 @@
+import io
 import shutil
 import tempfile
+import time
+from unittest import mock
 
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.http import http_date
 from django import forms
+from PIL import Image
 
-from ..models import Group, Post, Follow, Comment
+from core.paginator import MAX_PAGE_NUMBER
+from core.versions import get_versions
+from .. import thumbnails
+from ..models import (
+    Group, Post, Follow, Comment, Thumbnail, TimelineEntry
+)
+from ..thumbnails import stale_posts
+from ..timeline import following_feed, rebuild_timelines
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -185,14 +201,35 @@ class PostPagesTests(TestCase):
                 self.assertIn(expected, form_field)
 
     def test_check_cache(self):
-        """Проверка кеша."""
+        """Проверка кеша: без записей страница берётся из кеша."""
         response = self.guest_client.get(reverse("posts:index"))
         r_1 = response.content
-        Post.objects.get(id=1).delete()
+        Post.objects.filter(id=self.post.id).update(text='Тихая правка')
         response2 = self.guest_client.get(reverse("posts:index"))
         r_2 = response2.content
         self.assertEqual(r_1, r_2)
 
+    def test_cache_reset_on_write(self):
+        """Удаление поста сразу убирает его из закешированных страниц."""
+        urls = (
+            reverse("posts:index"),
+            reverse("posts:group_list", kwargs={"slug": self.group.slug}),
+            reverse("posts:profile", kwargs={"username": self.user}),
+        )
+        for url in urls:
+            self.guest_client.get(url)
+        Post.objects.get(id=self.post.id).delete()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertNotContains(response, self.post.text)
+
+    def test_cache_keyed_by_viewer(self):
+        """Авторизованный пользователь не получает страницу гостя."""
+        self.guest_client.get(reverse("posts:index"))
+        response = self.authorized_client.get(reverse("posts:index"))
+        self.assertContains(response, self.user.username)
+
     def test_follow_page(self):
         """Проверка подписки/отписки и страницу избранных постов """
         # Проверяем, что страница подписок пуста
@@ -280,6 +317,521 @@ class PaginatorViewsTest(TestCase):
                 response = self.authorized_client.get(template + '?page=2')
                 self.assertEqual(len(response.context['page_obj']), 3)
 
+    def test_cursor_pages_walk_whole_feed(self):
+        """Курсоры ведут по ленте вперёд и назад без пропусков."""
+        url = reverse('posts:index')
+        first = self.guest_client.get(url).context['page_obj']
+        paginator = first.paginator
+        second = self.guest_client.get(
+            url, {'cursor': paginator.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(len(second), 3)
+        self.assertFalse(second.has_next())
+        self.assertTrue(second.has_previous())
+        feed = list(Post.objects.order_by('-pub_date', '-pk'))
+        self.assertEqual(list(first) + list(second), feed)
+        back = self.guest_client.get(
+            url, {'cursor': second.paginator.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+        last = self.guest_client.get(
+            url, {'cursor': paginator.last_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(last), feed[-10:])
+        self.assertFalse(last.has_next())
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный курсор отдаёт первую страницу."""
+        response = self.guest_client.get(
+            reverse('posts:index'), {'cursor': 'broken'}
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+    def test_pages_past_the_end_are_empty(self):
+        """Страница и курсор за концом ленты пусты, а не первая страница."""
+        url = reverse('posts:index')
+        response = self.guest_client.get(url, {'page': 3})
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 0)
+        self.assertFalse(page.has_next())
+        first = self.guest_client.get(url).context['page_obj'].paginator
+        # Пока читали первую страницу, остальные посты удалили.
+        Post.objects.all().delete()
+        cache.clear()
+        response = self.guest_client.get(url, {'cursor': first.next_cursor})
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 0)
+        self.assertFalse(page.has_next())
+        self.assertTrue(page.has_previous())
+
+    def test_far_page_numbers_fall_back_to_first_page(self):
+        """Номер страницы больше MAX_PAGE_NUMBER не читается через OFFSET."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(
+                reverse('posts:index'), {'page': MAX_PAGE_NUMBER + 1}
+            )
+        self.assertEqual(response.context['page_obj'].number, 1)
+        self.assertEqual(len(response.context['page_obj']), 10)
+        for query in queries.captured_queries:
+            self.assertNotIn('OFFSET', query['sql'])
+
+    def test_feed_pages_do_not_count_rows(self):
+        """Пагинация ленты не выполняет COUNT и OFFSET."""
+        response = self.guest_client.get(reverse('posts:index'))
+        cursor = response.context['page_obj'].paginator.next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(reverse('posts:index'), {'cursor': cursor})
+        for query in queries.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'])
+            self.assertNotIn('OFFSET', query['sql'])
+
+
+class FeedQueryBudgetTest(TestCase):
+    """Число запросов на страницу ленты не зависит от числа постов."""
+    # Сессия и пользователь + выборка постов и их миниатюр (+ группа
+    # или автор, у подписок — список популярных авторов).
+    FEED_QUERIES = {
+        'posts:index': 4,
+        'posts:group_list': 5,
+        'posts:profile': 5,
+        'posts:follow_index': 5,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.urls = {
+            'posts:index': reverse('posts:index'),
+            'posts:group_list': reverse(
+                'posts:group_list', kwargs={'slug': cls.group.slug}
+            ),
+            'posts:profile': reverse(
+                'posts:profile', kwargs={'username': 'writer0'}
+            ),
+            'posts:follow_index': reverse('posts:follow_index'),
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(FeedQueryBudgetTest.user)
+
+    def create_posts(self, count):
+        for i in range(count):
+            author, _ = User.objects.get_or_create(
+                username=f'writer{i % 3}',
+                defaults={'first_name': 'Имя', 'last_name': 'Фамилия'},
+            )
+            Follow.objects.get_or_create(user=self.user, author=author)
+            Post.objects.create(
+                author=author, group=self.group, text=f'Пост {i}'
+            )
+
+    def assert_feed_budget(self):
+        for name, url in self.urls.items():
+            with self.subTest(view=name):
+                cache.clear()
+                with self.assertNumQueries(self.FEED_QUERIES[name]):
+                    self.authorized_client.get(url)
+
+    def test_feed_query_budget_is_constant(self):
+        """Страница из 3 и из 10 постов стоит одинаково."""
+        self.create_posts(3)
+        self.assert_feed_budget()
+        self.create_posts(9)
+        self.assert_feed_budget()
+
+
+class CommentPaginationTest(TestCase):
+    """Комментарии поста листаются блоками по курсору."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.post = Post.objects.create(
+            author=User.objects.create_user(username='author'),
+            text='Пост с комментариями',
+        )
+        for i in range(25):
+            Comment.objects.create(
+                post=cls.post,
+                author=User.objects.create_user(username=f'reader{i}'),
+                text=f'Комментарий {i}',
+            )
+
+    def test_comment_blocks(self):
+        """Первый блок на странице поста, остальные — во фрагменте."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        # Сессия не нужна: автор для версий страницы, пост с автором
+        # и один запрос на блок.
+        with self.assertNumQueries(3):
+            response = Client().get(url)
+        first = list(response.context['comments'])
+        self.assertEqual(len(first), 20)
+        self.assertEqual(first[0].text, 'Комментарий 24')
+        self.assertContains(response, 'reader24')
+
+        response = Client().get(response.context['next_url'])
+        rest = list(response.context['comments'])
+        self.assertEqual(len(rest), 5)
+        self.assertEqual(rest[-1].text, 'Комментарий 0')
+        self.assertIsNone(response.context['next_url'])
+        self.assertNotContains(response, '<html')
+
+    def test_exhausted_or_broken_cursor_gives_empty_block(self):
+        """За концом и по битому курсору — пустой блок без продолжения."""
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        next_url = Client().get(url).context['next_url']
+        # Хвост удалили, пока читатель смотрел первый блок.
+        Comment.objects.filter(text__in=[
+            f'Комментарий {i}' for i in range(5)
+        ]).delete()
+        for target in (next_url, url + '?cursor=broken'):
+            with self.subTest(url=target):
+                response = Client().get(target)
+                self.assertEqual(list(response.context['comments']), [])
+                self.assertIsNone(response.context['next_url'])
+                data = Client().get(target + '&format=json').json()
+                self.assertEqual((data['comments'], data['next']), ([], None))
+
+    def test_comment_block_json(self):
+        """Тот же блок в JSON."""
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        data = Client().get(url, {'format': 'json'}).json()
+        self.assertEqual(len(data['comments']), 20)
+        self.assertEqual(data['comments'][0]['author'], 'reader24')
+        data = Client().get(data['next'] + '&format=json').json()
+        self.assertEqual(
+            [comment['text'] for comment in data['comments']],
+            [f'Комментарий {i}' for i in range(4, -1, -1)],
+        )
+        self.assertIsNone(data['next'])
+
+
+class ConditionalGetTest(TestCase):
+    """Повторный запрос с валидаторами получает 304."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Пост'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def revalidate(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertFalse(response.has_header('Last-Modified'))
+        return response['ETag']
+
+    def test_not_modified(self):
+        """Неизменившаяся страница отдаётся без шаблонов и ленты."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'group'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+            reverse('about:author'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                etag = self.revalidate(url)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertFalse(any(
+                    'posts_post"."text' in query['sql']
+                    for query in queries.captured_queries
+                ))
+
+    def test_writes_change_etag(self):
+        """Новый пост и комментарий меняют ETag зависимых страниц."""
+        detail = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )
+        index = reverse('posts:index')
+        detail_etag = self.revalidate(detail)
+        index_etag = self.revalidate(index)
+        Comment.objects.create(post=self.post, author=self.user, text='Да')
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.client.get(index, HTTP_IF_NONE_MATCH=index_etag).status_code,
+            304,
+        )
+        Post.objects.create(author=self.user, text='Ещё пост')
+        self.assertEqual(
+            self.client.get(index, HTTP_IF_NONE_MATCH=index_etag).status_code,
+            200,
+        )
+
+    def test_if_modified_since_alone_is_not_trusted(self):
+        """Без ETag страница не считается неизменившейся: по времени с
+        точностью до секунды запись в ту же секунду не видна."""
+        url = reverse('posts:index')
+        self.revalidate(url)
+        Post.objects.create(author=self.user, text='В ту же секунду')
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60)
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_viewer(self):
+        """Чужая копия страницы не подходит другому пользователю."""
+        url = reverse('posts:index')
+        etag = self.revalidate(url)
+        response = Client().get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_relogin_refreshes_csrf_form(self):
+        """После нового входа страница с формой приходит заново: токен
+        сохранённой копии выписан для старого секрета CSRF."""
+        self.user.set_password('secret')
+        self.user.save()
+        client = Client(enforce_csrf_checks=True)
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        comment_url = reverse(
+            'posts:add_comment', kwargs={'post_id': self.post.pk}
+        )
+
+        def login():
+            client.get(reverse('users:login'))
+            client.post(reverse('users:login'), {
+                'username': 'author',
+                'password': 'secret',
+                'csrfmiddlewaretoken': client.cookies[
+                    settings.CSRF_COOKIE_NAME
+                ].value,
+            })
+
+        login()
+        response = client.get(url)
+        stale_token = response.context['csrf_token']
+        client.logout()
+        login()
+        response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(client.post(comment_url, {
+            'text': 'Старая форма', 'csrfmiddlewaretoken': stale_token,
+        }), 'core/403csrf.html')
+        client.post(comment_url, {
+            'text': 'Новая форма',
+            'csrfmiddlewaretoken': response.context['csrf_token'],
+        })
+        self.assertTrue(
+            Comment.objects.filter(post=self.post, text='Новая форма').exists()
+        )
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(TimelineTest.reader)
+
+    def follow_feed(self):
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_timeline_follows_subscriptions(self):
+        """Лента подписок пополняется при подписке и публикации."""
+        old = Post.objects.create(author=self.author, text='Старый пост')
+        Post.objects.create(author=self.other, text='Чужой пост')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.follow_feed(), [old])
+
+        new = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(self.follow_feed(), [new, old])
+
+        Follow.objects.get(user=self.reader, author=self.author).delete()
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader))
+        self.assertEqual(self.follow_feed(), [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_authors_merged_on_read(self):
+        """Посты популярных авторов подмешиваются при чтении."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+            for i in range(12)
+        ]
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader))
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj), posts[:-11:-1])
+        response = self.authorized_client.get(
+            reverse('posts:follow_index'),
+            {'cursor': page_obj.paginator.next_cursor},
+        )
+        self.assertEqual(list(response.context['page_obj']), posts[1::-1])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_authors_read_in_one_query(self):
+        """Посты всех популярных авторов — одним источником."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=self.other)
+        posts = [
+            Post.objects.create(author=author, text=f'Пост {i}')
+            for i, author in enumerate([self.author, self.other] * 3)
+        ]
+        own, popular = following_feed(self.reader)
+        self.assertEqual(len(popular), 1)
+        self.assertEqual(self.follow_feed(), posts[::-1])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_author_no_longer_popular_is_fanned_out(self):
+        """Посты, вышедшие, пока автор был популярен, попадают в ленты,
+        когда подписчиков становится не больше предела."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.other, author=self.author)
+        post = Post.objects.create(author=self.author, text='Пост')
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        Follow.objects.get(user=self.other, author=self.author).delete()
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list('user', 'post')),
+            [(self.reader.pk, post.pk)],
+        )
+        self.assertEqual(self.follow_feed(), [post])
+
+    @override_settings(TIMELINE_BACKFILL=2)
+    def test_rebuild_matches_incremental_timelines(self):
+        """Пересборка лент даёт то же, что и подписки по одной."""
+        for i in range(3):
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+        Post.objects.create(author=self.other, text='Чужой пост')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.other, author=self.author)
+        Follow.objects.create(user=self.reader, author=self.other)
+        fields = ('user', 'post', 'author', 'pub_date')
+        expected = set(TimelineEntry.objects.values_list(*fields))
+        rebuild_timelines()
+        self.assertEqual(
+            set(TimelineEntry.objects.values_list(*fields)), expected
+        )
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='author', first_name='Иван', last_name='Петров'
+        )
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.post = Post.objects.create(
+            author=self.user, group=self.group, text='Исходный текст'
+        )
+        self.url = reverse('posts:group_list', kwargs={'slug': 'test-slug'})
+
+    def test_card_is_served_from_cache(self):
+        """Карточка берётся из кеша, пока версии не менялись."""
+        self.guest_client.get(self.url)
+        Post.objects.filter(pk=self.post.pk).update(text='Тихая правка')
+        response = self.guest_client.get(self.url)
+        self.assertContains(response, 'Исходный текст')
+
+    def test_card_invalidated_on_save(self):
+        """Правка поста и автора сразу видна в ленте."""
+        self.guest_client.get(self.url)
+        self.post.text = 'Новый текст'
+        self.post.save()
+        self.assertContains(self.guest_client.get(self.url), 'Новый текст')
+        self.user.first_name = 'Пётр'
+        self.user.save()
+        self.assertContains(self.guest_client.get(self.url), 'Пётр Петров')
+
+    def test_user_saves_without_visible_changes_keep_pages(self):
+        """Регистрация, вход и смена пароля не сбрасывают страницы."""
+        names = ('site', 'feed', 'group:test-slug', f'user:{self.user.pk}')
+        before = get_versions(*names)
+        User.objects.create_user(username='newcomer')
+        self.user.set_password('new password')
+        self.user.save()
+        self.assertTrue(
+            Client().login(username='author', password='new password')
+        )
+        self.assertEqual(get_versions(*names), before)
+
+    def test_rename_bumps_only_pages_showing_user(self):
+        """Смена имени сбрасывает карточки, профиль и ленты автора."""
+        names = ('profile:author', 'profile:writer', 'group:test-slug')
+        before = get_versions(*names, 'site')
+        user = User.objects.get(pk=self.user.pk)
+        user.username = 'writer'
+        user.save()
+        after = get_versions(*names, 'site')
+        for name, old, new in zip(names, before, after):
+            with self.subTest(name=name):
+                self.assertNotEqual(old, new)
+        self.assertEqual(before[-1], after[-1])
+
+    def test_group_card_version_separate_from_slug_pages(self):
+        """Правка группы сбрасывает её карточки, но не страницу группы,
+        чей slug совпал с id правленой."""
+        Group.objects.create(title='Цифры', slug=str(self.group.pk))
+        before = get_versions(
+            f'group:{self.group.pk}', f'group-card:{self.group.pk}'
+        )
+        self.group.title = 'Новое название'
+        self.group.save()
+        after = get_versions(
+            f'group:{self.group.pk}', f'group-card:{self.group.pk}'
+        )
+        self.assertEqual(before[0], after[0])
+        self.assertNotEqual(before[1], after[1])
+        self.assertContains(
+            self.guest_client.get(self.url), 'Новое название'
+        )
+
+    def test_rename_refreshes_header_on_other_pages(self):
+        """Новое имя в шапке видно и на страницах без постов автора:
+        ни кеш страниц, ни 304 не отдают старое."""
+        Group.objects.create(title='Пустая группа', slug='empty')
+        client = Client()
+        client.force_login(self.user)
+        url = reverse('posts:group_list', kwargs={'slug': 'empty'})
+        etag = client.get(url)['ETag']
+        user = User.objects.get(pk=self.user.pk)
+        user.username = 'writer'
+        user.save()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Пользователь: writer')
+
 
 # Написать тесты для тестирования картинок!!!!
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -358,3 +910,164 @@ class TaskPagesTests(TestCase):
                 image=self.post.image,
             ).exists()
         )
+
+    def test_thumbnail_placeholder_until_generated(self):
+        """Пока миниатюры нет, в карточке заглушка; затем готовая картинка."""
+        url = reverse("posts:group_list", kwargs={"slug": self.group.slug})
+        response = self.guest_client.get(url)
+        self.assertContains(response, 'aspect-ratio: 960 / 339')
+        self.assertEqual(list(stale_posts()), [self.post])
+        thumbnails.generate(self.post.pk)
+        thumbnail = Thumbnail.objects.get(
+            post=self.post, alias='card', format='JPEG', width=960
+        )
+        self.assertEqual(
+            (thumbnail.width, thumbnail.height, thumbnail.source),
+            (960, 339, self.post.image.name)
+        )
+        self.assertEqual(list(stale_posts()), [])
+        response = self.guest_client.get(url)
+        self.assertContains(response, thumbnail.url)
+        self.assertNotContains(response, 'aspect-ratio')
+
+    def test_responsive_variants(self):
+        """Варианты нужных ширин во всех доступных форматах, <picture>
+        со srcset; одинаковая картинка не кодируется повторно."""
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 800), 'red').save(buffer, 'JPEG')
+        photo = Post.objects.create(
+            author=self.user,
+            text='Фото',
+            group=self.group,
+            image=SimpleUploadedFile('photo.jpg', buffer.getvalue()),
+        )
+        thumbnails.generate(photo.pk)
+        formats = thumbnails.available_formats()
+        self.assertEqual(
+            sorted(photo.thumbnails.values_list('format', 'width', 'height')),
+            sorted(
+                (image_format, width, height)
+                for image_format in formats
+                for width, height in ((480, 170), (960, 339))
+            )
+        )
+        variant = photo.thumbnails.get(format='JPEG', width=480)
+        with default_storage.open(variant.url[len(settings.MEDIA_URL):]) as f:
+            self.assertEqual(Image.open(f).size, (480, 170))
+        self.assertEqual(list(stale_posts()), [self.post])
+        self.assertEqual(list(stale_posts(batch_size=1)), [self.post])
+
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': photo.pk})
+        )
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, f'{variant.url} 480w')
+        self.assertContains(response, 'sizes="(min-width: 1200px)')
+
+        copy = Post.objects.create(
+            author=self.user, text='Копия', image=photo.image.name
+        )
+        with mock.patch.object(thumbnails, 'encode') as encode:
+            thumbnails.generate(copy.pk)
+        encode.assert_not_called()
+        self.assertEqual(copy.thumbnails.count(), photo.thumbnails.count())
+
+    def test_modern_format_sources(self):
+        """Форматы, которые умеет Pillow, идут в <picture> источниками
+        в порядке THUMBNAIL_FORMATS, а <img> остаётся JPEG."""
+        def fake_save(image, file, filename):
+            file.write(b'variant')
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 800), 'red').save(buffer, 'JPEG')
+        photo = Post.objects.create(
+            author=self.user,
+            text='Фото',
+            image=SimpleUploadedFile('photo.jpg', buffer.getvalue()),
+        )
+        with mock.patch.dict(
+            Image.SAVE, {'AVIF': fake_save, 'WEBP': fake_save}
+        ):
+            self.assertEqual(
+                thumbnails.available_formats(), ['AVIF', 'WEBP', 'JPEG']
+            )
+            thumbnails.generate(photo.pk)
+            self.assertEqual(list(stale_posts()), [self.post])
+        for image_format, extension in (('AVIF', 'avif'), ('WEBP', 'webp')):
+            variants = photo.thumbnails.filter(format=image_format)
+            self.assertEqual(
+                sorted(variants.values_list('width', flat=True)), [480, 960]
+            )
+            for variant in variants:
+                name = variant.url[len(settings.MEDIA_URL):]
+                self.assertTrue(name.endswith('.' + extension))
+                self.assertTrue(default_storage.exists(name))
+
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': photo.pk})
+        )
+        content = response.content.decode()
+        avif = content.index('<source type="image/avif"')
+        webp = content.index('<source type="image/webp"')
+        self.assertLess(avif, webp)
+        self.assertLess(webp, content.index('<img class="card-img'))
+        jpeg = photo.thumbnails.get(format='JPEG', width=960)
+        self.assertContains(response, f'src="{jpeg.url}"')
+
+    def test_transparent_image_gets_background_color(self):
+        """У прозрачной картинки заглушки нет, но цвет фона выводится."""
+        buffer = io.BytesIO()
+        Image.new('RGBA', (600, 400), (10, 10, 200, 128)).save(buffer, 'PNG')
+        post = Post.objects.create(
+            author=self.user,
+            text='Прозрачная',
+            image=SimpleUploadedFile('clear.png', buffer.getvalue()),
+        )
+        thumbnails.generate(post.pk)
+        post.refresh_from_db()
+        self.assertEqual(post.image_placeholder, '')
+        self.assertNotEqual(post.image_color, '')
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertContains(
+            response, f'style="background: {post.image_color}"'
+        )
+
+    def test_placeholder_and_backfill(self):
+        """Заглушка считается вместе с миниатюрами и встраивается в
+        карточку; backfill_placeholders дописывает недостающие."""
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 400), (200, 10, 10)).save(buffer, 'JPEG')
+        photo = Post.objects.create(
+            author=self.user,
+            text='Фото',
+            image=SimpleUploadedFile('red.jpg', buffer.getvalue()),
+        )
+        thumbnails.generate(photo.pk)
+        photo.refresh_from_db()
+        self.assertTrue(
+            photo.image_placeholder.startswith('data:image/png;base64,')
+        )
+        self.assertLess(len(photo.image_placeholder), 400)
+        red, green, blue = bytes.fromhex(photo.image_color[1:])
+        self.assertGreater(red, 150)
+        self.assertLess(max(green, blue), 60)
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': photo.pk})
+        )
+        self.assertContains(
+            response, f'url({photo.image_placeholder}) center / cover'
+        )
+
+        placeholder = photo.image_placeholder
+        Post.objects.filter(pk=photo.pk).update(
+            image_placeholder='', image_color=''
+        )
+        version = get_versions(f'post:{photo.pk}')
+        call_command('backfill_placeholders', stdout=io.StringIO())
+        photo.refresh_from_db()
+        self.assertEqual(photo.image_placeholder, placeholder)
+        self.assertNotEqual(get_versions(f'post:{photo.pk}'), version)
+        self.post.refresh_from_db()
+        self.assertNotEqual(self.post.image_color, '')
@@ -0,0 +1,361 @@
+import base64
+import hashlib
+import io
+import json
+import logging
+import math
+import posixpath
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+from sorl.thumbnail import delete
+from sorl.thumbnail.images import ImageFile
+
+from core.storage import blob_storage
+from .models import Post, Thumbnail
+from .uploads import EXTENSIONS
+
+try:
+    import pillow_avif  # noqa: F401 — регистрирует в Pillow формат AVIF
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+# Формат для <img>: его понимает любой браузер.
+FALLBACK_FORMAT = 'JPEG'
+VARIANTS_DIR = 'variants'
+# Ширина заглушки картинки: PNG такой ширины — около 200 байт.
+PLACEHOLDER_WIDTH = 16
+# Ориентации EXIF, при которых картинка поворачивается на 90°.
+ROTATED = {5, 6, 7, 8}
+
+# Варианты миниатюр поста готовы и сохранены.
+thumbnails_ready = Signal(providing_args=['post'])
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+    return _executor
+
+
+def geometry(alias):
+    width, height = settings.THUMBNAIL_ALIASES[alias]['geometry'].split('x')
+    return int(width), int(height)
+
+
+def available_formats():
+    """Форматы из THUMBNAIL_FORMATS, которые умеет сохранять Pillow."""
+    Image.init()
+    return [name for name in settings.THUMBNAIL_FORMATS if name in Image.SAVE]
+
+
+def plan(alias, source_size):
+    """Размеры вариантов alias для исходника source_size, по возрастанию.
+
+    Ширины больше кадра исходника не нужны: они только увеличат файл.
+    Основная ширина есть всегда, как и раньше — с увеличением.
+    """
+    width, height = geometry(alias)
+    frame_width = min(source_size[0], source_size[1] * width / height)
+    widths = {
+        item for item in settings.THUMBNAIL_ALIASES[alias].get('widths', ())
+        if item <= frame_width
+    }
+    widths.add(width)
+    return [(item, round(item * height / width)) for item in sorted(widths)]
+
+
+def variants_dir(source):
+    digest = hashlib.sha1(source.encode()).hexdigest()
+    return posixpath.join(VARIANTS_DIR, digest[:2], digest)
+
+
+def variant_name(source, alias, size, image_format):
+    # Отпечаток настроек в имени: с новыми настройками получаются новые
+    # файлы, а не старые под долгим кешем браузера.
+    options = json.dumps([
+        settings.THUMBNAIL_ALIASES[alias],
+        settings.THUMBNAIL_FORMATS[image_format],
+    ], sort_keys=True)
+    stamp = hashlib.sha1(options.encode()).hexdigest()[:8]
+    return posixpath.join(
+        variants_dir(source),
+        '{}-{}x{}-{}.{}'.format(
+            alias, *size, stamp, EXTENSIONS[image_format]
+        )
+    )
+
+
+def oriented_size(image):
+    width, height = image.size
+    if image.getexif().get(0x0112) in ROTATED:
+        return height, width
+    return width, height
+
+
+def decode(image, scale):
+    """Картинка в RGB или RGBA, повёрнутая по EXIF. JPEG уменьшается
+    ещё при декодировании, насколько позволяет scale."""
+    if image.format == 'JPEG' and image.mode in ('RGB', 'L') and scale < 1:
+        image.draft(image.mode, (
+            math.ceil(image.width * scale), math.ceil(image.height * scale)
+        ))
+    transparent = (
+        image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    )
+    image = ImageOps.exif_transpose(image)
+    mode = 'RGBA' if transparent else 'RGB'
+    if image.mode != mode:
+        image = image.convert(mode)
+    return image
+
+
+def encode(frame, image_format):
+    if image_format == 'JPEG' and frame.mode == 'RGBA':
+        background = Image.new('RGB', frame.size, 'white')
+        background.paste(frame, mask=frame.getchannel('A'))
+        frame = background
+    buffer = io.BytesIO()
+    frame.save(
+        buffer, image_format, **settings.THUMBNAIL_FORMATS[image_format]
+    )
+    return ContentFile(buffer.getvalue())
+
+
+def render(post):
+    """Варианты миниатюр картинки поста — несохранённые строки Thumbnail.
+
+    Исходник декодируется один раз, каждый кадр вырезается один раз и
+    уменьшается от большей ширины к меньшей. Файлы, уже готовые для той
+    же картинки (у одинаковых картинок одно имя), не пересоздаются.
+    """
+    source = post.image.name
+    formats = available_formats()
+    thumbnails = []
+    missing = defaultdict(list)
+    with post.image.open('rb') as file, Image.open(file) as image:
+        source_size = oriented_size(image)
+        for alias in settings.THUMBNAIL_ALIASES:
+            for size in plan(alias, source_size):
+                for image_format in formats:
+                    name = variant_name(source, alias, size, image_format)
+                    thumbnails.append(Thumbnail(
+                        post=post,
+                        alias=alias,
+                        source=source,
+                        format=image_format,
+                        url=default_storage.url(name),
+                        width=size[0],
+                        height=size[1],
+                    ))
+                    if not default_storage.exists(name):
+                        missing[alias, size].append((image_format, name))
+        if missing:
+            scale = max(
+                width / min(source_size[0], source_size[1] * width / height)
+                for _, (width, height) in missing
+            )
+            save_variants(decode(image, scale), source_size, missing)
+    return thumbnails
+
+
+def save_variants(image, source_size, missing):
+    """Кодирует и сохраняет недостающие варианты: (alias, размер) ->
+    [(формат, имя файла)]."""
+    for alias in settings.THUMBNAIL_ALIASES:
+        frame = None
+        for size in reversed(plan(alias, source_size)):
+            if frame is None and (alias, size) not in missing:
+                continue
+            frame = (
+                ImageOps.fit(image, size, Image.LANCZOS) if frame is None
+                else frame.resize(size, Image.LANCZOS)
+            )
+            for image_format, name in missing.get((alias, size), ()):
+                saved = default_storage.save(name, encode(frame, image_format))
+                if saved != name:
+                    # Тот же вариант успел сохранить другой поток.
+                    default_storage.delete(saved)
+
+
+def placeholder(file, alias):
+    """Заглушка кадра alias: крошечный PNG в data URI и основной цвет.
+
+    У картинок с прозрачностью только цвет: заглушка просвечивала бы
+    сквозь загруженную картинку.
+    """
+    width, height = geometry(alias)
+    size = (
+        PLACEHOLDER_WIDTH, max(1, round(PLACEHOLDER_WIDTH * height / width))
+    )
+    with Image.open(file) as image:
+        image = decode(image, PLACEHOLDER_WIDTH * 4 / max(image.size))
+    frame = ImageOps.fit(image, size, Image.LANCZOS)
+    colors = frame.convert('RGB').quantize(colors=4)
+    _, index = max(colors.getcolors())
+    color = '#{:02x}{:02x}{:02x}'.format(
+        *colors.getpalette()[index * 3:index * 3 + 3]
+    )
+    if frame.mode == 'RGBA':
+        return '', color
+    buffer = io.BytesIO()
+    frame.save(buffer, 'PNG', optimize=True)
+    data = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{data}', color
+
+
+def placeholder_file(post, thumbnails):
+    """Самый узкий JPEG-вариант первого размера, а если его нет —
+    сама картинка: заглушку дешевле считать из маленького файла.
+
+    Вариант годится только для JPEG: у остальных форматов может быть
+    прозрачность, которой в JPEG уже нет.
+    """
+    alias = next(iter(settings.THUMBNAIL_ALIASES))
+    extension = posixpath.splitext(post.image.name)[1].lower()
+    variants = [
+        item for item in thumbnails
+        if item.alias == alias and item.format == FALLBACK_FORMAT
+        and item.source == post.image.name
+    ] if extension in ('.jpg', '.jpeg') else []
+    if variants:
+        smallest = min(variants, key=lambda item: item.width)
+        name = variant_name(
+            post.image.name, alias, (smallest.width, smallest.height),
+            FALLBACK_FORMAT
+        )
+        if default_storage.exists(name):
+            return default_storage.open(name)
+    return post.image.open('rb')
+
+
+def update_placeholder(post, thumbnails=None):
+    """Считает и сохраняет заглушку; False — картинку уже заменили.
+
+    Версии страниц не меняет: это дело вызывающего.
+    """
+    if thumbnails is None:
+        thumbnails = post.thumbnails.all()
+    alias = next(iter(settings.THUMBNAIL_ALIASES))
+    with placeholder_file(post, thumbnails) as file:
+        data, color = placeholder(file, alias)
+    # Картинку могли заменить, пока считалась заглушка.
+    updated = Post.objects.filter(pk=post.pk, image=post.image.name).update(
+        image_placeholder=data, image_color=color
+    )
+    return bool(updated)
+
+
+def generate(post_id):
+    """Готовит варианты миниатюр всех размеров из THUMBNAIL_ALIASES
+    и заглушку картинки."""
+    post = Post.objects.only('image', 'author', 'group').filter(
+        pk=post_id
+    ).first()
+    if post is None:
+        return
+    thumbnails = render(post) if post.image else []
+    with transaction.atomic():
+        post.thumbnails.all().delete()
+        Thumbnail.objects.bulk_create(thumbnails)
+    if post.image:
+        update_placeholder(post, thumbnails)
+    thumbnails_ready.send(sender=Post, post=post)
+
+
+def process(post_id):
+    try:
+        generate(post_id)
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры поста %s', post_id)
+
+
+def process_in_thread(post_id):
+    # Поток пула живёт дольше запроса: соединение с базой закрываем сами.
+    try:
+        process(post_id)
+    finally:
+        connection.close()
+
+
+def _use_workers():
+    # Базу SQLite в памяти (тесты) с потоками пула не разделить:
+    # таблицы блокируются, а данные теста исчезают раньше потока.
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        return False
+    return bool(settings.THUMBNAIL_WORKERS)
+
+
+def schedule(post):
+    """Ставит пост в очередь пула после фиксации транзакции.
+
+    Без рабочих потоков (THUMBNAIL_WORKERS = 0) миниатюры готовятся
+    сразу, в том же потоке.
+    """
+    post_id = post.pk
+    if _use_workers():
+        transaction.on_commit(
+            lambda: _get_executor().submit(process_in_thread, post_id)
+        )
+    else:
+        transaction.on_commit(lambda: process(post_id))
+
+
+def forget(name):
+    """Удаляет варианты и миниатюры sorl удалённой картинки."""
+    delete(ImageFile(name, blob_storage), delete_file=False)
+    directory = variants_dir(name)
+    if not default_storage.exists(directory):
+        return
+    for file in default_storage.listdir(directory)[1]:
+        default_storage.delete(posixpath.join(directory, file))
+
+
+def stale_posts(aliases=None, batch_size=500):
+    """Посты с картинкой, у которых не хватает свежих миниатюр
+    какого-нибудь размера или формата.
+
+    Генератор: посты и их миниатюры читаются пачками по batch_size по
+    возрастанию pk, так что память не растёт вместе с таблицей.
+    """
+    aliases = list(aliases or settings.THUMBNAIL_ALIASES)
+    wanted = {
+        (alias, image_format)
+        for alias in aliases for image_format in available_formats()
+    }
+    posts = Post.objects.exclude(image='').only('image').prefetch_related(
+        Prefetch('thumbnails', queryset=Thumbnail.objects.only(
+            'post', 'alias', 'format', 'source'
+        ))
+    ).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(posts.filter(pk__gt=last_pk)[:batch_size])
+        for post in batch:
+            if not wanted <= {
+                (thumb.alias, thumb.format)
+                for thumb in post.thumbnails.all()
+                if thumb.source == post.image.name
+            }:
+                yield post
+        if len(batch) < batch_size:
+            return
+        last_pk = batch[-1].pk
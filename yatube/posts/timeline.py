@@ -0,0 +1,158 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+TIMELINE_ORDERING = ('-timeline_date', '-timeline_post')
+
+
+def is_popular(author_id):
+    """Автор, чьи посты подмешиваются при чтении, а не раскладываются."""
+    return UserStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).exists()
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if is_popular(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).order_by().values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                post=post,
+                author_id=post.author_id,
+                pub_date=post.pub_date,
+            )
+            for user_id in followers.iterator()
+        ),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту читателя последние посты нового автора."""
+    if is_popular(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'pub_date'
+    )[:settings.TIMELINE_BACKFILL]
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for post_id, pub_date in posts
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты читателя посты автора, от которого он отписался."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def follower_removed(author_id):
+    """Раскладывает посты автора заново, если после отписки он перестал
+    быть популярным.
+
+    Пока автор был популярен, его посты в ленты не попадали; теперь их
+    снова берут только из лент, поэтому его записи пересобираются
+    одним INSERT ... SELECT по всем подписчикам.
+    """
+    if UserStats.objects.filter(
+        user_id=author_id,
+        followers_count=settings.TIMELINE_FANOUT_LIMIT,
+    ).exists():
+        TimelineEntry.objects.filter(author_id=author_id).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _backfill_sql(), [author_id, settings.TIMELINE_BACKFILL]
+            )
+
+
+def _backfill_sql():
+    """INSERT ... SELECT: последние посты автора в ленты всех подписчиков."""
+    quote = connection.ops.quote_name
+
+    def column(model, name):
+        return quote(model._meta.get_field(name).column)
+
+    return (
+        'INSERT INTO {timeline} ({t_user}, {t_post}, {t_author}, {t_date}) '
+        'SELECT f.{f_user}, p.{p_id}, p.{p_author}, p.{p_date} FROM ('
+        'SELECT {p_id}, {p_author}, {p_date} FROM {post} '
+        'WHERE {p_author} = %s ORDER BY {p_date} DESC, {p_id} DESC LIMIT %s'
+        ') p JOIN {follow} f ON f.{f_author} = p.{p_author}'
+    ).format(
+        timeline=quote(TimelineEntry._meta.db_table),
+        t_user=column(TimelineEntry, 'user'),
+        t_post=column(TimelineEntry, 'post'),
+        t_author=column(TimelineEntry, 'author'),
+        t_date=column(TimelineEntry, 'pub_date'),
+        post=quote(Post._meta.db_table),
+        p_id=column(Post, 'id'),
+        p_author=column(Post, 'author'),
+        p_date=column(Post, 'pub_date'),
+        follow=quote(Follow._meta.db_table),
+        f_user=column(Follow, 'user'),
+        f_author=column(Follow, 'author'),
+    )
+
+
+def rebuild_timelines():
+    """Заново раскладывает ленты по всем подпискам.
+
+    Каждый автор раскладывается одним INSERT ... SELECT сразу по всем
+    подписчикам: на больших базах это на порядки быстрее, чем создавать
+    записи ленты объектами по одной подписке.
+    """
+    TimelineEntry.objects.all().delete()
+    authors = Follow.objects.order_by().values_list(
+        'author_id', flat=True
+    ).distinct()
+    sql = _backfill_sql()
+    with connection.cursor() as cursor:
+        for author_id in authors.iterator():
+            if not is_popular(author_id):
+                cursor.execute(
+                    sql, [author_id, settings.TIMELINE_BACKFILL]
+                )
+
+
+def following_feed(user):
+    """Источники ленты подписок: своя лента и посты популярных авторов.
+
+    Оба queryset размечены общим ключом TIMELINE_ORDERING, чтобы
+    MergedCursorPaginator мог слить их постранично.
+    """
+    own = Post.objects.feed().filter(timeline_entries__user=user).annotate(
+        timeline_date=F('timeline_entries__pub_date'),
+        timeline_post=F('timeline_entries__post'),
+    )
+    popular = list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+        ).order_by().values_list('author_id', flat=True)
+    )
+    if not popular:
+        return own, []
+    # Все популярные авторы одним запросом: граница страницы и LIMIT
+    # у него общие, сколько бы авторов ни было.
+    pulled = Post.objects.feed().filter(author_id__in=popular).annotate(
+        timeline_date=F('pub_date'),
+        timeline_post=F('pk'),
+    )
+    return own, [pulled]
@@ -0,0 +1,319 @@
+import io
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+# Сигнатуры начала файла для принимаемых форматов.
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+)
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+    'WEBP': 'image/webp',
+    'AVIF': 'image/avif',
+}
+EXTENSIONS = {
+    'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp', 'AVIF': 'avif',
+}
+# Столько байт начала файла хватает Pillow, чтобы узнать размеры даже
+# у JPEG с большим блоком EXIF.
+HEADER_LIMIT = 256 * 1024
+# Сведения Pillow о картинке, которые не считаются метаданными: файл
+# только с ними сохраняется без перекодирования.
+PLAIN_INFO = {
+    'dpi', 'icc_profile', 'jfif', 'jfif_version', 'jfif_unit',
+    'jfif_density', 'progressive', 'progression', 'adobe',
+    'adobe_transform', 'transparency', 'gamma', 'srgb', 'aspect',
+    'interlace', 'duration', 'loop', 'background', 'version',
+}
+JPEG_DRAFT_MODES = {'RGB', 'L'}
+
+
+class UploadRejected(ValueError):
+    pass
+
+
+def sniff_format(head):
+    for signature, name in SIGNATURES:
+        if head.startswith(signature):
+            return name
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+class HeaderCheck:
+    """Проверка картинки по первым байтам, пока остальное ещё идёт.
+
+    Размер файла считается по ходу приёма, формат — по сигнатуре,
+    ширина и высота — по заголовку: ни один кусок не копится в памяти
+    дольше, чем нужно, и весь файл не декодируется.
+    """
+
+    def __init__(self):
+        self.head = bytearray()
+        self.received = 0
+        self.format = None
+        self.size = None
+
+    def feed(self, chunk):
+        """Учитывает очередной кусок; UploadRejected — файл не подходит."""
+        self.received += len(chunk)
+        if self.received > settings.UPLOAD_IMAGE_MAX_SIZE:
+            raise UploadRejected('Файл больше {} МБ'.format(
+                settings.UPLOAD_IMAGE_MAX_SIZE // 2 ** 20
+            ))
+        if self.size is None:
+            self.head += chunk[:HEADER_LIMIT - len(self.head)]
+            self.parse(final=False)
+
+    def finish(self):
+        if self.size is None:
+            self.parse(final=True)
+
+    def parse(self, final):
+        if self.format is None:
+            if len(self.head) < 12 and not final:
+                return
+            self.format = sniff_format(bytes(self.head[:12]))
+            if self.format is None:
+                raise UploadRejected(
+                    'Загрузите картинку в формате JPEG, PNG, GIF или WebP'
+                )
+        try:
+            with Image.open(io.BytesIO(self.head)) as image:
+                width, height = image.size
+        except Exception:
+            if final or len(self.head) >= HEADER_LIMIT:
+                raise UploadRejected('Файл повреждён или это не картинка')
+            return
+        if width * height > settings.UPLOAD_IMAGE_MAX_PIXELS:
+            raise UploadRejected(
+                f'Слишком большая картинка: {width}×{height} точек'
+            )
+        self.size = (width, height)
+
+
+def mark_checked(upload, check):
+    """Помечает файл проверенным: форма не открывает его повторно."""
+    upload.content_type = CONTENT_TYPES[check.format]
+    upload.image_format = check.format
+    upload.image_size = check.size
+    return upload
+
+
+class RejectedUpload(UploadedFile):
+    """Файл, отвергнутый при приёме; форма покажет error."""
+
+    def __init__(self, name, error):
+        super().__init__(io.BytesIO(), name, None, 0)
+        self.error = error
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Потоковый приём картинок из полей UPLOAD_IMAGE_FIELDS.
+
+    Куски сразу пишутся во временный файл, а формат и размеры
+    проверяются по первым из них. Неподходящий файл дальше не пишется:
+    остаток запроса читается и отбрасывается, а форма получает ошибку.
+    Файлы других полей достаются следующим обработчикам.
+    """
+
+    def new_file(self, field_name, *args, **kwargs):
+        self.active = field_name in settings.UPLOAD_IMAGE_FIELDS
+        self.error = None
+        if self.active:
+            super().new_file(field_name, *args, **kwargs)
+            self.check = HeaderCheck()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if self.error is None:
+            try:
+                self.check.feed(raw_data)
+            except UploadRejected as error:
+                self.error = str(error)
+                self.file.close()
+            else:
+                self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        if self.error is None:
+            try:
+                self.check.finish()
+            except UploadRejected as error:
+                self.error = str(error)
+                self.file.close()
+        if self.error is not None:
+            return RejectedUpload(self.file_name, self.error)
+        self.file.seek(0)
+        self.file.size = file_size
+        return mark_checked(self.file, self.check)
+
+
+def _has_metadata(image):
+    return bool(set(image.info) - PLAIN_INFO)
+
+
+def prepare_image(upload):
+    """Картинка к сохранению: по EXIF повёрнута, без метаданных и не
+    больше UPLOAD_IMAGE_MAX_SIDE по большей стороне.
+
+    Файл без метаданных и в пределах размера остаётся как есть. JPEG
+    уменьшается ещё при декодировании (draft), поэтому полноразмерная
+    картинка в память не попадает. Результат пишется в тот же временный
+    файл, второй копии не появляется. Анимации не трогаются.
+
+    Заголовок уже проверен при приёме, но тело файла может быть обрезано
+    или испорчено: тогда UploadRejected.
+    """
+    try:
+        return _rewrite_image(upload)
+    except (OSError, Image.DecompressionBombError):
+        raise UploadRejected('Файл повреждён или это не картинка')
+
+
+def _rewrite_image(upload):
+    max_side = settings.UPLOAD_IMAGE_MAX_SIDE
+    with Image.open(upload.temporary_file_path()) as source:
+        oversized = max(source.size) > max_side
+        if getattr(source, 'n_frames', 1) > 1 or not (
+            oversized or _has_metadata(source)
+        ):
+            return upload
+        image_format = source.format
+        icc_profile = source.info.get('icc_profile')
+        if image_format == 'JPEG' and source.mode in JPEG_DRAFT_MODES:
+            source.draft(source.mode, (max_side, max_side))
+        source.load()
+        image = ImageOps.exif_transpose(source)
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    options = {}
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    if image_format in ('JPEG', 'WEBP'):
+        options['quality'] = settings.UPLOAD_IMAGE_QUALITY
+    if image_format == 'JPEG':
+        options['progressive'] = True
+        if image.mode not in JPEG_DRAFT_MODES:
+            # Профиль CMYK к пересчитанной в RGB картинке не подходит.
+            image = image.convert('RGB')
+            options.pop('icc_profile', None)
+    upload.seek(0)
+    upload.truncate()
+    image.save(upload, format=image_format, **options)
+    upload.size = upload.tell()
+    upload.seek(0)
+    upload.name = '{}.{}'.format(
+        os.path.splitext(os.path.basename(upload.name))[0],
+        EXTENSIONS[image_format],
+    )
+    upload.image_size = image.size
+    return upload
+
+
+# Загрузка частями: куски копятся в файле UPLOAD_CHUNKS_DIR/<id>.part,
+# состояние — в модели ImageUpload.
+
+def part_path(upload_id):
+    return os.path.join(settings.UPLOAD_CHUNKS_DIR, f'{upload_id}.part')
+
+
+class PartialUploadedFile(UploadedFile):
+    """Собранный из частей файл; хранилище переносит его, не копируя.
+
+    Файл открыт, пока его не закроет форма после сохранения поста.
+    """
+
+    def __init__(self, path, name, content_type, size):
+        super().__init__(open(path, 'r+b'), name, content_type, size)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def append_chunk(upload, stream, start, length, block=64 * 1024):
+    """Дописывает в файл части length байт из stream с позиции start.
+
+    Хвост после start, оставшийся от оборванной попытки, отрезается.
+    Возвращает, сколько байт удалось прочитать.
+    """
+    os.makedirs(settings.UPLOAD_CHUNKS_DIR, exist_ok=True)
+    path = part_path(upload.pk)
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as part:
+        part.seek(start)
+        part.truncate()
+        written = 0
+        while written < length:
+            data = stream.read(min(block, length - written))
+            if not data:
+                break
+            part.write(data)
+            written += len(data)
+    return written
+
+
+def check_part(path, final):
+    """Проверка заголовка у принятой части файла; final — файл весь."""
+    check = HeaderCheck()
+    with open(path, 'rb') as part:
+        check.head += part.read(HEADER_LIMIT)
+    check.received = len(check.head)
+    check.parse(final)
+    return check
+
+
+def discard(upload):
+    # delete() обнуляет pk, поэтому путь нужен заранее.
+    path = part_path(upload.pk)
+    upload.delete()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def prune(max_age):
+    """Удаляет брошенные загрузки старше max_age секунд и файлы частей
+    без загрузки (например, от поста, который так и не сохранился)."""
+    from .models import ImageUpload
+
+    stale = ImageUpload.objects.filter(
+        created__lt=timezone.now() - timedelta(seconds=max_age)
+    )
+    removed = 0
+    for upload in stale:
+        discard(upload)
+        removed += 1
+    directory = settings.UPLOAD_CHUNKS_DIR
+    if not os.path.isdir(directory):
+        return removed
+    known = {
+        str(pk) for pk in ImageUpload.objects.values_list('pk', flat=True)
+    }
+    deadline = time.time() - max_age
+    for entry in os.scandir(directory):
+        if (
+            entry.name.endswith('.part')
+            and entry.name[:-len('.part')] not in known
+            and entry.stat().st_mtime < deadline
+        ):
+            os.remove(entry.path)
+            removed += 1
+    return removed
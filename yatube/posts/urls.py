@@ -8,12 +8,27 @@ urlpatterns = [
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     # Профайл пользователя
     path('profile/<str:username>/', views.profile, name='profile'),
+    # Поиск по постам и комментариям
+    path('search/', views.search, name='search'),
     # Просмотр записи
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    # Следующий блок комментариев поста
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     # Добавление нового поста
     path("create/", views.post_create, name="post_create"),
     # Редактирование поста
     path("posts/<int:post_id>/edit/", views.post_edit, name="post_edit"),
+    # Загрузка картинки поста частями с докачкой
+    path('uploads/', views.upload_start, name='upload_start'),
+    path(
+        'uploads/<uuid:upload_id>/',
+        views.upload_chunk,
+        name='upload_chunk'
+    ),
     # Комментирование поста
     path(
         'posts/<int:post_id>/comment/',
@@ -1,20 +1,80 @@
+import os
+import re
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.paginator import InvalidPage
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods, require_POST
 
-from core.paginator import paginator_func
+from core.decorators import versioned_cache_page, versioned_condition
+from core.paginator import (
+    CursorPaginator, MergedCursorPaginator, paginator_func
+)
 
+from . import uploads
+from .counters import user_stats
+from .timeline import TIMELINE_ORDERING, following_feed
 from .forms import PostForm, CommentForm
-from .models import Post, Group, User, Follow
+from .models import Comment, Post, Group, User, Follow, ImageUpload
+from .search import ranked_post_ids
 
 ORDERING_CONSTANT = 10
-CACHE_TIME_CONSTANT = 20
+# Дальше этой страницы поиск не листается: OFFSET по ранжированной
+# выдаче дорожает с номером страницы, а так далеко никто не читает.
+SEARCH_MAX_PAGES = 50
+COMMENTS_PER_PAGE = 20
+# Сначала новые; ключ совпадает с индексом (post, -created, -id).
+COMMENT_ORDERING = ('-created', '-pk')
+# Для блока комментария нужны только текст, дата и имя автора.
+COMMENT_FIELDS = ('created', 'text', 'post', 'author__username')
+# Страницы сбрасываются по версиям при записи, срок жизни — запасной.
+CACHE_TIME_CONSTANT = 60 * 60 * 24
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+# Версии, от которых зависят закешированные страницы лент.
+# 'site' сбрасывает всё сразу: правка пользователя или группы.
+def index_versions(request):
+    return ['site', 'feed']
+
+
+def group_versions(request, slug):
+    return ['site', f'group:{slug}']
+
+
+def profile_versions(request, username):
+    return ['site', f'profile:{username}']
+
+
+def post_versions(request, post_id):
+    # Число постов автора на странице меняется вместе с его профилем.
+    username = Post.objects.filter(pk=post_id).values_list(
+        'author__username', flat=True
+    ).first()
+    return [
+        'site', f'post:{post_id}', f'comments:{post_id}',
+        f'profile:{username}',
+    ]
+
+
+def comments_versions(request, post_id):
+    return ['site', f'comments:{post_id}']
+
+
+def follow_versions(request):
+    # Новые посты сбрасывают 'feed', подписки — профиль читателя.
+    return ['site', 'feed', f'profile:{request.user.username}']
 
 
 # Главная страница
-@cache_page(CACHE_TIME_CONSTANT)
+@versioned_condition(index_versions)
+@versioned_cache_page(CACHE_TIME_CONSTANT, index_versions)
 def index(request):
-    post_list = Post.objects.all()
+    post_list = Post.objects.feed()
     page_obj = paginator_func(request, post_list, ORDERING_CONSTANT)
     context = {
         'page_obj': page_obj,
@@ -22,9 +82,11 @@ def index(request):
     return render(request, 'posts/index.html', context)
 
 
+@versioned_condition(group_versions)
+@versioned_cache_page(CACHE_TIME_CONSTANT, group_versions)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('group').all()
+    posts = group.posts.feed()
     page_obj = paginator_func(request, posts, ORDERING_CONSTANT)
     context = {
         'group': group,
@@ -34,39 +96,135 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@versioned_condition(profile_versions)
+@versioned_cache_page(CACHE_TIME_CONSTANT, profile_versions)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    author_posts = author.posts.all()
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    author_posts = author.posts.feed()
     page_obj = paginator_func(request, author_posts, ORDERING_CONSTANT)
     context = {
         'author': author,
-        'posts': author_posts,
+        'stats': user_stats(author),
         'page_obj': page_obj,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        number = int(request.GET.get('page', 1))
+    except ValueError:
+        number = 1
+    number = min(max(number, 1), SEARCH_MAX_PAGES)
+    posts = []
+    has_next = False
+    if query:
+        # Лишний id показывает, есть ли следующая страница, без COUNT(*).
+        ids = ranked_post_ids(
+            query,
+            ORDERING_CONSTANT + 1,
+            (number - 1) * ORDERING_CONSTANT,
+        )
+        has_next = len(ids) > ORDERING_CONSTANT and number < SEARCH_MAX_PAGES
+        ids = ids[:ORDERING_CONSTANT]
+        found = Post.objects.feed().in_bulk(ids)
+        posts = [found[pk] for pk in ids if pk in found]
+    context = {
+        'query': query,
+        'posts': posts,
+        'number': number,
+        'has_next': has_next,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def comments_page(request, post_id):
+    """Страница комментариев поста по курсору и ссылка на следующую.
+
+    Блоки только дописываются к уже показанным, поэтому исчерпанный или
+    битый курсор даёт пустой блок, а не первый ещё раз.
+    """
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author'
+    ).only(*COMMENT_FIELDS)
+    paginator = CursorPaginator(
+        comments, COMMENTS_PER_PAGE, ordering=COMMENT_ORDERING
+    )
+    cursor = request.GET.get('cursor')
+    if not cursor:
+        page_obj = paginator.page(1)
+    else:
+        try:
+            page_obj = paginator.get_cursor_page(cursor)
+        except InvalidPage:
+            page_obj = paginator.empty_page()
+    next_url = None
+    if page_obj.has_next():
+        next_url = '{}?{}'.format(
+            reverse('posts:post_comments', kwargs={'post_id': post_id}),
+            urlencode({'cursor': page_obj.paginator.next_cursor}),
+        )
+    return page_obj, next_url
+
+
+@versioned_condition(post_versions)
 def post_detail(request, post_id):
     comment_form = CommentForm(request.POST or None)
-    post = get_object_or_404(Post, id=post_id)
-    post_count = post.author.posts.count()
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id
+    )
+    post_count = user_stats(post.author).posts_count
+    comments, next_url = comments_page(request, post.pk)
     context = {
         'post': post,
         'post_count': post_count,
         'comments': comments,
+        'next_url': next_url,
         'form': comment_form,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@versioned_condition(comments_versions)
+def post_comments(request, post_id):
+    """Следующий блок комментариев: HTML-фрагмент или JSON."""
+    get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    comments, next_url = comments_page(request, post_id)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'author': comment.author.username,
+                    'text': comment.text,
+                    'created': comment.created.isoformat(),
+                }
+                for comment in comments
+            ],
+            'next': next_url,
+        })
+    context = {
+        'comments': comments,
+        'next_url': next_url,
+    }
+    return render(request, 'includes/comment_list.html', context)
+
+
 @login_required
 def post_create(request):
-    form = PostForm(request.POST or None)
+    form = PostForm(
+        request.POST or None,
+        files=request.FILES or None,
+        user=request.user,
+    )
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        form.save_m2m()
         return redirect("posts:profile", username=request.user)
     context = {"form": form}
     return render(request, "posts/post_create.html", context)
@@ -80,8 +238,9 @@ def post_edit(request, post_id):
         return redirect("posts:post_detail", post_id)
     form = PostForm(
         request.POST or None,
-        # files=request.FILES or None,
-        instance=post
+        files=request.FILES or None,
+        instance=post,
+        user=request.user,
     )
     if form.is_valid():
         form.save()
@@ -94,6 +253,89 @@ def post_edit(request, post_id):
     return render(request, "posts/post_create.html", context)
 
 
+def upload_state(upload):
+    return {
+        'id': str(upload.pk),
+        'offset': upload.received,
+        'complete': upload.complete,
+    }
+
+
+def upload_error(detail, status=400):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+@login_required
+@require_POST
+def upload_start(request):
+    """Начинает загрузку картинки частями по имени и размеру файла."""
+    name = os.path.basename(request.POST.get('name', ''))[:255]
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        size = 0
+    if not name or size <= 0:
+        return upload_error('Укажите имя и размер файла')
+    if size > settings.UPLOAD_IMAGE_MAX_SIZE:
+        return upload_error('Файл больше {} МБ'.format(
+            settings.UPLOAD_IMAGE_MAX_SIZE // 2 ** 20
+        ), status=413)
+    upload = ImageUpload.objects.create(
+        user=request.user, name=name, size=size
+    )
+    return JsonResponse({
+        **upload_state(upload),
+        'url': reverse('posts:upload_chunk', args=[upload.pk]),
+        'chunk_size': settings.UPLOAD_CHUNK_SIZE,
+    }, status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'PUT'])
+def upload_chunk(request, upload_id):
+    """Сколько принято (GET) или очередной кусок файла (PUT).
+
+    Кусок — тело запроса с заголовком ``Content-Range: bytes
+    <первый>-<последний>/<размер>`` и пишется на диск по мере чтения.
+    Первый байт должен совпасть с уже принятым, иначе 409 с верным
+    offset — с него клиент и продолжает после обрыва.
+    """
+    upload = get_object_or_404(
+        ImageUpload, pk=upload_id, user=request.user
+    )
+    if request.method == 'GET':
+        return JsonResponse(upload_state(upload))
+    match = CONTENT_RANGE.match(request.META.get('HTTP_CONTENT_RANGE', ''))
+    if match is None:
+        return upload_error('Нужен заголовок Content-Range')
+    start, end, total = map(int, match.groups())
+    if total != upload.size or not start <= end < total:
+        return upload_error('Content-Range не сходится с размером файла')
+    if start != upload.received:
+        return JsonResponse(upload_state(upload), status=409)
+    written = uploads.append_chunk(upload, request, start, end - start + 1)
+    received = start + written
+    image_format = upload.format
+    if not image_format:
+        # Заголовок проверяется, пока не станут известны формат и размеры.
+        try:
+            check = uploads.check_part(
+                uploads.part_path(upload.pk), final=received == upload.size
+            )
+        except uploads.UploadRejected as error:
+            uploads.discard(upload)
+            return upload_error(str(error), status=415)
+        if check.size is not None:
+            image_format = check.format
+    updated = ImageUpload.objects.filter(
+        pk=upload.pk, received=start
+    ).update(received=received, format=image_format)
+    upload.refresh_from_db()
+    if not updated:
+        return JsonResponse(upload_state(upload), status=409)
+    return JsonResponse(upload_state(upload))
+
+
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
@@ -107,9 +349,17 @@ def add_comment(request, post_id):
 
 
 @login_required
+@versioned_condition(follow_versions)
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginator_func(request, posts, ORDERING_CONSTANT)
+    posts, popular = following_feed(request.user)
+    page_obj = paginator_func(
+        request,
+        posts,
+        ORDERING_CONSTANT,
+        MergedCursorPaginator,
+        ordering=TIMELINE_ORDERING,
+        extra=popular,
+    )
     context = {
         "page_obj": page_obj,
         "title": "Избранные посты",
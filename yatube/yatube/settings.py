@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -37,10 +39,41 @@ ALLOWED_HOSTS = [
 
 # Application definition
 
-CACHES = {
-    'default': {
+# Тесты (manage.py test или pytest) не делят общий кеш с сайтом.
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+
+# Общий для всех процессов кеш: Redis, если задан REDIS_URL
+# (нужен пакет django-redis), иначе файловый кеш во временном каталоге.
+# У тестов свой кеш в памяти процесса.
+if TESTING:
+    SHARED_CACHE = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'yatube-tests',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+elif os.environ.get('REDIS_URL'):
+    SHARED_CACHE = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+else:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'yatube_cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     }
+
+CACHES = {
+    # Перед общим кешем — небольшой LRU в памяти процесса.
+    'default': {
+        'BACKEND': 'core.cache.TieredCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 60,
+        },
+    },
+    'shared': SHARED_CACHE,
 }
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
@@ -50,6 +83,7 @@ INSTALLED_APPS = [
     'core.apps.CoreConfig',
     'users.apps.UsersConfig',
     'posts.apps.PostsConfig',
+    'api.apps.ApiConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -61,6 +95,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,13 +116,23 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Медиафайлы отдаёт core.media.serve, если MEDIA_URL не раздаёт фронтенд.
+# MEDIA_SENDFILE: 'x-accel-redirect' (nginx, внутренний location
+# MEDIA_ACCEL_PREFIX смотрит в MEDIA_ROOT), 'x-sendfile' (Apache,
+# lighttpd) или пусто — тело отдаёт Django через wsgi.file_wrapper.
+MEDIA_SENDFILE = os.getenv('MEDIA_SENDFILE') or None
+MEDIA_ACCEL_PREFIX = '/internal-media/'
+# Сколько секунд браузер хранит медиафайл без хеша в имени
+MEDIA_CACHE_MAX_AGE = 60 * 60
+
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Обычный DjangoTemplates, но время отрисовки идёт в метрики.
+        'BACKEND': 'core.metrics.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -98,6 +143,7 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 # Добавлен контекст-процессор
                 'core.context_processors.year.year',
+                'core.context_processors.events.events',
             ],
         },
     },
@@ -155,6 +201,84 @@ LOGIN_REDIRECT_URL = 'posts:index'
 
 # LOGOUT_REDIRECT_URL = 'posts:index'
 
+# Посты авторов с большим числом подписчиков не раскладываются по лентам,
+# а подмешиваются в ленту подписок при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+
+# Сколько последних постов автора попадает в ленту при подписке
+TIMELINE_BACKFILL = 100
+
+# Сколько дней хранится журнал изменений для синхронизации клиентов
+CHANGELOG_RETENTION_DAYS = 7
+# Записи журнала моложе этого, секунд, ещё могут обогнать транзакции
+# с меньшим id: курсор клиента за них не заходит
+CHANGELOG_SAFETY_LAG = 5
+
+# Адрес сервера событий (manage.py sse_server) за фронтендом, например
+# '/events/'; пусто — страницы не подписываются на новые посты
+EVENTS_URL = os.environ.get('EVENTS_URL', '')
+# Откуда сервер событий берёт новые посты и комментарии
+EVENTS_BACKEND = 'api.events.ChangeLogBackend'
+# Как часто сервер событий забирает новое, секунд
+EVENTS_POLL_INTERVAL = 0.5
+# Сколько последних событий помнится для переподключившихся клиентов
+EVENTS_BACKLOG = 1000
+# Сколько событий может ждать отправки одному клиенту
+EVENTS_QUEUE_SIZE = 100
+
+# Картинки постов принимаются потоком на диск с проверкой заголовка
+FILE_UPLOAD_HANDLERS = [
+    'posts.uploads.ImageUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# Поля форм, файлы которых принимает ImageUploadHandler
+UPLOAD_IMAGE_FIELDS = ('image',)
+UPLOAD_IMAGE_MAX_SIZE = 20 * 2 ** 20
+UPLOAD_IMAGE_MAX_PIXELS = 50 * 10 ** 6
+# Картинки больше по большей стороне уменьшаются при загрузке
+UPLOAD_IMAGE_MAX_SIDE = 2560
+UPLOAD_IMAGE_QUALITY = 85
+# Загрузка частями: размер куска, папка для частей (не внутри MEDIA_ROOT)
+# и сколько секунд хранится брошенная загрузка
+UPLOAD_CHUNK_SIZE = 2 ** 20
+UPLOAD_CHUNKS_DIR = os.path.join(BASE_DIR, 'uploads')
+UPLOAD_SESSION_TTL = 24 * 60 * 60
+
+# Картинки постов хранятся по хешу содержимого: хранилище самих файлов
+# (папка MEDIA_ROOT или объектное хранилище с тем же интерфейсом),
+# его параметры и сколько секунд файл без ссылок ждёт сборки мусора
+BLOB_STORAGE_BACKEND = 'django.core.files.storage.FileSystemStorage'
+BLOB_STORAGE_OPTIONS = {}
+BLOB_GRACE_PERIOD = 60 * 60
+
+# Размеры миниатюр, которые готовятся при сохранении картинки поста:
+# кадр geometry (по центру исходника), ширины вариантов для srcset, не
+# больше исходника (ширина geometry есть всегда), и атрибут sizes
+THUMBNAIL_ALIASES = {
+    'card': {
+        'geometry': '960x339',
+        'widths': (480, 960, 1440),
+        'sizes': '(min-width: 1200px) 960px, 100vw',
+    },
+}
+
+# Форматы вариантов от предпочтительного и параметры сохранения Pillow.
+# Готовятся те, что умеет сохранять установленный Pillow (AVIF — с
+# пакетом pillow-avif-plugin); JPEG нужен всегда, для <img>.
+THUMBNAIL_FORMATS = {
+    'AVIF': {'quality': 50},
+    'WEBP': {'quality': 75, 'method': 4},
+    'JPEG': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+# Потоки, в которых готовятся миниатюры; 0 — сразу после сохранения
+THUMBNAIL_WORKERS = 2
+
+# Метрики (/metrics/) видят сотрудники и сборщик с заголовком
+# «Authorization: Bearer <METRICS_TOKEN>»; пусто — только сотрудники
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 #  подключаем движок filebased.EmailBackend
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 
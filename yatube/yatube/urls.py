@@ -1,7 +1,6 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
 
 handler404 = 'core.views.page_not_found'
 handler403 = 'core.views.permission_denied'
@@ -12,6 +11,8 @@ handler500 = 'core.views.server_error'
 urlpatterns = [
     path("admin/", admin.site.urls),
     path('auth/', include('users.urls')),
+    path('', include('core.urls', namespace='core')),
+    path('api/v1/', include('api.urls', namespace='api')),
     path("", include("posts.urls", namespace='posts')),
     path('about/', include('about.urls', namespace='about')),
 ]
@@ -20,6 +21,3 @@ if settings.DEBUG:
     import debug_toolbar
 
     urlpatterns += (path('__debug__/', include(debug_toolbar.urls)),)
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-    )